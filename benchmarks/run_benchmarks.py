@@ -0,0 +1,235 @@
+"""
+Throughput benchmarks for wkb_to_geojson, wkb_to_wkt, wkb_to_abstract and geojson_to_wkb.
+
+Runs every entry point over synthetic geometry (LineString, Polygon, MultiPolygon and deeply nested
+GeometryCollection) for a range of vertex counts, dimensions and both byte orders, and reports MB/s of WKB and
+vertices/s for each case. Only the standard library is needed.
+
+	python benchmarks/run_benchmarks.py                                  # print a table
+	python benchmarks/run_benchmarks.py --output results.json            # also write the results as JSON
+	python benchmarks/run_benchmarks.py --save-baseline baseline.json    # store a baseline
+	python benchmarks/run_benchmarks.py --baseline baseline.json         # exit 1 if any case is slower than the baseline
+
+The regression gate compares vertices/s per case, and fails when a case drops below (1 - tolerance) times its
+baseline. Baselines are only meaningful on the machine which recorded them.
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from parse_wkb import geojson_to_wkb  # noqa: E402
+from parse_wkb import wkb_to_abstract  # noqa: E402
+from parse_wkb import wkb_to_geojson  # noqa: E402
+from parse_wkb import wkb_to_wkt  # noqa: E402
+from parse_wkb import wkb_transcode  # noqa: E402
+
+DEFAULT_SIZES = (10, 1_000, 100_000)
+FULL_SIZES = (10, 1_000, 100_000, 1_000_000)
+COLLECTION_DEPTH = 64
+
+
+def make_coordinates(generator: random.Random, count: int, dimensions: int, closed: bool = False) -> List[List[float]]:
+	points = [[generator.uniform(-180, 180) for _ in range(dimensions)] for _ in range(count)]
+	if closed and points:
+		points[-1] = list(points[0])
+	return points
+
+
+def make_linestring(generator: random.Random, vertices: int, dimensions: int) -> dict:
+	return {"type": "LineString", "coordinates": make_coordinates(generator, max(vertices, 2), dimensions)}
+
+
+def make_polygon(generator: random.Random, vertices: int, dimensions: int) -> dict:
+	return {"type": "Polygon", "coordinates": [make_coordinates(generator, max(vertices, 4), dimensions, True)]}
+
+
+def make_multipolygon(generator: random.Random, vertices: int, dimensions: int) -> dict:
+	parts = max(1, vertices // 1000)
+	return {"type": "MultiPolygon", "coordinates": [
+		make_polygon(generator, vertices // parts, dimensions)["coordinates"] for _ in range(parts)
+	]}
+
+
+def make_collection(generator: random.Random, vertices: int, dimensions: int) -> dict:
+	# COLLECTION_DEPTH nested collections, each holding a Point and the next collection, with a LineString at the bottom
+	geometry = make_linestring(generator, vertices - COLLECTION_DEPTH, dimensions)
+	for _ in range(COLLECTION_DEPTH):
+		point = {"type": "Point", "coordinates": make_coordinates(generator, 1, dimensions)[0]}
+		geometry = {"type": "GeometryCollection", "geometries": [point, geometry]}
+	return geometry
+
+
+MapShapeMaker: Dict[str, Callable[[random.Random, int, int], dict]] = {
+	"linestring": make_linestring,
+	"polygon": make_polygon,
+	"multipolygon": make_multipolygon,
+	"collection": make_collection,
+}
+
+
+# levels of lists between "coordinates" and the points
+MapTypeDepth: Dict[str, int] = {
+	"Point": 0,
+	"LineString": 1,
+	"MultiPoint": 1,
+	"Polygon": 2,
+	"MultiLineString": 2,
+	"MultiPolygon": 3,
+}
+
+
+def count_vertices(geojson: dict) -> int:
+	if geojson["type"] == "GeometryCollection":
+		return sum(count_vertices(member) for member in geojson["geometries"])
+	items = [geojson["coordinates"]]
+	for _ in range(MapTypeDepth[geojson["type"]]):
+		items = [item for sub_items in items for item in sub_items]
+	return len(items)
+
+
+def best_time(function: Callable, argument, budget: float, repeat: int) -> float:
+	# best of at least `repeat` runs, stopping early once `budget` seconds have been spent (after at least one run)
+	best = float("inf")
+	spent = 0.0
+	gc_was_enabled = gc.isenabled()
+	gc.disable()
+	try:
+		for _ in range(repeat):
+			start = time.perf_counter()
+			function(argument)
+			elapsed = time.perf_counter() - start
+			best = min(best, elapsed)
+			spent += elapsed
+			if spent > budget:
+				break
+	finally:
+		if gc_was_enabled:
+			gc.enable()
+	return best
+
+
+def run_case(name: str, function: Callable, argument, wkb_size: int, vertices: int, budget: float, repeat: int) -> dict:
+	try:
+		seconds = best_time(function, argument, budget, repeat)
+	except Exception as error:
+		return {"function": name, "skipped": str(error)}
+	return {
+		"function": name,
+		"seconds": seconds,
+		"mb_per_second": wkb_size / seconds / 1e6,
+		"vertices_per_second": vertices / seconds,
+	}
+
+
+def run(sizes: Tuple[int, ...], shapes: List[str], dimension_counts: List[int], byte_orders: List[str], budget: float, repeat: int, seed: int) -> List[dict]:
+	results = []
+	for shape in shapes:
+		for vertices in sizes:
+			for dimension_count in dimension_counts:
+				geojson = MapShapeMaker[shape](random.Random(seed), vertices, min(dimension_count, 3))
+				actual_vertices = count_vertices(geojson)
+				base_wkb = geojson_to_wkb(geojson)
+				for byte_order in byte_orders:
+					wkb = wkb_transcode(base_wkb, byte_order=byte_order, dimensions=dimension_count)
+					case = {
+						"shape": shape,
+						"vertices": actual_vertices,
+						"dimensions": dimension_count,
+						"byte_order": byte_order,
+						"wkb_bytes": len(wkb),
+					}
+					timings = [
+						run_case("wkb_to_geojson", wkb_to_geojson, wkb, len(wkb), actual_vertices, budget, repeat),
+						run_case("wkb_to_wkt", wkb_to_wkt, wkb, len(wkb), actual_vertices, budget, repeat),
+						run_case("wkb_to_abstract", wkb_to_abstract, wkb, len(wkb), actual_vertices, budget, repeat),
+					]
+					if dimension_count < 4:
+						# GeoJSON has no M, so geojson_to_wkb is timed on the XY and XYZ geometry it can produce
+						timings.append(run_case("geojson_to_wkb", geojson_to_wkb, geojson, len(base_wkb), actual_vertices, budget, repeat))
+					for timing in timings:
+						results.append({**case, **timing})
+	return results
+
+
+def case_key(result: dict) -> str:
+	return f"{result['function']} {result['shape']} {result['vertices']} {result['dimensions']}d {result['byte_order']}"
+
+
+def print_table(results: List[dict], file=sys.stdout) -> None:
+	print(f"{'case':<52} {'MB/s':>10} {'vertices/s':>14}", file=file)
+	for result in results:
+		if "skipped" in result:
+			print(f"{case_key(result):<52} {'skipped: ' + result['skipped'][:60]}", file=file)
+		else:
+			print(f"{case_key(result):<52} {result['mb_per_second']:>10.2f} {result['vertices_per_second']:>14,.0f}", file=file)
+
+
+def check_regressions(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+	baseline_by_key = {case_key(result): result for result in baseline if "skipped" not in result}
+	failures = []
+	for result in results:
+		reference = baseline_by_key.get(case_key(result))
+		if reference is None or "skipped" in result:
+			continue
+		if result["vertices_per_second"] < (1 - tolerance) * reference["vertices_per_second"]:
+			failures.append(
+				f"{case_key(result)}: {result['vertices_per_second']:,.0f} vertices/s "
+				f"is more than {tolerance:.0%} below the baseline of {reference['vertices_per_second']:,.0f}"
+			)
+	return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="Throughput benchmarks for parse_wkb")
+	parser.add_argument("--sizes", type=int, nargs="+", default=None, help=f"vertex counts (default {' '.join(map(str, DEFAULT_SIZES))})")
+	parser.add_argument("--full", action="store_true", help=f"use vertex counts {' '.join(map(str, FULL_SIZES))}")
+	parser.add_argument("--shapes", nargs="+", default=list(MapShapeMaker), choices=list(MapShapeMaker))
+	parser.add_argument("--dimensions", type=int, nargs="+", default=[2, 3, 4], choices=[2, 3, 4])
+	parser.add_argument("--byte-orders", nargs="+", default=["<", ">"], choices=["<", ">"])
+	parser.add_argument("--budget", type=float, default=1.0, help="seconds to spend on each case (at least one run is always made)")
+	parser.add_argument("--repeat", type=int, default=5, help="maximum runs per case; the best is kept")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+	parser.add_argument("--save-baseline", type=Path, help="write the results to this JSON file for later use with --baseline")
+	parser.add_argument("--baseline", type=Path, help="fail if any case is slower than in this JSON file")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="fraction of baseline throughput which may be lost before failing (default 0.25)")
+	args = parser.parse_args(argv)
+
+	sizes = tuple(args.sizes) if args.sizes else FULL_SIZES if args.full else DEFAULT_SIZES
+	results = run(sizes, args.shapes, args.dimensions, args.byte_orders, args.budget, args.repeat, args.seed)
+	print_table(results)
+
+	document = {
+		"python": platform.python_version(),
+		"implementation": platform.python_implementation(),
+		"machine": platform.machine(),
+		"results": results,
+	}
+	for path in (args.output, args.save_baseline):
+		if path is not None:
+			path.write_text(json.dumps(document, indent=1))
+
+	if args.baseline is not None:
+		failures = check_regressions(results, json.loads(args.baseline.read_text())["results"], args.tolerance)
+		for failure in failures:
+			print(f"REGRESSION {failure}", file=sys.stderr)
+		if failures:
+			return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Builds the optional compiled core (src/parse_wkb/_speedups.c) when a wheel is built or the package is installed.
+
+If there is no C compiler (or the build fails for any other reason) the package is installed without it, and the
+pure python readers are used. Set PARSE_WKB_PURE_PYTHON to a non empty value to skip the build.
+"""
+import os
+from pathlib import Path
+import sysconfig
+import warnings
+
+from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+
+
+class CustomBuildHook(BuildHookInterface):
+
+	def initialize(self, version, build_data):
+		if os.environ.get("PARSE_WKB_PURE_PYTHON"):
+			return
+		try:
+			extension_path = self.build_extension()
+		except Exception as error:
+			warnings.warn(f"Could not build the optional parse_wkb._speedups extension, the pure python readers will be used. {error}")
+			return
+		if version != "editable":
+			# editable installs import the extension from where it was built, next to the sources
+			build_data["force_include"][str(extension_path)] = f"parse_wkb/{extension_path.name}"
+		build_data["pure_python"] = False
+		build_data["infer_tag"] = True
+
+	def build_extension(self) -> Path:
+		from setuptools import Distribution
+		from setuptools import Extension
+		from setuptools.command.build_ext import build_ext
+
+		package = Path(self.root) / "src" / "parse_wkb"
+		distribution = Distribution({
+			"name": "parse_wkb",
+			"ext_modules": [Extension("parse_wkb._speedups", [str(package / "_speedups.c")])],
+		})
+		command = build_ext(distribution)
+		command.build_lib = str(package.parent)
+		command.build_temp = str(Path(self.root) / "build" / "temp")
+		command.ensure_finalized()
+		command.run()
+		return package / f"_speedups{sysconfig.get_config_var('EXT_SUFFIX')}"
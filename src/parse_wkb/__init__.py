@@ -1,4 +1,50 @@
 from ._impl.geojson_to_wkb import geojson_to_wkb
+from ._impl.geojson_to_wkb import geojson_to_wkb_many
+from ._impl.geojson_to_wkb import geojson_to_wkb_into
+from ._impl.geojson_to_wkb import geojson_wkb_size
 from ._impl.wkb_to_geojson import wkb_to_geojson
+from ._impl.wkb_to_geojson import wkb_to_geojson_many
+from ._impl.wkb_to_geojson_str import wkb_to_geojson_str
+from ._impl.wkb_to_geojson_str import wkb_to_geojson_bytes
+from ._impl.wkb_to_geojson_str import wkb_to_geojson_str_many
+from ._impl.wkb_to_geojson_str import wkb_to_geojson_stream
 from ._impl.wkb_to_wkt import wkb_to_wkt
-from ._impl.wkb_to_abstract import wkb_to_abstract
\ No newline at end of file
+from ._impl.wkb_to_wkt import wkb_to_wkt_many
+from ._impl.wkb_to_abstract import wkb_to_abstract
+from ._impl.wkb_to_abstract import wkb_to_abstract_many
+from ._impl.wkb_stream import iter_wkb
+from ._impl.wkt_to_wkb import wkt_to_wkb
+from ._impl.wkt_to_wkb import wkt_to_geojson
+from ._impl.wkb_transcode import wkb_transcode
+from ._impl.wkb_to_geoarrow import GeoArrowArray
+from ._impl.wkb_to_geoarrow import wkb_to_geoarrow
+from ._impl.wkb_geometry import WKBGeometry
+from ._impl.wkb_bounds import wkb_bounds
+from ._impl.wkb_bounds import wkb_bounds_many
+from ._impl.speedups import get_backend
+from ._impl.speedups import set_backend
+from ._impl.wkb_walker import WKBBuilder
+from ._impl.wkb_walker import walk_wkb
+from ._impl.wkb_walker import walk_wkb_many
+from ._impl.wkb_walker import get_limits
+from ._impl.wkb_walker import set_limits
+from ._impl.wkb_validate import WKBProblem
+from ._impl.wkb_validate import WKBValidation
+from ._impl.wkb_validate import wkb_validate
+from ._impl.wkb_validate import wkb_validate_many
+from ._impl.decode_cache import CacheStats
+from ._impl.decode_cache import DecodeCache
+from ._impl.wkb_stats import GeometryRecord
+from ._impl.wkb_stats import TypeStats
+from ._impl.wkb_stats import WKBStats
+from ._impl.wkb_stats import collect_stats
+from ._impl.packed_rtree import PackedRTree
+from ._impl.twkb import geojson_to_twkb
+from ._impl.twkb import wkb_to_twkb
+from ._impl.twkb import twkb_to_geojson
+from ._impl.twkb import twkb_to_wkb
+from ._impl.geoarrow_to_wkb import geoarrow_to_wkb
+from ._impl.geoarrow_to_wkb import geoarrow_to_wkb_buffer
+from ._impl.geojson_stream import iter_geojson
+from ._impl.geojson_stream import geojson_to_wkb_stream
+from ._impl.geojson_stream import geojson_to_wkb_file
\ No newline at end of file
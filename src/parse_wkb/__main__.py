@@ -0,0 +1,9 @@
+import sys
+
+from ._impl.profile_wkb import main
+
+# python -m parse_wkb profile FILE [options], see parse_wkb/_impl/profile_wkb.py
+if len(sys.argv) < 2 or sys.argv[1] != "profile":
+	print("usage: python -m parse_wkb profile FILE [--framing raw|length_prefixed] [--operations ...] [--json]", file=sys.stderr)
+	sys.exit(2)
+sys.exit(main(sys.argv[2:]))
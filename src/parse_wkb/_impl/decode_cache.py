@@ -0,0 +1,196 @@
+from __future__ import annotations
+from collections import OrderedDict
+import marshal
+import pickle
+from threading import Lock
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from .geojson_to_wkb import Flavor
+from .geojson_to_wkb import geojson_to_wkb
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_to_geojson import Geometry
+from .wkb_to_geojson import wkb_to_geojson
+from .wkb_to_wkt import wkb_to_wkt
+
+# An opt-in cache of conversions, for servers which convert the same geometry over and over.
+# Entries live in a dict keyed on the input bytes themselves (the WKB, or for geojson_to_wkb the marshal dump of the
+# dict) together with the conversion and its options. Looking one up costs a SipHash of the input, which runs at
+# several GB/s, plus one memcmp against the entry found, so a hash collision can never return the wrong geometry.
+# The dict is an OrderedDict in least recently used order, and the oldest entries are dropped once the total size of
+# the cached inputs and results passes `max_bytes`. Text and WKB count their length. GeoJSON dicts are not measured
+# (which would cost about as much as building them), but charged GEOJSON_BYTES_PER_WKB_BYTE times the size of the
+# WKB, which is about what the lists and floats of 2D coordinates take.
+#
+# GeoJSON dicts are mutable, so a cached dict is never handed out as is. The cache holds a frozen copy, and
+#   results="copy"    every call returns a fresh copy of its lists and dicts (the floats and strings are shared)
+#   results="frozen"  every call returns the same read-only FrozenDict, with tuples in place of lists
+#
+# One lock guards the entries and counters. Conversions run outside it, so threads converting different geometry do
+# not wait for each other; two threads missing on the same input both convert it, and the first result is kept.
+
+ResultMode = str  # Literal["copy", "frozen"]
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+GEOJSON_BYTES_PER_WKB_BYTE = 8
+
+
+class CacheStats(NamedTuple):
+	hits: int
+	misses: int
+	evictions: int
+	entries: int
+	size: int  # bytes charged for the entries, see GEOJSON_BYTES_PER_WKB_BYTE
+
+
+class FrozenDict(dict):
+	"""A dict which cannot be changed, as returned by DecodeCache(results="frozen")"""
+	__slots__ = ()
+
+	def read_only(self, *args, **kwargs):
+		raise TypeError("cached GeoJSON is read only. Use DecodeCache(results='copy') to get copies which can be changed")
+
+	__setitem__ = __delitem__ = __ior__ = read_only
+	clear = pop = popitem = setdefault = update = read_only
+
+	def __reduce__(self):
+		return FrozenDict, (dict(self),)
+
+
+def freeze(value: Any) -> Any:
+	# dicts as FrozenDict and lists as tuples, all the way down
+	if isinstance(value, dict):
+		return FrozenDict({key: freeze(item) for key, item in value.items()})
+	if isinstance(value, (list, tuple)):
+		if value and isinstance(value[0], (list, tuple, dict)):
+			return tuple(map(freeze, value))
+		return tuple(value)
+	return value
+
+
+def thaw(value: Any) -> Any:
+	# A copy with new dicts and lists, sharing the floats and strings (which cannot be changed).
+	# Runs of points are copied with one map over the run, which is most of the work
+	if isinstance(value, dict):
+		return {key: thaw(item) for key, item in value.items()}
+	if isinstance(value, (list, tuple)):
+		if value:
+			first = value[0]
+			if isinstance(first, (list, tuple)):
+				if first and not isinstance(first[0], (list, tuple, dict)):
+					return list(map(list, value))
+				return list(map(thaw, value))
+			if isinstance(first, dict):
+				return list(map(thaw, value))
+		return list(value)
+	return value
+
+
+def input_key(view: memoryview) -> bytes:
+	# the bytes of the input, without a copy if they already are a bytes object
+	source = view.obj
+	if type(source) is bytes and len(source) == len(view):
+		return source
+	return bytes(view)
+
+
+def geojson_key(geojson: Dict) -> bytes:
+	# marshal writes floats as 8 raw bytes and is several times faster than encoding WKB. It refuses dict subclasses
+	# (eg. FrozenDict), which are pickled instead
+	try:
+		return marshal.dumps(geojson)
+	except ValueError:
+		return pickle.dumps(geojson, pickle.HIGHEST_PROTOCOL)
+
+
+class DecodeCache:
+	"""
+	A thread-safe, size-bounded LRU cache around wkb_to_geojson(), wkb_to_wkt() and geojson_to_wkb().
+
+		cache = DecodeCache(max_bytes=64 * 1024 * 1024, results="frozen")
+		geojson = cache.wkb_to_geojson(wkb)
+
+	`results="copy"` (the default) returns a fresh copy of cached GeoJSON on every call, which callers may change.
+	`results="frozen"` returns the cached GeoJSON itself as a read-only FrozenDict holding tuples, which is cheaper.
+	Warnings (eg. "WKB data not fully parsed") are only given when a result is first converted.
+	"""
+
+	def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES, results: ResultMode = "copy"):
+		if results not in ("copy", "frozen"):
+			raise Exception(f"Unknown results {results!r}. Expected 'copy' or 'frozen'")
+		if max_bytes < 0:
+			raise Exception(f"max_bytes must be at least 0, got {max_bytes}")
+		self.max_bytes = max_bytes
+		self.results = results
+		self.lock = Lock()
+		self.entries: OrderedDict[Hashable, Tuple[Any, int]] = OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key: Hashable, convert: Callable[[], Any], size: int) -> Any:
+		# The cached result for `key`, or else the result of `convert()`, which is cached.
+		# `size` is what the input is charged against max_bytes. The result is charged its length, if it has one
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None:
+				self.entries.move_to_end(key)
+				self.hits += 1
+			else:
+				self.misses += 1
+		if entry is not None:
+			return entry[0]
+		value = convert()
+		if isinstance(value, (str, bytes)):
+			size += len(value)
+		if size <= self.max_bytes:
+			with self.lock:
+				if key not in self.entries:
+					self.entries[key] = (value, size)
+					self.size += size
+					while self.size > self.max_bytes:
+						_, (_, evicted_size) = self.entries.popitem(last=False)
+						self.size -= evicted_size
+						self.evictions += 1
+		return value
+
+	def wkb_to_geojson(self, wkb: WKBBuffer) -> Geometry:
+		"""wkb_to_geojson(wkb), from the cache if the same WKB has been converted before"""
+		with as_memoryview(wkb) as view:
+			key = input_key(view)
+		value = self.get(("geojson", key), lambda: freeze(wkb_to_geojson(key)), len(key) * (1 + GEOJSON_BYTES_PER_WKB_BYTE))
+		return thaw(value) if self.results == "copy" else value
+
+	def wkb_to_wkt(self, wkb: WKBBuffer, precision: Optional[int] = None, trim: bool = False) -> str:
+		"""wkb_to_wkt(wkb, precision, trim), from the cache if the same WKB has been converted with the same options before"""
+		with as_memoryview(wkb) as view:
+			key = input_key(view)
+		return self.get(("wkt", precision, trim, key), lambda: wkb_to_wkt(key, precision, trim), len(key))
+
+	def geojson_to_wkb(self, geojson: Dict, flavor: Flavor = "iso", srid: Optional[int] = None) -> bytes:
+		"""geojson_to_wkb(geojson, flavor, srid), from the cache if equal GeoJSON has been converted with the same options before"""
+		key = geojson_key(geojson)
+		return self.get(("wkb", flavor, srid, key), lambda: geojson_to_wkb(geojson, flavor, srid), len(key))
+
+	def stats(self) -> CacheStats:
+		with self.lock:
+			return CacheStats(self.hits, self.misses, self.evictions, len(self.entries), self.size)
+
+	def clear(self) -> None:
+		"""Drops every entry. The counters are kept"""
+		with self.lock:
+			self.entries.clear()
+			self.size = 0
+
+	def __len__(self) -> int:
+		return len(self.entries)
+
+	def __repr__(self) -> str:
+		return f"<DecodeCache {len(self.entries)} entries, {self.size} of {self.max_bytes} bytes, results={self.results!r}>"
@@ -0,0 +1,219 @@
+from __future__ import annotations
+from array import array
+from itertools import islice
+from operator import gt
+from struct import Struct
+import sys
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+from .geojson_to_wkb import Flavor
+from .parallel import Offsets
+from .wkb_reader import EWKB_SRID_FLAG
+from .wkb_to_geoarrow import MapDimensionNames
+from .wkb_transcode import MapDimensionNamesEWKBFlags
+from .wkb_transcode import MapDimensionNamesTypeOffset
+from .wkb_walker import MapGeometryTypeName
+
+# Encodes WKB from the GeoArrow "native" columnar layout read by wkb_to_geoarrow: a flat buffer of interleaved
+# coordinates plus one array of offsets per level of nesting, outermost first (see wkb_to_geoarrow.py).
+#
+# The WKB is written in the native byte order of the machine, which is the byte order of the coordinate buffer, so
+# every run of coordinates is copied into the output as one slice of bytes. The only Python objects created are the
+# offsets (one int per geometry, part and ring) and the headers and counts packed for each of them.
+#
+# All rows are written into one bytearray. geoarrow_to_wkb_buffer() returns it with an array("Q") of row offsets
+# (the layout of parallel.pack_chunk), and geoarrow_to_wkb() cuts it into one bytes object per row.
+
+GeometryType = Union[str, int]  # GeoArrow extension name (eg. "geoarrow.multipolygon") or WKB type number 1 to 6
+Dimensions = str  # Literal["xy", "xyz", "xym", "xyzm"]
+
+ByteOrderByte = 1 if sys.byteorder == "little" else 0
+NativeDoubleFormats = ("d", "@d", "=d", "<d" if sys.byteorder == "little" else ">d", "B")  # memoryview formats accepted for coordinates
+UInt32Encoder = Struct("=I")
+HeaderEncoder = Struct("=BI")
+HeaderWithSRIDEncoder = Struct("=BII")
+
+# GeoArrow extension name: WKB type number
+MapGeoArrowTypeKey: Dict[str, int] = {
+	f"geoarrow.{type_name.lower()}": type_key
+	for type_key, type_name in MapGeometryTypeName.items()
+	if type_key != 7
+}
+
+# Levels of offsets in the GeoArrow layout of each WKB type number
+MapTypeKeyDepth: Dict[int, int] = {
+	1: 0,
+	2: 1,
+	3: 2,
+	4: 1,
+	5: 2,
+	6: 3,
+}
+
+# dimensions: dimension_key
+MapDimensionsKey: Dict[Dimensions, int] = {names: key for key, names in MapDimensionNames.items()}
+
+
+def geometry_header(type_key: int, dimensions: Dimensions, flavor: Flavor, srid: Optional[int]) -> bytes:
+	# the byte order and geometry type (and EWKB SRID) of a geometry
+	names = dimensions.upper()
+	if flavor == "iso":
+		if srid is not None:
+			raise Exception("An SRID can only be written with flavor='extended'")
+		return HeaderEncoder.pack(ByteOrderByte, type_key + MapDimensionNamesTypeOffset[names])
+	if flavor != "extended":
+		raise Exception(f"Invalid flavor {flavor!r}. Expected 'iso' or 'extended'")
+	if srid is None:
+		return HeaderEncoder.pack(ByteOrderByte, type_key | MapDimensionNamesEWKBFlags[names])
+	return HeaderWithSRIDEncoder.pack(ByteOrderByte, type_key | MapDimensionNamesEWKBFlags[names] | EWKB_SRID_FLAG, srid)
+
+
+def as_bytes_view(coordinates) -> memoryview:
+	# the coordinate buffer as bytes, without a copy
+	view = memoryview(coordinates)
+	if view.format not in NativeDoubleFormats:
+		raise Exception(f"Coordinates must be a buffer of native doubles (eg. array('d')), got format {view.format!r}")
+	if not view.c_contiguous:
+		raise Exception("Coordinates must be a contiguous buffer")
+	return view.cast("B")
+
+
+def as_offsets(level) -> List[int]:
+	# one level of offsets as a list of ints. Buffers (array("I"), numpy arrays) are converted in one go
+	try:
+		return memoryview(level).tolist()
+	except TypeError:
+		return list(level)
+
+
+def write_Points(out: bytearray, view: memoryview, start: int, end: int, point_size: int, header: bytes) -> None:
+	# points start to end, each as a Point geometry
+	for position in range(start * point_size, end * point_size, point_size):
+		out += header
+		out += view[position:position + point_size]
+
+
+def write_Run(out: bytearray, view: memoryview, start: int, end: int, point_size: int) -> None:
+	# points start to end as a count and a run of coordinates
+	out += UInt32Encoder.pack(end - start)
+	out += view[start * point_size:end * point_size]
+
+
+def write_Rings(out: bytearray, view: memoryview, rings: List[int], start: int, end: int, point_size: int) -> None:
+	# rings start to end as a count and a run of coordinates for each
+	out += UInt32Encoder.pack(end - start)
+	for ring in range(start, end):
+		out += UInt32Encoder.pack(rings[ring + 1] - rings[ring])
+		out += view[rings[ring] * point_size:rings[ring + 1] * point_size]
+
+
+def write_WKB(type_key: int, dimensions: Dimensions, view: memoryview, levels: List[List[int]], flavor: Flavor, srid: Optional[int]) -> Tuple[bytearray, Offsets]:
+	point_size = 8 * len(dimensions)
+	if len(view) % point_size:
+		raise Exception(f"Coordinates of {len(view)} bytes do not hold a whole number of {dimensions} points")
+	num_points = len(view) // point_size
+	# each level of offsets must start at 0 or more, never decrease, and end within the level below it (the innermost
+	# within the coordinates)
+	for level, (items, below) in enumerate(zip(levels, levels[1:] + [range(num_points + 1)])):
+		if not items or items[-1] > len(below) - 1:
+			raise Exception(f"Offsets level {level} must end at most at {len(below) - 1}, the number of items in the level below")
+		if items[0] < 0:
+			raise Exception(f"Offsets level {level} must start at 0 or more, got {items[0]}")
+		if any(map(gt, items, islice(items, 1, None))):
+			raise Exception(f"Offsets level {level} must not decrease")
+	header = geometry_header(type_key, dimensions, flavor, srid)
+	member_header = geometry_header(type_key - 3, dimensions, flavor, None) if type_key > 3 else b""
+	out = bytearray()
+	row_offsets = array("Q", [0])
+	row_end = row_offsets.append
+	if type_key == 1:
+		for position in range(0, num_points * point_size, point_size):
+			out += header
+			out += view[position:position + point_size]
+			row_end(len(out))
+		return out, row_offsets
+	geometries = levels[0]
+	for row in range(len(geometries) - 1):
+		start = geometries[row]
+		end = geometries[row + 1]
+		out += header
+		if type_key == 2:
+			write_Run(out, view, start, end, point_size)
+		elif type_key == 3:
+			write_Rings(out, view, levels[1], start, end, point_size)
+		elif type_key == 4:
+			out += UInt32Encoder.pack(end - start)
+			write_Points(out, view, start, end, point_size, member_header)
+		elif type_key == 5:
+			lines = levels[1]
+			out += UInt32Encoder.pack(end - start)
+			for line in range(start, end):
+				out += member_header
+				write_Run(out, view, lines[line], lines[line + 1], point_size)
+		else:
+			polygons = levels[1]
+			out += UInt32Encoder.pack(end - start)
+			for polygon in range(start, end):
+				out += member_header
+				write_Rings(out, view, levels[2], polygons[polygon], polygons[polygon + 1], point_size)
+		row_end(len(out))
+	return out, row_offsets
+
+
+def encode_GeoArrow(geometry_type: GeometryType, dimensions: Dimensions, coordinates, offsets: Sequence[Sequence[int]], flavor: Flavor, srid: Optional[int]) -> Tuple[bytearray, Offsets]:
+	type_key = MapGeoArrowTypeKey.get(geometry_type) if isinstance(geometry_type, str) else geometry_type
+	if type_key not in MapTypeKeyDepth:
+		raise Exception(f"Unknown geometry type {geometry_type!r}. Expected a GeoArrow name such as 'geoarrow.polygon', or a WKB type number from 1 to 6")
+	dimensions = dimensions.lower()
+	if dimensions not in MapDimensionsKey:
+		raise Exception(f"Unknown dimensions {dimensions!r}. Expected 'xy', 'xyz', 'xym' or 'xyzm'")
+	if len(offsets) != MapTypeKeyDepth[type_key]:
+		raise Exception(f"{MapGeometryTypeName[type_key]} takes {MapTypeKeyDepth[type_key]} levels of offsets, got {len(offsets)}")
+	with as_bytes_view(coordinates) as view:
+		return write_WKB(type_key, dimensions, view, [as_offsets(level) for level in offsets], flavor, srid)
+
+
+def geoarrow_to_wkb_buffer(
+	geometry_type: GeometryType,
+	dimensions: Dimensions,
+	coordinates,
+	offsets: Sequence[Sequence[int]] = (),
+	flavor: Flavor = "iso",
+	srid: Optional[int] = None,
+) -> Tuple[bytes, Offsets]:
+	"""
+	Same as geoarrow_to_wkb(), but returns the WKB of every row concatenated into one bytes object, together with an
+	array("Q") of byte offsets one longer than the number of rows: row i is buffer[offsets[i]:offsets[i + 1]].
+	"""
+	out, row_offsets = encode_GeoArrow(geometry_type, dimensions, coordinates, offsets, flavor, srid)
+	return bytes(out), row_offsets
+
+
+def geoarrow_to_wkb(
+	geometry_type: GeometryType,
+	dimensions: Dimensions,
+	coordinates,
+	offsets: Sequence[Sequence[int]] = (),
+	flavor: Flavor = "iso",
+	srid: Optional[int] = None,
+) -> List[bytes]:
+	"""
+	Encodes one WKB blob per geometry from the columnar GeoArrow layout returned by wkb_to_geoarrow(), so
+	geoarrow_to_wkb(*wkb_to_geoarrow(wkbs)) gives the WKB back:
+
+	- `geometry_type` is a GeoArrow name (eg. "geoarrow.multipolygon") or a WKB type number from 1 to 6
+	- `dimensions` is "xy", "xyz", "xym" or "xyzm"
+	- `coordinates` is any buffer of interleaved native doubles: array("d"), a numpy float64 array, a memoryview, ...
+	- `offsets` holds one sequence (array("I"), numpy array, list, ...) per level of nesting, outermost first
+
+	The WKB is written in the byte order of the machine, with runs of coordinates copied from the buffer as bytes.
+	flavor="extended" writes PostGIS EWKB, with `srid` in the header of every row.
+	"""
+	out, row_offsets = encode_GeoArrow(geometry_type, dimensions, coordinates, offsets, flavor, srid)
+	with memoryview(out) as view:
+		return [bytes(view[row_offsets[row]:row_offsets[row + 1]]) for row in range(len(row_offsets) - 1)]
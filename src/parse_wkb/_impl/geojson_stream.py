@@ -0,0 +1,296 @@
+from __future__ import annotations
+from codecs import IncrementalDecoder
+from codecs import getincrementaldecoder
+from functools import partial
+import json
+import re
+from typing import BinaryIO
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import TextIO
+from typing import Tuple
+from typing import Union
+import warnings
+
+from .geojson_to_wkb import Flavor
+from .geojson_to_wkb import geojson_to_wkb
+from .parallel import ChunkWarnings
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import Offsets
+from .parallel import RowErrors
+from .parallel import chunk_warnings_of
+from .parallel import pack_chunk
+from .parallel import parallel_map
+from .parallel import unpack_encoded_chunk
+from .wkb_stream import DEFAULT_READ_SIZE
+from .wkb_stream import LengthPrefixParser
+from .wkb_walker import with_settings
+
+# Reads GeoJSON features one at a time from a file object, so that a FeatureCollection of many GB is never held in
+# memory (or parsed by json.load) as a whole. Memory use is bounded by the read size plus the largest feature.
+#
+# framing="ndjson" reads newline delimited GeoJSON: one Feature (or bare geometry) per line.
+# framing="feature_collection" reads a single FeatureCollection. Members other than "features" are parsed with
+#   JSONDecoder.raw_decode and dropped. Within the "features" array, the end of each feature is found by matching
+#   braces outside of strings (ObjectToken), which skips over the coordinates without parsing them.
+#
+# Either way, each feature is first cut out as text and only then parsed with json.loads. With parallel=True the
+# text is what crosses the process boundary: pickling the parsed dicts to the workers costs more than parsing them,
+# so the workers do both the parsing and the encoding, and send back the properties and the WKB packed in one buffer.
+
+Framing = str  # Literal["feature_collection", "ndjson"]
+GeoJSONSource = Union[BinaryIO, TextIO]
+FeatureText = Union[str, bytes]
+
+# text up to and including the next brace outside of a string, with any whole strings on the way. Ending in a quote
+# instead means a string runs past the end of the text read so far. Matching the text between braces rather than one
+# token at a time makes the scan about 2.5 times faster
+ObjectToken = re.compile(r'[^{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}"]*)*[{}"]')
+NonWhitespace = re.compile(r"[^ \t\n\r]")
+INCOMPLETE_TAIL = 16  # a decode error this close to the end of the text read may be a value cut short by the read
+
+
+class TextReader:
+	# The unread part of a JSON document, read from a text or binary file object as needed
+	__slots__ = ("source", "read_size", "decoder", "utf8", "text", "offset", "position", "end_of_stream")
+
+	def __init__(self, source: GeoJSONSource, read_size: int):
+		self.source = source
+		self.read_size = read_size
+		self.decoder = json.JSONDecoder()
+		self.utf8: Optional[IncrementalDecoder] = None  # once the source turns out to be binary
+		self.text = ""
+		self.offset = 0
+		self.position = 0  # position of text[0] within the document, for error messages
+		self.end_of_stream = False
+
+	def fill(self) -> bool:
+		# drops the text already read and reads at least as much again as is left, so that a value spanning many reads
+		# is decoded a bounded number of times. Returns False at the end of the stream
+		if self.end_of_stream:
+			return False
+		self.position += self.offset
+		self.text = self.text[self.offset:]
+		self.offset = 0
+		chunk = self.source.read(max(self.read_size, len(self.text)))
+		if not chunk:
+			self.end_of_stream = True
+		if not isinstance(chunk, str):
+			if self.utf8 is None:
+				self.utf8 = getincrementaldecoder("utf-8-sig")()
+			chunk = self.utf8.decode(chunk, not chunk)
+		self.text += chunk
+		return True
+
+	def peek(self) -> str:
+		# moves to the next character which is not whitespace and returns it, or "" at the end of the stream
+		while True:
+			match = NonWhitespace.search(self.text, self.offset)
+			if match is not None:
+				self.offset = match.start()
+				return self.text[self.offset]
+			self.offset = len(self.text)
+			if not self.fill():
+				return ""
+
+	def expect(self, characters: str) -> str:
+		character = self.peek()
+		if not character or character not in characters:
+			found = repr(character) if character else "the end of the stream"
+			raise Exception(f"Invalid GeoJSON FeatureCollection at character {self.position + self.offset}. Expected one of {characters!r}, got {found}")
+		self.offset += 1
+		return character
+
+	def value(self):
+		# decodes the JSON value at the offset
+		self.peek()
+		while True:
+			try:
+				value, end = self.decoder.raw_decode(self.text, self.offset)
+			except json.JSONDecodeError as error:
+				incomplete = error.pos >= len(self.text) - INCOMPLETE_TAIL or error.msg.startswith("Unterminated string")
+				if incomplete and self.fill():
+					continue
+				raise Exception(f"Invalid GeoJSON FeatureCollection at character {self.position + error.pos}: {error.msg}") from None
+			if end == len(self.text) and self.fill():
+				continue  # a number may go on in the next read
+			self.offset = end
+			return value
+
+	def object_text(self) -> str:
+		# cuts out the text of the JSON object at the offset, by matching braces outside of strings
+		depth = 0
+		scanned = 0  # characters after the offset already matched, kept across reads
+		while True:
+			for match in ObjectToken.finditer(self.text, self.offset + scanned):
+				end = match.end()
+				token = self.text[end - 1]
+				if token == "{":
+					depth += 1
+				elif token == "}":
+					depth -= 1
+					if not depth:
+						text = self.text[self.offset:end]
+						self.offset = end
+						return text
+				else:
+					scanned = end - 1 - self.offset  # rescan the string once more has been read
+					break
+			else:
+				scanned = len(self.text) - self.offset
+			if not self.fill():
+				raise Exception(f"GeoJSON FeatureCollection truncated. The feature at character {self.position + self.offset} runs past the end of the stream")
+
+
+def iter_feature_collection(source: GeoJSONSource, read_size: int) -> Iterator[str]:
+	reader = TextReader(source, read_size)
+	reader.expect("{")
+	if reader.peek() == "}":
+		reader.offset += 1
+	else:
+		while True:
+			key = reader.value()
+			reader.expect(":")
+			if key == "features":
+				reader.expect("[")
+				if reader.peek() == "]":
+					reader.offset += 1
+				else:
+					while True:
+						if reader.peek() != "{":
+							reader.expect("{")
+						yield reader.object_text()
+						if reader.expect(",]") == "]":
+							break
+			else:
+				value = reader.value()
+				if key == "type" and value != "FeatureCollection":
+					raise Exception(f"Expected a GeoJSON FeatureCollection, got type {value!r}. Use framing='ndjson' for one feature per line")
+			if reader.expect(",}") == "}":
+				break
+	if reader.peek():
+		raise Exception(f"Unexpected data after the GeoJSON FeatureCollection at character {reader.position + reader.offset}")
+
+
+def iter_ndjson(source: Iterable[FeatureText]) -> Iterator[FeatureText]:
+	for line in source:
+		if line.strip():
+			yield line
+
+
+def iter_feature_texts(source: GeoJSONSource, framing: Framing, read_size: int) -> Iterator[FeatureText]:
+	if read_size < 1:
+		raise Exception(f"read_size must be at least 1, got {read_size}")
+	if framing == "feature_collection":
+		return iter_feature_collection(source, read_size)
+	if framing == "ndjson":
+		return iter_ndjson(source)
+	raise Exception(f"Unknown framing {framing!r}. Expected 'feature_collection' or 'ndjson'")
+
+
+def split_Feature(feature: Dict) -> Tuple[Optional[Dict], Optional[Dict]]:
+	# (properties, geometry) of a Feature. A bare geometry has no properties
+	if not isinstance(feature, dict):
+		raise Exception(f"Expected a GeoJSON Feature or geometry object, got {type(feature).__name__}")
+	if feature.get("type") == "Feature":
+		return feature.get("properties"), feature.get("geometry")
+	return None, feature
+
+
+def encode_features(texts: Iterable[FeatureText], errors: RowErrors = None, start: int = 0, flavor: Flavor = "iso", srid: Optional[int] = None) -> Iterator[Tuple[Optional[Dict], Optional[bytes]]]:
+	for index, text in enumerate(texts, start):
+		properties = None
+		try:
+			properties, geometry = split_Feature(json.loads(text))
+			result = None if geometry is None else geojson_to_wkb(geometry, flavor, srid)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			result = None
+		yield properties, result
+
+
+def encode_feature_chunk(encode_features: Callable, texts: List[FeatureText], start: int, collect_errors: bool) -> Tuple[Tuple[list, bytes, Offsets, List[int]], RowErrors, ChunkWarnings]:
+	# runs in a worker process: parses and encodes a chunk of features, packing the WKB into one buffer
+	errors: RowErrors = [] if collect_errors else None
+	with warnings.catch_warnings(record=True) as caught:
+		warnings.simplefilter("always")
+		rows = list(encode_features(texts, errors, start))
+	buffer, offsets = pack_chunk([b"" if wkb is None else wkb for _, wkb in rows])
+	nulls = [index for index, (_, wkb) in enumerate(rows) if wkb is None]
+	return ([properties for properties, _ in rows], buffer, offsets, nulls), errors, chunk_warnings_of(caught)
+
+
+def unpack_feature_chunk(packed: Tuple[list, bytes, Offsets, List[int]]) -> List[Tuple[Optional[Dict], Optional[bytes]]]:
+	properties, buffer, offsets, nulls = packed
+	return list(zip(properties, unpack_encoded_chunk((buffer, offsets, nulls))))
+
+
+def iter_geojson(source: GeoJSONSource, framing: Framing = "feature_collection", read_size: int = DEFAULT_READ_SIZE) -> Iterator[Dict]:
+	"""
+	Reads the features of a FeatureCollection (`framing="feature_collection"`) or of newline delimited GeoJSON
+	(`framing="ndjson"`) from a text or binary file object one at a time, yielding each as a dict.
+	"""
+	return map(json.loads, iter_feature_texts(source, framing, read_size))
+
+
+def geojson_to_wkb_stream(
+	source: GeoJSONSource,
+	framing: Framing = "feature_collection",
+	errors: RowErrors = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	flavor: Flavor = "iso",
+	srid: Optional[int] = None,
+	read_size: int = DEFAULT_READ_SIZE,
+) -> Iterator[Tuple[Optional[Dict], Optional[bytes]]]:
+	"""
+	Reads GeoJSON features from a file object one at a time (see iter_geojson()) and yields `(properties, wkb)` for
+	each, in order. A Feature with a null geometry gives `(properties, None)`, and a bare geometry `(None, wkb)`.
+	Features which fail (when `errors` is given) are yielded with a `None` WKB.
+	With `parallel=True` the text of each chunk of features is parsed and encoded in a worker process.
+	"""
+	texts = iter_feature_texts(source, framing, read_size)
+	if parallel:
+		encode = with_settings(partial(encode_features, flavor=flavor, srid=srid))
+		return parallel_map(encode_feature_chunk, lambda chunk: (encode, chunk), unpack_feature_chunk, texts, errors, max_workers, chunk_size)
+	return encode_features(texts, errors, 0, flavor, srid)
+
+
+def geojson_to_wkb_file(
+	source: GeoJSONSource,
+	out: BinaryIO,
+	framing: Framing = "feature_collection",
+	properties_out: Optional[TextIO] = None,
+	errors: RowErrors = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	flavor: Flavor = "iso",
+	srid: Optional[int] = None,
+	read_size: int = DEFAULT_READ_SIZE,
+) -> int:
+	"""
+	Same as geojson_to_wkb_stream(), but writes the WKB of each feature to the binary file object `out`, preceded by
+	its length as a little endian uint32 (read it back with `iter_wkb(file, "length_prefixed")`). Null geometry and
+	failed features are written as records of length 0, so that rows stay in step with the input.
+	If `properties_out` is given, the properties of each feature are written to it as one line of JSON.
+	Returns the number of records written.
+	"""
+	rows = 0
+	for properties, wkb in geojson_to_wkb_stream(source, framing, errors, parallel, max_workers, chunk_size, flavor, srid, read_size):
+		if wkb is None:
+			out.write(LengthPrefixParser.pack(0))
+		else:
+			out.write(LengthPrefixParser.pack(len(wkb)))
+			out.write(wkb)
+		if properties_out is not None:
+			properties_out.write(json.dumps(properties) + "\n")
+		rows += 1
+	return rows
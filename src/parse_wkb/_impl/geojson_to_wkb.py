@@ -1,18 +1,44 @@
+from typing import Callable
 from typing import Dict, Sequence
-from struct import pack
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from array import array
+from itertools import chain
+from functools import partial
+from struct import pack_into
+from struct import unpack_from
+import sys
+
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_encode
+from .wkb_reader import EWKB_SRID_FLAG
+from .wkb_reader import EWKB_Z_FLAG
+from .wkb_reader import as_memoryview
+from .wkb_walker import with_settings
 
 # Always use little endian form, since apparently this is what shapely uses
 ByteOrderChar = str  # Literal[">", "<"]  # 0 = big = >, 1 = little = <
 byte_order_char: ByteOrderChar = "<"
 byte_order_byte = 1
+Flavor = str  # Literal["iso", "extended"]
+swap_byte_order = sys.byteorder != "little"  # coordinate runs are copied from native arrays of doubles
+
+# set by collect_stats(), see wkb_stats.py
+profiler: Optional[Callable[[Dict, Flavor, Optional[int]], bytes]] = None
 
 UNINT32 = byte_order_char + "I"
 BYTE_UNINT32 = byte_order_char + "bI"
 BYTE_UNINT32_UNINT32 = byte_order_char + "bII"
 
-map_geom_type_thousands_and_point_encoder = {
-	2: (0, byte_order_char + "2d"),
-	3: (1, byte_order_char + "3d"),
+# ISO WKB adds 1000 to the geometry type number for Z, PostGIS EWKB sets a flag instead
+map_geom_type_dimension_offset_and_point_encoder = {
+	("iso", 2):      (0, byte_order_char + "2d"),
+	("iso", 3):      (1000, byte_order_char + "3d"),
+	("extended", 2): (0, byte_order_char + "2d"),
+	("extended", 3): (EWKB_Z_FLAG, byte_order_char + "3d"),
 }
 
 
@@ -21,15 +47,17 @@ map_geom_type_thousands_and_point_encoder = {
 # 		for sub_item in item:
 # 			yield sub_item
 
-def get_geom_type_and_point_encoder(type_name, number_of_dimensions):
-	geom_type_thousands, point_encoder = map_geom_type_thousands_and_point_encoder[number_of_dimensions]
+def get_geom_type_and_point_encoder(type_name, number_of_dimensions, flavor):
+	geom_type_dimension_offset, point_encoder = map_geom_type_dimension_offset_and_point_encoder[flavor, number_of_dimensions]
 	geom_type_units = map_type_number_depth_and_encoder[type_name][0]
-	geom_type = 1000 * geom_type_thousands + geom_type_units
+	geom_type = geom_type_dimension_offset + geom_type_units
 	return geom_type, point_encoder
 
 
 def len_at_depth(a_list: Sequence, depth):
 	while depth > 0:
+		if len(a_list) == 0:
+			return 2
 		a_list = a_list[0]
 		depth = depth - 1
 	return len(a_list)
@@ -44,106 +72,240 @@ def get_number_of_dimensions(geojson):
 	return len_at_depth(geojson["coordinates"], map_type_number_depth_and_encoder[geojson["type"]][1])
 
 
-def encode_Point(geojson: Dict):
+def size_Ring(coordinates: list, number_of_dimensions: int) -> int:
+	return 4 + 8 * number_of_dimensions * len(coordinates)
+
+
+def size_Point(geojson: Dict) -> int:
+	return 5 + 8 * len(geojson["coordinates"])
+
+
+def size_LineString(geojson: Dict) -> int:
+	return 5 + size_Ring(geojson["coordinates"], get_number_of_dimensions(geojson))
+
+
+def size_Polygon(geojson: Dict) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
+	return 9 + sum(size_Ring(ring, number_of_dimensions) for ring in geojson["coordinates"])
+
+
+def size_MultiPoint(geojson: Dict) -> int:
+	return 9 + (5 + 8 * get_number_of_dimensions(geojson)) * len(geojson["coordinates"])
+
+
+def size_MultiLineString(geojson: Dict) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
+	return 9 + sum(5 + size_Ring(linestring, number_of_dimensions) for linestring in geojson["coordinates"])
+
+
+def size_MultiPolygon(geojson: Dict) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
+	return 9 + sum(9 + sum(size_Ring(ring, number_of_dimensions) for ring in polygon) for polygon in geojson["coordinates"])
+
+
+def size_GeometryCollection(geojson: Dict) -> int:
+	return 9 + sum(geojson_wkb_size(geometry) for geometry in geojson["geometries"])
+
+
+def encode_Point(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
 	number_of_dimensions = len(geojson["coordinates"])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("Point", number_of_dimensions)
-	result = pack(BYTE_UNINT32, byte_order_byte, geom_type)
-	return result + pack(point_encoder, *geojson["coordinates"])
+	geom_type, point_encoder = get_geom_type_and_point_encoder("Point", number_of_dimensions, flavor)
+	pack_into(BYTE_UNINT32, buffer, offset, byte_order_byte, geom_type)
+	pack_into(point_encoder, buffer, offset + 5, *geojson["coordinates"])
+	return offset + 5 + 8 * number_of_dimensions
 
 
-def encode_Ring(coordinates: list, point_encoder: str):
+def encode_Ring(coordinates: list, number_of_dimensions: int, buffer: memoryview, offset: int) -> int:
+	# All coordinates of the ring are flattened into one array of doubles and copied into the buffer in one go
 	number_of_points = len(coordinates)
-	result = pack(UNINT32, number_of_points)
-	for item in coordinates:
-		result += pack(point_encoder, *item)
-	return result
+	pack_into(UNINT32, buffer, offset, number_of_points)
+	offset += 4
+	# every point is checked, as a matching total alone lets points of different lengths cancel each other out
+	if any(map(number_of_dimensions.__ne__, map(len, coordinates))):
+		raise Exception("Ring shall not contain mixed number of dimensions")
+	flat_coordinates = array("d", chain.from_iterable(coordinates))
+	if swap_byte_order:
+		flat_coordinates.byteswap()
+	end = offset + 8 * len(flat_coordinates)
+	buffer[offset:end] = memoryview(flat_coordinates).cast("B")
+	return end
 
 
-def encode_LineString(geojson: Dict):
-	number_of_dimensions = len(geojson["coordinates"][0])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("LineString", number_of_dimensions)
-	result = pack(BYTE_UNINT32, byte_order_byte, geom_type)
-	result += encode_Ring(geojson["coordinates"], point_encoder)
-	return result
+def encode_LineString(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
+	geom_type, point_encoder = get_geom_type_and_point_encoder("LineString", number_of_dimensions, flavor)
+	pack_into(BYTE_UNINT32, buffer, offset, byte_order_byte, geom_type)
+	return encode_Ring(geojson["coordinates"], number_of_dimensions, buffer, offset + 5)
 
 
-def encode_Polygon(geojson: Dict):
-	number_of_dimensions = len(geojson["coordinates"][0][0])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("Polygon", number_of_dimensions)
+def encode_Polygon(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
+	geom_type, point_encoder = get_geom_type_and_point_encoder("Polygon", number_of_dimensions, flavor)
 	
 	number_of_rings = len(geojson["coordinates"])
-	result = pack(BYTE_UNINT32_UNINT32, byte_order_byte, geom_type, number_of_rings)
+	pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, geom_type, number_of_rings)
+	offset += 9
 	for ring in geojson["coordinates"]:
-		result += encode_Ring(ring, point_encoder)
-	return result
+		offset = encode_Ring(ring, number_of_dimensions, buffer, offset)
+	return offset
 
 
-def encode_MultiPoint(geojson: Dict):
-	number_of_dimensions = len(geojson["coordinates"][0])
+def encode_MultiPoint(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
 	number_of_points = len(geojson["coordinates"])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("MultiPoint", number_of_dimensions)
-	result = pack(BYTE_UNINT32_UNINT32, byte_order_byte, geom_type, number_of_points)
-	point_geom_type, point_point_encoder = get_geom_type_and_point_encoder("Point", number_of_dimensions)
+	geom_type, point_encoder = get_geom_type_and_point_encoder("MultiPoint", number_of_dimensions, flavor)
+	pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, geom_type, number_of_points)
+	offset += 9
+	point_geom_type, point_point_encoder = get_geom_type_and_point_encoder("Point", number_of_dimensions, flavor)
 	for item in geojson["coordinates"]:
 		if number_of_dimensions != len(item):
 			raise Exception("MultiPoint shall not contain mixed number of dimensions")
-		result += pack(BYTE_UNINT32, byte_order_byte, point_geom_type)
-		result += pack(point_encoder, *item)
-	return result
+		pack_into(BYTE_UNINT32, buffer, offset, byte_order_byte, point_geom_type)
+		pack_into(point_encoder, buffer, offset + 5, *item)
+		offset += 5 + 8 * number_of_dimensions
+	return offset
 
 
-def encode_MultiLineString(geojson: Dict):
-	number_of_dimensions = len(geojson["coordinates"][0][0])
+def encode_MultiLineString(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
 	number_of_linestrings = len(geojson["coordinates"])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("MultiLineString", number_of_dimensions)
-	result = pack(BYTE_UNINT32_UNINT32, byte_order_byte, geom_type, number_of_linestrings)
-	linestring_geom_type, point_encoder = get_geom_type_and_point_encoder("LineString", number_of_dimensions)
+	geom_type, point_encoder = get_geom_type_and_point_encoder("MultiLineString", number_of_dimensions, flavor)
+	pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, geom_type, number_of_linestrings)
+	offset += 9
+	linestring_geom_type, point_encoder = get_geom_type_and_point_encoder("LineString", number_of_dimensions, flavor)
 	for linestring in geojson["coordinates"]:
-		if not len(linestring[0]) == number_of_dimensions:
+		if linestring and not len(linestring[0]) == number_of_dimensions:
 			raise Exception("MultiLineString shall not contain mixed number of dimensions")
-		result += pack(BYTE_UNINT32, byte_order_byte, linestring_geom_type)
-		result += encode_Ring(linestring, point_encoder)
-	return result
+		pack_into(BYTE_UNINT32, buffer, offset, byte_order_byte, linestring_geom_type)
+		offset = encode_Ring(linestring, number_of_dimensions, buffer, offset + 5)
+	return offset
 
 
-def encode_MultiPolygon(geojson: Dict):
-	number_of_dimensions = len(geojson["coordinates"][0][0][0])
+def encode_MultiPolygon(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
+	number_of_dimensions = get_number_of_dimensions(geojson)
 	number_of_polygons = len(geojson["coordinates"])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("MultiPolygon", number_of_dimensions)
-	result = pack(BYTE_UNINT32_UNINT32, byte_order_byte, geom_type, number_of_polygons)
-	polygon_geom_type, point_encoder = get_geom_type_and_point_encoder("Polygon", number_of_dimensions)
+	geom_type, point_encoder = get_geom_type_and_point_encoder("MultiPolygon", number_of_dimensions, flavor)
+	pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, geom_type, number_of_polygons)
+	offset += 9
+	polygon_geom_type, point_encoder = get_geom_type_and_point_encoder("Polygon", number_of_dimensions, flavor)
 	for polygon in geojson["coordinates"]:
-		number_of_rings = len(geojson["coordinates"])
-		result += pack(BYTE_UNINT32_UNINT32, byte_order_byte, polygon_geom_type, number_of_rings)
-		if not len(polygon[0][0]) == number_of_dimensions:
+		number_of_rings = len(polygon)
+		pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, polygon_geom_type, number_of_rings)
+		offset += 9
+		if polygon and polygon[0] and not len(polygon[0][0]) == number_of_dimensions:
 			raise Exception("MultiPolygon shall not contain mixed number of dimensions")
-		geom_type, point_encoder = get_geom_type_and_point_encoder("Point", number_of_dimensions)
 		for ring in polygon:
-			result += encode_Ring(ring, point_encoder)
-	return result
+			offset = encode_Ring(ring, number_of_dimensions, buffer, offset)
+	return offset
 
 
-def encode_GeometryCollection(geojson: Dict):
+def encode_GeometryCollection(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor) -> int:
 	number_of_dimensions = get_number_of_dimensions(geojson)
 	number_of_geometries = len(geojson["geometries"])
-	geom_type, point_encoder = get_geom_type_and_point_encoder("GeometryCollection", number_of_dimensions)
-	result = pack(BYTE_UNINT32_UNINT32, byte_order_byte, geom_type, number_of_geometries)
+	geom_type, point_encoder = get_geom_type_and_point_encoder("GeometryCollection", number_of_dimensions, flavor)
+	pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, geom_type, number_of_geometries)
+	offset += 9
 	for geometry in geojson["geometries"]:
-		result += geojson_to_wkb(geometry)
-	return result
+		offset = map_type_number_depth_and_encoder[geometry["type"]][2](geometry, buffer, offset, flavor)
+	return offset
 
 
 map_type_number_depth_and_encoder = {
-	"Point":              (1, 0, encode_Point),
-	"LineString":         (2, 1, encode_LineString),
-	"Polygon":            (3, 2, encode_Polygon),
-	"MultiPoint":         (4, 1, encode_MultiPoint),
-	"MultiLineString":    (5, 2, encode_MultiLineString),
-	"MultiPolygon":       (6, 3, encode_MultiPolygon),
-	"GeometryCollection": (7, None, encode_GeometryCollection),
+	"Point":              (1, 0, encode_Point, size_Point),
+	"LineString":         (2, 1, encode_LineString, size_LineString),
+	"Polygon":            (3, 2, encode_Polygon, size_Polygon),
+	"MultiPoint":         (4, 1, encode_MultiPoint, size_MultiPoint),
+	"MultiLineString":    (5, 2, encode_MultiLineString, size_MultiLineString),
+	"MultiPolygon":       (6, 3, encode_MultiPolygon, size_MultiPolygon),
+	"GeometryCollection": (7, None, encode_GeometryCollection, size_GeometryCollection),
 }
 
 
-def geojson_to_wkb(geojson:Dict) -> bytes:
+def crs_srid(geojson: Dict) -> Optional[int]:
+	# The SRID of a named crs member, as written by wkb_to_geojson for EWKB with an SRID ("EPSG:4326" or "urn:ogc:def:crs:EPSG::4326")
+	name = ((geojson.get("crs") or {}).get("properties") or {}).get("name") or ""
+	authority, _, code = name.rpartition(":")
+	if authority.upper().endswith("EPSG") and code.isdigit():
+		return int(code)
+	return None
+
+
+def get_srid(geojson: Dict, flavor: Flavor, srid: Optional[int]) -> Optional[int]:
+	if flavor not in ("iso", "extended"):
+		raise Exception(f"Invalid flavor {flavor!r}. Expected 'iso' or 'extended'")
+	if flavor == "iso":
+		if srid is not None:
+			raise Exception("An SRID can only be written with flavor='extended'")
+		return None
+	if srid is None:
+		return crs_srid(geojson)
+	return srid
+
+
+def encode_Geometry(geojson: Dict, buffer: memoryview, offset: int, flavor: Flavor, srid: Optional[int]) -> int:
 	encoder = map_type_number_depth_and_encoder[geojson["type"]][2]
-	return encoder(geojson)
+	if srid is None:
+		return encoder(geojson, buffer, offset, flavor)
+	# Encode 4 bytes further along, then move the header forward over the gap to make room for the SRID after the type
+	end = encoder(geojson, buffer, offset + 4, flavor)
+	geom_type = unpack_from(UNINT32, buffer, offset + 5)[0]
+	pack_into(BYTE_UNINT32_UNINT32, buffer, offset, byte_order_byte, geom_type | EWKB_SRID_FLAG, srid)
+	return end
+
+
+def geojson_wkb_size(geojson: Dict, flavor: Flavor = "iso", srid: Optional[int] = None) -> int:
+	"""The exact number of bytes geojson_to_wkb() will produce for this geometry"""
+	srid = get_srid(geojson, flavor, srid)
+	return map_type_number_depth_and_encoder[geojson["type"]][3](geojson) + (0 if srid is None else 4)
+
+
+def geojson_to_wkb_into(geojson: Dict, buffer: bytearray, offset: int = 0, flavor: Flavor = "iso", srid: Optional[int] = None) -> int:
+	"""Encodes into a caller supplied writable buffer starting at `offset`, and returns the offset just past the written geometry.
+	Several geometries can share one buffer by passing the returned offset to the next call."""
+	srid = get_srid(geojson, flavor, srid)
+	size = map_type_number_depth_and_encoder[geojson["type"]][3](geojson) + (0 if srid is None else 4)
+	with as_memoryview(buffer) as view:
+		if offset < 0 or offset + size > len(view):
+			raise Exception(f"Buffer too small. Encoding needs {size} bytes at offset {offset} but the buffer is {len(view)} bytes long")
+		return encode_Geometry(geojson, view, offset, flavor, srid)
+
+
+def geojson_to_wkb(geojson:Dict, flavor: Flavor = "iso", srid: Optional[int] = None) -> bytes:
+	"""
+	flavor="iso" writes ISO WKB. flavor="extended" writes PostGIS EWKB with an SRID taken from `srid`,
+	or else from a crs member naming an EPSG code.
+	"""
+	if profiler is not None:
+		return profiler(geojson, flavor, srid)
+	srid = get_srid(geojson, flavor, srid)
+	buffer = bytearray(map_type_number_depth_and_encoder[geojson["type"]][3](geojson) + (0 if srid is None else 4))
+	with memoryview(buffer) as view:
+		encode_Geometry(geojson, view, 0, flavor, srid)
+	return bytes(buffer)
+
+
+def encode_many(geojsons: Iterable[Dict], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0, flavor: Flavor = "iso", srid: Optional[int] = None) -> Iterator[Optional[bytes]]:
+	for index, geojson in enumerate(geojsons, start):
+		try:
+			result = geojson_to_wkb(geojson, flavor, srid)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		yield result
+
+
+def geojson_to_wkb_many(
+	geojsons: Iterable[Dict],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	flavor: Flavor = "iso",
+	srid: Optional[int] = None,
+) -> Iterator[Optional[bytes]]:
+	if parallel:
+		return parallel_encode(with_settings(partial(encode_many, flavor=flavor, srid=srid)), geojsons, errors, max_workers, chunk_size)
+	return encode_many(geojsons, errors, 0, flavor, srid)
\ No newline at end of file
@@ -0,0 +1,340 @@
+from __future__ import annotations
+from array import array
+from heapq import heappop
+from heapq import heappush
+from math import inf
+from math import isfinite
+import mmap
+from struct import Struct
+import sys
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+from .parallel import DEFAULT_CHUNK_SIZE
+from .wkb_bounds import Bounds
+from .wkb_bounds import wkb_bounds_many
+from .wkb_reader import WKBBuffer
+
+# A static spatial index over the bounding boxes of many geometries, laid out like flatbush
+# (https://github.com/mourner/flatbush): a packed Hilbert R-tree held in two flat arrays.
+#
+# The boxes are sorted by the Hilbert curve value of their centres, then grouped `node_size` at a time into parent
+# nodes, which are grouped again, up to a single root. Every level is stored one after the other in
+#   boxes    array("d") of minx, miny, maxx, maxy per node, the items first and the root last
+#   indices  one entry per node: for an item its row index, for a parent node the position in `boxes` of its first child
+# `level_bounds` holds the position in `boxes` at which each level ends.
+#
+# Geometry with no coordinates (eg. POINT EMPTY), and rows which failed to decode, get the inverted box
+# (inf, inf, -inf, -inf), which overlaps nothing and leaves the boxes of its parents unchanged.
+#
+# to_bytes() writes the flatbush v3 binary format (an 8 byte header, the boxes as little endian doubles, then the
+# indices as uint16 or uint32), which flatbush's Flatbush.from() also reads. from_buffer() wraps such a buffer
+# without copying, so an index saved to a file can be memory mapped by load() and shared between processes.
+
+BBox = Tuple[float, float, float, float]  # minx, miny, maxx, maxy
+NodeIndices = Union[array, memoryview]  # as built, or a view of a loaded buffer
+
+DEFAULT_NODE_SIZE = 16
+
+FLATBUSH_MAGIC = 0xfb
+FLATBUSH_VERSION = 3
+FLATBUSH_FLOAT64 = 8  # index of Float64Array in flatbush's list of array types
+HeaderParser = Struct("<BBHI")  # magic, version << 4 | array type, node_size, num_items
+HILBERT_MAX = (1 << 16) - 1
+
+EMPTY_BOX: BBox = (inf, inf, -inf, -inf)
+
+
+def hilbert_state_table() -> Dict[int, Tuple[int, int]]:
+	# Position along the Hilbert curve, 4 bits of x and y at a time.
+	# The state is the transform of the quadrants still to come: bit 0 swaps x and y, bit 1 inverts both.
+	# Key: state << 8 | x4 << 4 | y4. Value: (8 bits of curve position, next state)
+	table = {}
+	for state in range(4):
+		for x4 in range(16):
+			for y4 in range(16):
+				next_state = state
+				position = 0
+				for bit in (3, 2, 1, 0):
+					rx = (x4 >> bit) & 1
+					ry = (y4 >> bit) & 1
+					if next_state & 2:
+						rx ^= 1
+						ry ^= 1
+					if next_state & 1:
+						rx, ry = ry, rx
+					position = position << 2 | ((3 * rx) ^ ry)
+					if ry == 0:
+						next_state ^= 1 | rx << 1
+				table[state << 8 | x4 << 4 | y4] = (position, next_state)
+	return table
+
+
+MapHilbertState = hilbert_state_table()
+
+
+def hilbert(x: int, y: int) -> int:
+	# position of (x, y) along the Hilbert curve filling a 65536 x 65536 grid
+	state = 0
+	position = 0
+	for shift in (12, 8, 4, 0):
+		part, state = MapHilbertState[state << 8 | ((x >> shift) & 15) << 4 | ((y >> shift) & 15)]
+		position = position << 8 | part
+	return position
+
+
+def level_bounds_of(num_items: int, node_size: int) -> List[int]:
+	# the position in `boxes` at which each level ends, as computed by flatbush
+	count = num_items
+	num_nodes = count
+	level_bounds = [num_nodes * 4]
+	while True:
+		count = -(-count // node_size)
+		num_nodes += count
+		level_bounds.append(num_nodes * 4)
+		if count == 1:
+			return level_bounds
+
+
+def xy_box(bounds: Optional[Bounds]) -> BBox:
+	# the XY part of wkb_bounds(), or EMPTY_BOX for empty geometry and failed rows
+	if bounds is None:
+		return EMPTY_BOX
+	half = len(bounds) // 2
+	return box_of((bounds[0], bounds[1], bounds[half], bounds[half + 1]))
+
+
+def box_of(box: Optional[BBox]) -> BBox:
+	# `box` as a tuple, or EMPTY_BOX if it is None or not a box (eg. NaN or infinite ordinates, or min above max).
+	# An infinite ordinate would make the extent of the tree infinite, and the Hilbert values NaN
+	if box is None:
+		return EMPTY_BOX
+	min_x, min_y, max_x, max_y = box
+	if min_x <= max_x and min_y <= max_y and isfinite(min_x + min_y + max_x + max_y):
+		return min_x, min_y, max_x, max_y
+	return EMPTY_BOX
+
+
+class PackedRTree:
+	"""
+	A static packed Hilbert R-tree over the bounding boxes of a sequence of geometries, answering which rows overlap
+	a box (query) and which are closest to a point (nearest). Build it with PackedRTree.from_wkb(wkbs) or
+	PackedRTree.from_bounds(boxes). It cannot be changed once built.
+	"""
+	__slots__ = ("num_items", "node_size", "boxes", "indices", "level_bounds", "buffer")
+
+	def __init__(self, num_items: int, node_size: int, boxes: Sequence[float], indices: NodeIndices, buffer=None):
+		self.num_items = num_items
+		self.node_size = node_size
+		self.boxes = boxes
+		self.indices = indices
+		self.level_bounds = level_bounds_of(num_items, node_size)
+		self.buffer = buffer  # kept open for as long as `boxes` and `indices` are views of it
+
+	@classmethod
+	def from_bounds(cls, boxes: Iterable[Optional[BBox]], node_size: int = DEFAULT_NODE_SIZE) -> PackedRTree:
+		"""Builds an index over (minx, miny, maxx, maxy) boxes, one per row. None (or NaN or infinity) is indexed as an empty box"""
+		if not 2 <= node_size <= 65535:
+			raise Exception(f"node_size must be from 2 to 65535, got {node_size}")
+		item_boxes = [box_of(box) for box in boxes]
+		num_items = len(item_boxes)
+		if num_items == 0:
+			raise Exception("A PackedRTree needs at least one box")
+		level_bounds = level_bounds_of(num_items, node_size)
+		num_nodes = level_bounds[-1] // 4
+
+		finite = [box for box in item_boxes if box[0] <= box[2]]
+		if finite:
+			min_x = min(box[0] for box in finite)
+			min_y = min(box[1] for box in finite)
+			width = max(box[2] for box in finite) - min_x or 1.0
+			height = max(box[3] for box in finite) - min_y or 1.0
+		else:
+			min_x = min_y = 0.0
+			width = height = 1.0
+		# sort by the Hilbert value of the centre of each box. Empty boxes go last
+		keys = []
+		for box in item_boxes:
+			if box[0] <= box[2]:
+				x = int(HILBERT_MAX * ((box[0] + box[2]) / 2 - min_x) / width)
+				y = int(HILBERT_MAX * ((box[1] + box[3]) / 2 - min_y) / height)
+				keys.append(hilbert(x, y))
+			else:
+				keys.append(1 << 32)
+		order = sorted(range(num_items), key=keys.__getitem__)
+
+		node_boxes = array("d", bytes(8 * 4 * num_nodes))
+		node_boxes[:4 * num_items] = array("d", [value for index in order for value in item_boxes[index]])
+		indices = array("H" if num_nodes < 16384 else "I", bytes((2 if num_nodes < 16384 else 4) * num_nodes))
+		indices[:num_items] = array(indices.typecode, order)
+
+		# each parent covers up to node_size consecutive nodes of the level below
+		position = 0
+		parent = num_items * 4
+		for level_end in level_bounds[:-1]:
+			while position < level_end:
+				end = min(position + node_size * 4, level_end)
+				node_boxes[parent] = min(node_boxes[position:end:4])
+				node_boxes[parent + 1] = min(node_boxes[position + 1:end:4])
+				node_boxes[parent + 2] = max(node_boxes[position + 2:end:4])
+				node_boxes[parent + 3] = max(node_boxes[position + 3:end:4])
+				indices[parent >> 2] = position
+				parent += 4
+				position = end
+		return cls(num_items, node_size, node_boxes, indices)
+
+	@classmethod
+	def from_wkb(
+		cls,
+		wkbs: Iterable[WKBBuffer],
+		node_size: int = DEFAULT_NODE_SIZE,
+		errors: Optional[List[Tuple[int, Exception]]] = None,
+		parallel: bool = False,
+		max_workers: Optional[int] = None,
+		chunk_size: int = DEFAULT_CHUNK_SIZE,
+	) -> PackedRTree:
+		"""
+		Builds an index over the bounding boxes of WKB geometries, found by wkb_bounds_many() without decoding the
+		coordinates into Python objects. Row indices are positions in `wkbs`. If an `errors` list is supplied, rows
+		which fail are indexed as empty and (row_index, exception) is appended to `errors`.
+		"""
+		bounds = wkb_bounds_many(wkbs, errors, parallel, max_workers, chunk_size)
+		return cls.from_bounds(map(xy_box, bounds), node_size)
+
+	def __len__(self) -> int:
+		return self.num_items
+
+	@property
+	def bounds(self) -> BBox:
+		"""The box around every item, (inf, inf, -inf, -inf) if all of them are empty"""
+		position = self.level_bounds[-1] - 4
+		min_x, min_y, max_x, max_y = self.boxes[position:position + 4]
+		return min_x, min_y, max_x, max_y
+
+	def query(self, bbox: BBox) -> List[int]:
+		"""The row indices of the items whose boxes overlap `bbox` (minx, miny, maxx, maxy), touching included"""
+		min_x, min_y, max_x, max_y = bbox
+		boxes = self.boxes
+		indices = self.indices
+		level_bounds = self.level_bounds
+		items_end = self.num_items * 4
+		step = self.node_size * 4
+		results: List[int] = []
+		queue: List[Tuple[int, int]] = []
+		node = level_bounds[-1] - 4
+		level = len(level_bounds) - 1
+		while True:
+			end = min(node + step, level_bounds[level])
+			for position in range(node, end, 4):
+				if max_x < boxes[position] or max_y < boxes[position + 1] or min_x > boxes[position + 2] or min_y > boxes[position + 3]:
+					continue
+				if node < items_end:
+					results.append(indices[position >> 2])
+				else:
+					queue.append((indices[position >> 2], level - 1))
+			if not queue:
+				return results
+			node, level = queue.pop()
+
+	def nearest(self, x: float, y: float, k: int = 1, max_distance: float = inf) -> List[int]:
+		"""
+		The row indices of the `k` items whose boxes are closest to the point (x, y), nearest first, leaving out those
+		further than `max_distance`. Distance is 0 for boxes containing the point. Empty items are never returned.
+		"""
+		boxes = self.boxes
+		indices = self.indices
+		level_bounds = self.level_bounds
+		items_end = self.num_items * 4
+		step = self.node_size * 4
+		max_distance_squared = max_distance * max_distance
+		results: List[int] = []
+		if k < 1:
+			return results
+		# (squared distance, is a node rather than an item, row index or node position, level)
+		queue: List[Tuple[float, bool, int, int]] = []
+		node = level_bounds[-1] - 4
+		level = len(level_bounds) - 1
+		while True:
+			end = min(node + step, level_bounds[level])
+			for position in range(node, end, 4):
+				min_x, min_y, max_x, max_y = boxes[position:position + 4]
+				dx = min_x - x if x < min_x else x - max_x if x > max_x else 0.0
+				dy = min_y - y if y < min_y else y - max_y if y > max_y else 0.0
+				distance = dx * dx + dy * dy
+				if distance > max_distance_squared or not isfinite(distance):
+					continue
+				if node < items_end:
+					heappush(queue, (distance, False, indices[position >> 2], 0))
+				else:
+					heappush(queue, (distance, True, indices[position >> 2], level - 1))
+			# items nearer than any node left in the queue are the next nearest of all
+			while queue and not queue[0][1]:
+				results.append(heappop(queue)[2])
+				if len(results) == k:
+					return results
+			if not queue:
+				return results
+			_, _, node, level = heappop(queue)
+
+	def to_bytes(self) -> bytes:
+		"""The index in the flatbush v3 binary format"""
+		boxes = array("d", self.boxes)
+		indices = array(self.indices.format if isinstance(self.indices, memoryview) else self.indices.typecode, self.indices)
+		if sys.byteorder != "little":
+			boxes.byteswap()
+			indices.byteswap()
+		header = HeaderParser.pack(FLATBUSH_MAGIC, FLATBUSH_VERSION << 4 | FLATBUSH_FLOAT64, self.node_size, self.num_items)
+		return header + boxes.tobytes() + indices.tobytes()
+
+	def save(self, path: str) -> None:
+		with open(path, "wb") as file:
+			file.write(self.to_bytes())
+
+	@classmethod
+	def from_buffer(cls, buffer: Union[bytes, bytearray, memoryview, mmap.mmap]) -> PackedRTree:
+		"""
+		Reads an index written by to_bytes() (or by flatbush with Float64Array boxes). On little endian machines the
+		arrays are views of `buffer`, not copies, so loading costs nothing however large the index.
+		"""
+		view = memoryview(buffer).cast("B")
+		if len(view) < HeaderParser.size:
+			raise Exception(f"Not a flatbush index. {len(view)} bytes is too short for the header")
+		magic, version, node_size, num_items = HeaderParser.unpack_from(view, 0)
+		if magic != FLATBUSH_MAGIC:
+			raise Exception(f"Not a flatbush index. The first byte is {magic:#04x} rather than {FLATBUSH_MAGIC:#04x}")
+		if version >> 4 != FLATBUSH_VERSION:
+			raise Exception(f"Flatbush version {version >> 4} is not supported. Expected {FLATBUSH_VERSION}")
+		if version & 15 != FLATBUSH_FLOAT64:
+			raise Exception(f"Flatbush array type {version & 15} is not supported. Expected {FLATBUSH_FLOAT64} (Float64Array)")
+		if node_size < 2:
+			raise Exception(f"Not a flatbush index. The node size is {node_size} rather than 2 or more")
+		if num_items < 1:
+			raise Exception("Not a flatbush index. The header gives no items")
+		num_nodes = level_bounds_of(num_items, node_size)[-1] // 4
+		index_size = 2 if num_nodes < 16384 else 4
+		boxes_end = HeaderParser.size + num_nodes * 4 * 8
+		if len(view) < boxes_end + num_nodes * index_size:
+			raise Exception(f"Flatbush index truncated. {num_nodes} nodes need {boxes_end + num_nodes * index_size} bytes but only {len(view)} bytes remain")
+		boxes = view[HeaderParser.size:boxes_end]
+		indices = view[boxes_end:boxes_end + num_nodes * index_size]
+		if sys.byteorder != "little":
+			swapped_boxes = array("d", boxes.tobytes())
+			swapped_indices = array("H" if index_size == 2 else "I", indices.tobytes())
+			swapped_boxes.byteswap()
+			swapped_indices.byteswap()
+			return cls(num_items, node_size, swapped_boxes, swapped_indices)
+		return cls(num_items, node_size, boxes.cast("d"), indices.cast("H") if index_size == 2 else indices.cast("I"), buffer)
+
+	@classmethod
+	def load(cls, path: str) -> PackedRTree:
+		"""Memory maps an index saved by save(). Pages are read from the file only as queries touch them"""
+		with open(path, "rb") as file:
+			return cls.from_buffer(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+	def __repr__(self) -> str:
+		return f"<PackedRTree {self.num_items} items, node_size {self.node_size}>"
@@ -0,0 +1,119 @@
+from __future__ import annotations
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+import warnings
+
+from .wkb_reader import WKBBuffer
+
+# Process pool fan-out for the *_many functions.
+# Input is split into chunks which are converted in worker processes, and the results are yielded back in input order.
+# Rather than pickling every blob separately, each chunk of WKB crosses the process boundary as a single concatenated
+# buffer plus an array of offsets (see pack_chunk). The same is done for the WKB produced by geojson_to_wkb_many.
+
+DEFAULT_CHUNK_SIZE = 4096
+
+Offsets = array  # array("Q") of byte offsets into a chunk buffer, one longer than the number of items
+RowErrors = Optional[List[Tuple[int, Exception]]]
+ChunkWarnings = List[Tuple[type, str]]  # (category, message) of each warning raised in a worker
+
+
+def pack_chunk(items: List[bytes]) -> Tuple[bytes, Offsets]:
+	offsets = array("Q", [0])
+	position = 0
+	for item in items:
+		position += item.nbytes if isinstance(item, memoryview) else len(item)
+		offsets.append(position)
+	return b"".join(items), offsets
+
+
+def unpack_chunk(buffer: bytes, offsets: Offsets) -> Iterator[memoryview]:
+	view = memoryview(buffer)
+	return (view[offsets[index]:offsets[index + 1]] for index in range(len(offsets) - 1))
+
+
+def chunk_warnings_of(caught: List[warnings.WarningMessage]) -> ChunkWarnings:
+	# the category is sent back along with the message, so that the warning can be filtered as usual when re-issued
+	return [(warning.category, str(warning.message)) for warning in caught]
+
+
+def decode_chunk(parse_many: Callable, buffer: bytes, offsets: Offsets, start: int, collect_errors: bool) -> Tuple[list, RowErrors, ChunkWarnings]:
+	errors: RowErrors = [] if collect_errors else None
+	with warnings.catch_warnings(record=True) as caught:
+		warnings.simplefilter("always")
+		results = list(parse_many(unpack_chunk(buffer, offsets), errors, start))
+	return results, errors, chunk_warnings_of(caught)
+
+
+def encode_chunk(encode_many: Callable, geometries: list, start: int, collect_errors: bool) -> Tuple[Tuple[bytes, Offsets, List[int]], RowErrors, ChunkWarnings]:
+	errors: RowErrors = [] if collect_errors else None
+	with warnings.catch_warnings(record=True) as caught:
+		warnings.simplefilter("always")
+		results = list(encode_many(geometries, errors, start))
+	failed = [index - start for index, _ in errors] if errors else []
+	buffer, offsets = pack_chunk([b"" if item is None else item for item in results])
+	return (buffer, offsets, failed), errors, chunk_warnings_of(caught)
+
+
+def unpack_encoded_chunk(packed: Tuple[bytes, Offsets, List[int]]) -> List[Optional[bytes]]:
+	buffer, offsets, failed = packed
+	results: List[Optional[bytes]] = [bytes(item) for item in unpack_chunk(buffer, offsets)]
+	for index in failed:
+		results[index] = None
+	return results
+
+
+def parallel_map(
+	worker: Callable,
+	make_arguments: Callable[[list], Tuple],
+	unpack_results: Optional[Callable[[Any], list]],
+	items: Iterable,
+	errors: RowErrors,
+	max_workers: Optional[int],
+	chunk_size: int,
+) -> Iterator[Any]:
+	if chunk_size < 1:
+		raise Exception(f"chunk_size must be at least 1, got {chunk_size}")
+	max_workers = max_workers or os.cpu_count() or 1
+	iterator = iter(items)
+	executor = ProcessPoolExecutor(max_workers)
+	pending: deque = deque()
+	start = 0
+	try:
+		while True:
+			# keep a bounded number of chunks in flight so that a huge (or endless) input is not read all at once
+			while len(pending) < 2 * max_workers:
+				chunk = list(islice(iterator, chunk_size))
+				if not chunk:
+					break
+				pending.append(executor.submit(worker, *make_arguments(chunk), start, errors is not None))
+				start += len(chunk)
+			if not pending:
+				break
+			results, chunk_errors, chunk_warnings = pending.popleft().result()
+			for category, message in chunk_warnings:
+				warnings.warn(message, category)
+			if chunk_errors and errors is not None:
+				errors.extend(chunk_errors)
+			yield from (results if unpack_results is None else unpack_results(results))
+	finally:
+		for future in pending:
+			future.cancel()
+		executor.shutdown()
+
+
+def parallel_decode(parse_many: Callable, wkbs: Iterable[WKBBuffer], errors: RowErrors, max_workers: Optional[int], chunk_size: int) -> Iterator[Any]:
+	return parallel_map(decode_chunk, lambda chunk: (parse_many, *pack_chunk(chunk)), None, wkbs, errors, max_workers, chunk_size)
+
+
+def parallel_encode(encode_many: Callable, geometries: Iterable[dict], errors: RowErrors, max_workers: Optional[int], chunk_size: int) -> Iterator[Optional[bytes]]:
+	return parallel_map(encode_chunk, lambda chunk: (encode_many, chunk), unpack_encoded_chunk, geometries, errors, max_workers, chunk_size)
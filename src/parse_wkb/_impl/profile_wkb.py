@@ -0,0 +1,78 @@
+"""
+Profiles the conversion of a file of WKB records, and prints where the time goes for each operation and geometry type.
+
+	python -m parse_wkb profile data.wkb                                   # records back to back
+	python -m parse_wkb profile data.wkb --framing length_prefixed         # each record preceded by a uint32 length
+	python -m parse_wkb profile data.wkb --operations wkb_to_wkt --json    # one operation, results as JSON
+
+geojson_to_wkb is profiled by encoding the output of wkb_to_geojson again.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+from time import perf_counter
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+import warnings
+
+from .geojson_to_wkb import geojson_to_wkb_many
+from .wkb_stats import collect_stats
+from .wkb_stream import iter_wkb
+from .wkb_to_abstract import wkb_to_abstract_many
+from .wkb_to_geojson import wkb_to_geojson_many
+from .wkb_to_geojson_str import wkb_to_geojson_str_many
+from .wkb_to_wkt import wkb_to_wkt_many
+
+MapOperation: Dict[str, Callable[..., Iterable]] = {
+	"wkb_to_geojson": wkb_to_geojson_many,
+	"wkb_to_wkt": wkb_to_wkt_many,
+	"wkb_to_geojson_str": wkb_to_geojson_str_many,
+	"wkb_to_abstract": wkb_to_abstract_many,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m parse_wkb profile", description="Profiles the conversion of a file of WKB records")
+	parser.add_argument("path", help="file of WKB records")
+	parser.add_argument("--framing", default="raw", choices=["raw", "length_prefixed"])
+	parser.add_argument("--operations", nargs="+", default=[*MapOperation, "geojson_to_wkb"], choices=[*MapOperation, "geojson_to_wkb"])
+	parser.add_argument("--json", action="store_true", help="print the statistics as JSON instead of a table")
+	args = parser.parse_args(argv)
+
+	with open(args.path, "rb") as source:
+		rows = [bytes(record) for record in iter_wkb(source, args.framing)]
+	errors: list = []
+	results: Iterable
+	with warnings.catch_warnings(record=True) as caught:
+		warnings.simplefilter("always")
+		if "geojson_to_wkb" in args.operations:
+			geometries = [geometry for geometry in wkb_to_geojson_many(rows, errors=[]) if geometry is not None]
+		start = perf_counter()
+		with collect_stats() as stats:
+			for operation in args.operations:
+				if operation == "geojson_to_wkb":
+					results = geojson_to_wkb_many(geometries, errors=errors)
+				else:
+					results = MapOperation[operation](rows, errors=errors)
+				for _ in results:
+					pass
+		seconds = perf_counter() - start
+
+	if args.json:
+		print(json.dumps({"records": len(rows), "errors": len(errors), "warnings": len(caught), "seconds": seconds, "stats": stats.as_dicts()}, indent=1))
+		return 0
+	print(f"{len(rows)} records from {args.path}, profiled in {seconds:.3f}s")
+	if errors:
+		print(f"{len(errors)} conversions failed, the first at record {errors[0][0]}: {errors[0][1]}")
+	if caught:
+		print(f"{len(caught)} warnings, the first: {caught[0].message}")
+	print(stats.report())
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
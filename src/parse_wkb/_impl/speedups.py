@@ -0,0 +1,44 @@
+from __future__ import annotations
+import os
+from typing import Iterable
+
+# Chooses between the optional compiled core (parse_wkb._speedups, built from _speedups.c when a C compiler is
+# available at install time) and the pure python readers.
+# The compiled core is used automatically if it can be imported, unless the PARSE_WKB_PURE_PYTHON environment
+# variable is set to a non empty value. set_backend() switches at runtime.
+# Readers look up `speedups.compiled` on every call, so that a switch takes effect immediately.
+
+Backend = str  # Literal["c", "python"]
+
+try:
+	from .. import _speedups as available  # type: ignore[attr-defined]  # only there when built
+except ImportError:
+	available = None
+
+compiled = None if os.environ.get("PARSE_WKB_PURE_PYTHON") else available
+
+
+def set_backend(backend: Backend) -> None:
+	"""Use the compiled core (`"c"`) or the pure python readers (`"python"`)"""
+	global compiled
+	if backend == "python":
+		compiled = None
+	elif backend == "c":
+		if available is None:
+			raise Exception("The compiled parse_wkb._speedups extension is not available. It is built when parse_wkb is installed with a C compiler present")
+		compiled = available
+	else:
+		raise Exception(f"Unknown backend {backend!r}. Expected 'c' or 'python'")
+
+
+def get_backend() -> Backend:
+	"""`"c"` if the compiled core is in use, otherwise `"python"`"""
+	return "python" if compiled is None else "c"
+
+
+def dimension_mask(dimension_keys: Iterable[int]) -> int:
+	# the dimension keys a reader accepts, in the form taken by the compiled core
+	mask = 0
+	for dimension_key in dimension_keys:
+		mask |= 1 << dimension_key
+	return mask
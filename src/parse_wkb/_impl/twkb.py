@@ -0,0 +1,548 @@
+from __future__ import annotations
+from array import array
+from itertools import accumulate
+from itertools import chain
+from math import isnan
+from math import nan
+from itertools import repeat
+from operator import mul
+from operator import sub
+from operator import truediv
+from struct import Struct
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+import warnings
+
+from .geojson_to_wkb import get_number_of_dimensions
+from .geojson_to_wkb import map_type_number_depth_and_encoder
+from .geojson_to_wkb import swap_byte_order
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_to_geojson import GeoJSONBuilder
+from .wkb_to_geojson import Geometry
+from .wkb_walker import MapExtraDimensionNames
+from .wkb_walker import MapGeometryTypeName
+from .wkb_walker import WKBBuilder
+from .wkb_walker import get_limits
+from .wkb_walker import walk_wkb
+
+# TWKB (Tiny WKB, https://github.com/TWKB/Specification) as written by PostGIS ST_AsTWKB.
+# Each coordinate is scaled by 10**precision, rounded to an integer, stored as the difference from the same coordinate
+# of the previous point, and written as a zigzag varint (small magnitudes, positive or negative, take few bytes).
+# The previous point carries on through every ring and member of one geometry, and starts again at 0 for each member
+# of a GeometryCollection, which are complete TWKB geometries of their own.
+#
+# TWKB uses the type codes 1 to 7 of WKB (MapGeometryTypeName), and the dimensions of MapExtraDimensionNames.
+# Encoding is a WKBBuilder, so WKB arrives from walk_wkb() and GeoJSON from walk_GeoJSON() as runs of coordinates.
+# Decoding is walk_TWKB, which hands runs of coordinates to any WKBBuilder (GeoJSONBuilder, WKBWriter, ...).
+# Both work a whole run at a time with map() over operator functions and lookups in precomputed tables, so that the
+# per coordinate work runs in C: scaling and differencing the interleaved coordinates, then writing the zigzag varints
+# with one join of precomputed bytes. Reading finds the end of a run of varints first, so that a run of one byte
+# varints (the common case at low precision) is decoded by one table lookup per value.
+#
+# Rounding is Python's round(), which differs from the lround() of PostGIS only for values exactly half way between
+# two steps of the precision.
+
+PRECISION_RANGE = range(-8, 8)  # zigzag encoded in the 4 high bits of the first byte
+EXTRA_PRECISION_RANGE = range(0, 8)  # 3 bits each in the extended dimensions byte
+
+METADATA_BBOX = 1
+METADATA_SIZE = 2
+METADATA_IDLIST = 4
+METADATA_EXTENDED_DIMENSIONS = 8
+METADATA_EMPTY = 16
+
+# scaled coordinates must stay within this so that their differences fit the int64 of the specification
+MAX_SCALED = (1 << 62) - 1
+
+
+class VarintTable(dict):
+	# signed value: the varint bytes of its zigzag encoding. Values past the table are encoded as they are looked up
+	__slots__ = ()
+
+	def __missing__(self, value: int) -> bytes:
+		return encode_Varint(zigzag(value))
+
+
+def zigzag(value: int) -> int:
+	return value << 1 if value >= 0 else ~value << 1 | 1
+
+
+def unzigzag(value: int) -> int:
+	return (value >> 1) ^ -(value & 1)
+
+
+def encode_Varint(value: int) -> bytes:
+	out = bytearray()
+	while value > 127:
+		out.append(value & 127 | 128)
+		value >>= 7
+	out.append(value)
+	return bytes(out)
+
+
+# The zigzag varint of every value which takes one or two bytes, so that a run can be written with one join
+DeltaBytes = VarintTable((unzigzag(value), encode_Varint(value)) for value in range(1 << 14))
+
+# The zigzag decoded value of every one byte varint
+SignedBytes: List[int] = [unzigzag(value) for value in range(128)]
+
+# bytes < 128, which end a varint
+VARINT_ENDS = bytes(range(128))
+
+UInt32Encoder = Struct("<I")
+HeaderEncoder = Struct("<BI")
+
+
+def encode_Deltas(deltas: List[int]) -> bytes:
+	# signed values as zigzag varints
+	return b"".join(map(DeltaBytes.__getitem__, deltas))
+
+
+def truncated_twkb(offset: Offset) -> Exception:
+	return Exception(f"TWKB data truncated. A varint at offset {offset} runs past the end of the data")
+
+
+def decode_Varint(twkb: memoryview, offset: Offset) -> Tuple[int, Offset]:
+	try:
+		byte = twkb[offset]
+		value = byte & 127
+		shift = 7
+		while byte > 127:
+			offset += 1
+			byte = twkb[offset]
+			value |= (byte & 127) << shift
+			shift += 7
+	except IndexError:
+		raise truncated_twkb(offset) from None
+	return value, offset + 1
+
+
+def decode_Deltas(twkb: memoryview, offset: Offset, count: int) -> Tuple[List[int], Offset]:
+	# `count` zigzag varints starting at `offset`, decoded to signed values.
+	# The end of the last varint is found first, by counting the bytes which end a varint in ever smaller slices: after
+	# a slice of `left` bytes, as many varints are left as the slice had continuation bytes. Then the common case, where
+	# every varint is one byte, is a single table lookup per value
+	end = offset
+	left = count
+	while left:
+		chunk = bytes(twkb[end:end + left])
+		if len(chunk) < left:
+			raise Exception(f"TWKB data truncated. {count} values need more than the {len(twkb) - offset} bytes remaining")
+		left = len(chunk.translate(None, VARINT_ENDS))
+		end += len(chunk)
+	data = bytes(twkb[offset:end])
+	if len(data) == count:
+		return list(map(SignedBytes.__getitem__, data)), end
+	values: List[int] = []
+	append = values.append
+	items = iter(data)
+	for byte in items:
+		if byte < 128:
+			append(SignedBytes[byte])
+			continue
+		value = byte & 127
+		shift = 7
+		for byte in items:
+			value |= (byte & 127) << shift
+			if byte < 128:
+				break
+			shift += 7
+		append((value >> 1) ^ -(value & 1))
+	return values, end
+
+
+def scale_Column(column: Sequence[float], precision: int) -> List[int]:
+	try:
+		if precision >= 0:
+			return list(map(round, map(mul, column, repeat(10 ** precision))))
+		return list(map(round, map(truediv, column, repeat(10 ** -precision))))
+	except (ValueError, OverflowError):
+		raise Exception("TWKB cannot hold NaN or infinite coordinates") from None
+
+
+def unscale_Column(column: List[int], precision: int) -> array:
+	if precision >= 0:
+		return array("d", map(truediv, column, repeat(10 ** precision)))
+	return array("d", map(mul, column, repeat(10 ** -precision)))
+
+
+class TWKBFrame:
+	# One TWKB geometry being written: a top level geometry, a member of a GeometryCollection, or a Multi* whose
+	# members add to its body. `last` is the previous point, `mins` and `maxs` the scaled bounds so far
+	__slots__ = ("type_key", "dimension_key", "body", "last", "mins", "maxs", "empty")
+
+	def __init__(self, type_key: int, dimension_key: int, dimension_count: int):
+		self.type_key = type_key
+		self.dimension_key = dimension_key
+		self.body = bytearray()
+		self.last = [0] * dimension_count
+		self.mins = [MAX_SCALED] * dimension_count
+		self.maxs = [-MAX_SCALED] * dimension_count
+		self.empty = False
+
+
+class TWKBBuilder(WKBBuilder):
+	# Writes TWKB from the parts given by walk_Geometry (or walk_GeoJSON).
+	# `stack` holds a TWKBFrame for each open collection
+	__slots__ = ("precision", "z_precision", "m_precision", "bbox", "size", "precisions", "stack", "value")
+	operation = "wkb_to_twkb"
+
+	def __init__(self, precision: int, z_precision: int, m_precision: int, bbox: bool, size: bool):
+		if precision not in PRECISION_RANGE:
+			raise Exception(f"TWKB precision must be from -8 to 7, got {precision}")
+		if z_precision not in EXTRA_PRECISION_RANGE or m_precision not in EXTRA_PRECISION_RANGE:
+			raise Exception(f"TWKB z_precision and m_precision must be from 0 to 7, got {z_precision} and {m_precision}")
+		self.precision = precision
+		self.z_precision = z_precision
+		self.m_precision = m_precision
+		self.bbox = bbox
+		self.size = size
+		axis_precision = {"X": precision, "Y": precision, "Z": z_precision, "M": m_precision}
+		# dimension_key: precision of each column
+		self.precisions: Dict[int, List[int]] = {key: [axis_precision[axis] for axis in names] for key, (_, names) in MapExtraDimensionNames.items()}
+		self.stack: List[TWKBFrame] = []
+		self.value: Optional[bytes] = None
+
+	def write_Run(self, run: Sequence[float], frame: TWKBFrame) -> None:
+		# the points of `run` (interleaved coordinates) as zigzag varints of the differences from the previous point.
+		# The differences are taken over the interleaved coordinates, each from the one `dimension_count` before it
+		dimension_count = len(frame.last)
+		precisions = self.precisions[frame.dimension_key]
+		if len(run) % dimension_count:
+			raise Exception("Ring shall not contain mixed number of dimensions")
+		if precisions.count(precisions[0]) == dimension_count:
+			scaled = scale_Column(run, precisions[0])
+		else:
+			scaled = [0] * len(run)
+			for axis in range(dimension_count):
+				scaled[axis::dimension_count] = scale_Column(run[axis::dimension_count], precisions[axis])
+		mins = frame.mins
+		maxs = frame.maxs
+		for axis in range(dimension_count):
+			column = scaled[axis::dimension_count]
+			low = min(column)
+			high = max(column)
+			if low < -MAX_SCALED or high > MAX_SCALED:
+				raise Exception(f"Coordinates too large for TWKB with precision {precisions[axis]}")
+			if low < mins[axis]:
+				mins[axis] = low
+			if high > maxs[axis]:
+				maxs[axis] = high
+		deltas = list(map(sub, scaled, chain(frame.last, scaled)))
+		frame.last[:] = scaled[-dimension_count:]
+		frame.body += encode_Deltas(deltas)
+
+	def write_Body(self, type_key: int, runs: list, frame: TWKBFrame, member: bool) -> None:
+		# a Point, LineString or Polygon, on its own or as a member of `frame` (a Multi*)
+		dimension_count = len(frame.last)
+		body = frame.body
+		if type_key == 1:
+			if isnan(runs[0][0]):
+				if member:
+					raise Exception("TWKB cannot hold an empty Point within a MultiPoint")
+				frame.empty = True
+				return
+			self.write_Run(runs[0], frame)
+		elif type_key == 2:
+			if not runs[0] and not member:
+				frame.empty = True
+				return
+			body += encode_Varint(len(runs[0]) // dimension_count)
+			if runs[0]:
+				self.write_Run(runs[0], frame)
+		else:
+			if not runs and not member:
+				frame.empty = True
+				return
+			body += encode_Varint(len(runs))
+			for run in runs:
+				body += encode_Varint(len(run) // dimension_count)
+				if run:
+					self.write_Run(run, frame)
+
+	def finish(self, frame: TWKBFrame) -> bytes:
+		# header, metadata, extended dimensions, size and bounding box in front of the body
+		header = bytearray((frame.type_key | zigzag(self.precision) << 4, 0))
+		dimension_key = frame.dimension_key
+		if dimension_key:
+			header[1] |= METADATA_EXTENDED_DIMENSIONS
+			# bit 0 is Z and bit 1 is M, the same as in dimension_key
+			header.append(dimension_key | self.z_precision << 2 | self.m_precision << 5)
+		if frame.empty:
+			header[1] |= METADATA_EMPTY
+			return bytes(header)
+		box = b""
+		if self.bbox:
+			header[1] |= METADATA_BBOX
+			# a box of zeros if there are no coordinates at all (eg. MULTILINESTRING (EMPTY))
+			box = encode_Deltas([value for low, high in zip(frame.mins, frame.maxs) for value in ((low, high - low) if low <= high else (0, 0))])
+		if self.size:
+			header[1] |= METADATA_SIZE
+			header += encode_Varint(len(box) + len(frame.body))
+		return bytes(header + box + frame.body)
+
+	def add(self, frame: TWKBFrame) -> None:
+		data = self.finish(frame)
+		stack = self.stack
+		if not stack:
+			self.value = data
+			return
+		parent = stack[-1]
+		parent.body += data
+		if not frame.empty:
+			for axis in range(min(len(parent.mins), len(frame.mins))):
+				parent.mins[axis] = min(parent.mins[axis], frame.mins[axis])
+				parent.maxs[axis] = max(parent.maxs[axis], frame.maxs[axis])
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: list) -> None:
+		stack = self.stack
+		if stack and stack[-1].type_key != 7:
+			self.write_Body(type_key, runs, stack[-1], True)
+			return
+		frame = TWKBFrame(type_key, dimension_key, MapExtraDimensionNames[dimension_key][0])
+		self.write_Body(type_key, runs, frame, False)
+		self.add(frame)
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		frame = TWKBFrame(type_key, dimension_key, MapExtraDimensionNames[dimension_key][0])
+		if count:
+			frame.body += encode_Varint(count)
+		else:
+			frame.empty = True
+		self.stack.append(frame)
+
+	def end_collection(self) -> None:
+		self.add(self.stack.pop())
+
+	def result(self) -> bytes:
+		assert self.value is not None
+		return self.value
+
+
+# GeoJSON number of dimensions: dimension_key
+MapDimensionCountKey = {
+	2: 0,
+	3: 1,
+	4: 3,
+}
+
+
+def walk_GeoJSON(geojson: Dict, builder: WKBBuilder) -> None:
+	# Calls the methods of `builder` for the parts of a GeoJSON geometry, the same as walk_Geometry does for WKB
+	type_name = geojson["type"]
+	type_key = map_type_number_depth_and_encoder[type_name][0]
+	number_of_dimensions = get_number_of_dimensions(geojson)
+	dimension_key = MapDimensionCountKey.get(number_of_dimensions)
+	if dimension_key is None:
+		raise Exception(f"{type_name} has {number_of_dimensions} dimensions. Expected 2, 3 or 4")
+	if type_key == 7:
+		builder.begin_collection(7, dimension_key, "<", None, len(geojson["geometries"]))
+		for member in geojson["geometries"]:
+			walk_GeoJSON(member, builder)
+		builder.end_collection()
+		return
+	coordinates = geojson["coordinates"]
+	if type_key == 1:
+		builder.geometry(1, dimension_key, "<", None, [tuple(coordinates)])
+	elif type_key == 2:
+		builder.geometry(2, dimension_key, "<", None, [array("d", chain.from_iterable(coordinates))])
+	elif type_key == 3:
+		builder.geometry(3, dimension_key, "<", None, [array("d", chain.from_iterable(ring)) for ring in coordinates])
+	else:
+		builder.begin_collection(type_key, dimension_key, "<", None, len(coordinates))
+		for member in coordinates:
+			walk_GeoJSON({"type": MapGeometryTypeName[type_key - 3], "coordinates": member}, builder)
+		builder.end_collection()
+
+
+class WKBWriter(WKBBuilder):
+	# Writes little endian ISO WKB from the parts given by walk_TWKB (or walk_Geometry)
+	__slots__ = ("out",)
+
+	def __init__(self):
+		self.out = bytearray()
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: list) -> None:
+		out = self.out
+		out += HeaderEncoder.pack(1, type_key + 1000 * dimension_key)
+		if type_key != 2 and type_key != 3:
+			runs = [array("d", runs[0])]
+		elif type_key == 3:
+			out += UInt32Encoder.pack(len(runs))
+		dimension_count = MapExtraDimensionNames[dimension_key][0]
+		for run in runs:
+			if type_key != 1:
+				out += UInt32Encoder.pack(len(run) // dimension_count)
+			if swap_byte_order:
+				run = array("d", run)
+				run.byteswap()
+			out += run
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		self.out += HeaderEncoder.pack(1, type_key + 1000 * dimension_key)
+		self.out += UInt32Encoder.pack(count)
+
+	def result(self) -> bytes:
+		return bytes(self.out)
+
+
+def decode_Run(twkb: memoryview, offset: Offset, num_points: int, precisions: List[int], last: List[int]) -> Tuple[array, Offset]:
+	# `num_points` points starting at `offset`, as an array("d") of interleaved coordinates. `last` is the previous point
+	dimension_count = len(last)
+	deltas, offset = decode_Deltas(twkb, offset, num_points * dimension_count)
+	if not deltas:
+		return array("d"), offset
+	scaled = [0] * len(deltas)
+	for axis in range(dimension_count):
+		column = deltas[axis::dimension_count]
+		column[0] += last[axis]
+		column = list(accumulate(column))
+		last[axis] = column[-1]
+		scaled[axis::dimension_count] = column
+	if precisions.count(precisions[0]) == dimension_count:
+		return unscale_Column(scaled, precisions[0]), offset
+	run = array("d", bytes(8 * len(scaled)))
+	for axis in range(dimension_count):
+		run[axis::dimension_count] = unscale_Column(scaled[axis::dimension_count], precisions[axis])
+	return run, offset
+
+
+def decode_Body(twkb: memoryview, offset: Offset, type_key: int, precisions: List[int], last: List[int]) -> Tuple[list, Offset]:
+	# the runs of a Point, LineString or Polygon
+	if type_key == 1:
+		run, offset = decode_Run(twkb, offset, 1, precisions, last)
+		return [tuple(run)], offset
+	if type_key == 2:
+		num_points, offset = decode_Varint(twkb, offset)
+		run, offset = decode_Run(twkb, offset, num_points, precisions, last)
+		return [run], offset
+	num_rings, offset = decode_Varint(twkb, offset)
+	if num_rings > len(twkb) - offset:
+		raise Exception(f"TWKB data truncated. {num_rings} rings need at least {num_rings} bytes but only {len(twkb) - offset} bytes remain")
+	runs = []
+	for _ in range(num_rings):
+		num_points, offset = decode_Varint(twkb, offset)
+		run, offset = decode_Run(twkb, offset, num_points, precisions, last)
+		runs.append(run)
+	return runs, offset
+
+
+def walk_TWKB(twkb: memoryview, offset: Offset, builder: WKBBuilder, max_depth: Optional[int] = None) -> Offset:
+	# Walks the TWKB geometry starting at `offset`, returning the offset just past its end.
+	# As in walk_Geometry, GeometryCollections are walked with an explicit stack: `left` is the number of members still to
+	# be read in the innermost open collection, and `outer` holds the same for each enclosing collection
+	if max_depth is None:
+		max_depth = get_limits()[0]
+	size = len(twkb)
+	outer: List[int] = []
+	left = 0
+	while True:
+		if size - offset < 2:
+			raise Exception(f"TWKB data truncated. A geometry header needs 2 bytes but only {size - offset} bytes remain")
+		type_byte = twkb[offset]
+		metadata = twkb[offset + 1]
+		offset += 2
+		type_key = type_byte & 15
+		if type_key not in MapGeometryTypeName:
+			raise Exception(f"Invalid TWKB geometry type {type_key}")
+		precision = unzigzag(type_byte >> 4)
+		dimension_key = 0
+		z_precision = m_precision = 0
+		if metadata & METADATA_EXTENDED_DIMENSIONS:
+			if offset >= size:
+				raise truncated_twkb(offset)
+			extended = twkb[offset]
+			offset += 1
+			dimension_key = extended & 3
+			z_precision = (extended >> 2) & 7
+			m_precision = extended >> 5
+		dimension_count, names = MapExtraDimensionNames[dimension_key]
+		if metadata & METADATA_SIZE:
+			_, offset = decode_Varint(twkb, offset)
+		if metadata & METADATA_BBOX and not metadata & METADATA_EMPTY:
+			_, offset = decode_Deltas(twkb, offset, 2 * dimension_count)
+		if metadata & METADATA_EMPTY:
+			if type_key == 1:
+				builder.geometry(1, dimension_key, "<", None, [(nan,) * dimension_count])
+			elif type_key < 4:
+				builder.geometry(type_key, dimension_key, "<", None, [array("d")] if type_key == 2 else [])
+			else:
+				builder.begin_collection(type_key, dimension_key, "<", None, 0)
+				builder.end_collection()
+		else:
+			axis_precision = {"X": precision, "Y": precision, "Z": z_precision, "M": m_precision}
+			precisions = [axis_precision[axis] for axis in names]
+			last = [0] * dimension_count
+			if type_key < 4:
+				runs, offset = decode_Body(twkb, offset, type_key, precisions, last)
+				builder.geometry(type_key, dimension_key, "<", None, runs)
+			else:
+				count, offset = decode_Varint(twkb, offset)
+				if count > size - offset:
+					raise Exception(f"TWKB data truncated. {count} members need at least {count} bytes but only {size - offset} bytes remain")
+				if metadata & METADATA_IDLIST:
+					_, offset = decode_Deltas(twkb, offset, count)
+				if type_key < 7:
+					builder.begin_collection(type_key, dimension_key, "<", None, count)
+					for _ in range(count):
+						runs, offset = decode_Body(twkb, offset, type_key - 3, precisions, last)
+						builder.geometry(type_key - 3, dimension_key, "<", None, runs)
+					builder.end_collection()
+				else:
+					if len(outer) >= max_depth:
+						raise Exception(f"TWKB geometry is nested more than {max_depth} deep. See set_limits()")
+					builder.begin_collection(7, dimension_key, "<", None, count)
+					if count:
+						outer.append(left)
+						left = count
+						continue
+					builder.end_collection()
+		# a geometry is complete, and with it any collections it was the last member of
+		while True:
+			if not outer:
+				return offset
+			left -= 1
+			if left:
+				break
+			left = outer.pop()
+			builder.end_collection()
+
+
+def walk_twkb(twkb: WKBBuffer, builder: WKBBuilder) -> Any:
+	with as_memoryview(twkb) as view:
+		offset = walk_TWKB(view, 0, builder)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"TWKB data not fully parsed. {remaining} bytes remaining")
+	return builder.result()
+
+
+def geojson_to_twkb(geojson: Dict, precision: int = 6, z_precision: int = 3, m_precision: int = 3, bbox: bool = False, size: bool = False) -> bytes:
+	"""
+	Encodes GeoJSON as TWKB, keeping `precision` decimal places of X and Y (-8 to 7; negative rounds to tens, hundreds,
+	...) and `z_precision` and `m_precision` of Z and M (0 to 7). `bbox=True` and `size=True` add the optional
+	bounding box and size headers to each geometry.
+	"""
+	builder = TWKBBuilder(precision, z_precision, m_precision, bbox, size)
+	walk_GeoJSON(geojson, builder)
+	return builder.result()
+
+
+def wkb_to_twkb(wkb: WKBBuffer, precision: int = 6, z_precision: int = 3, m_precision: int = 3, bbox: bool = False, size: bool = False) -> bytes:
+	"""Converts WKB (or PostGIS EWKB, whose SRID is dropped) to TWKB. The options are those of geojson_to_twkb()"""
+	return walk_wkb(wkb, TWKBBuilder(precision, z_precision, m_precision, bbox, size))
+
+
+def twkb_to_geojson(twkb: WKBBuffer) -> Geometry:
+	return walk_twkb(twkb, GeoJSONBuilder())
+
+
+def twkb_to_wkb(twkb: WKBBuffer) -> bytes:
+	"""Converts TWKB to little endian ISO WKB"""
+	return walk_twkb(twkb, WKBWriter())
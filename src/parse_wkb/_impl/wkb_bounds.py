@@ -0,0 +1,156 @@
+from __future__ import annotations
+from array import array
+from math import isnan
+from struct import unpack_from
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+import warnings
+
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from .wkb_reader import Double
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import MapGeometryTypeCode
+from .wkb_reader import MapHeaderSize
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import append_CoordinateRun
+from .wkb_reader import as_memoryview
+from .wkb_reader import invalid_geometry_type
+from .wkb_reader import parse_ByteOrder
+from .wkb_reader import parse_UInt32
+from .wkb_reader import swap_byte_order_char
+from .wkb_walker import with_settings
+
+# Bounding boxes straight from WKB.
+# Every run of coordinates is appended to one flat array("d") per dimension set with array.frombytes (see
+# append_CoordinateRun), so that no Python object is created while walking the geometry. The minimum and maximum of
+# each ordinate are then taken over strided slices of those arrays.
+#
+# The result is (minx, miny, maxx, maxy) for XY geometry, and for geometry with Z and/or M the extra ranges are added
+# in the same order as the ordinates: (minx, miny, minz, maxx, maxy, maxz), (minx, miny, minm, maxx, maxy, maxm) or
+# (minx, miny, minz, minm, maxx, maxy, maxz, maxm). Empty geometry (including the NaN Point) gives NaN bounds.
+
+Bounds = Tuple[Double, ...]
+
+# dimension_key: index of each ordinate within a point
+MapOrdinateIndex: Dict[int, Dict[str, int]] = {
+	0: {"x": 0, "y": 1},
+	1: {"x": 0, "y": 1, "z": 2},
+	2: {"x": 0, "y": 1, "m": 2},
+	3: {"x": 0, "y": 1, "z": 2, "m": 3},
+}
+
+
+def collect_Geometry(wkb: memoryview, offset: Offset, coordinates: Dict[int, array]) -> Tuple[int, Offset]:
+	# Appends the coordinates of the geometry starting at `offset` to coordinates[dimension_key].
+	# Returns the dimension_key of the geometry and the offset just past its end.
+	# Members of collections are read in order by counting the geometries still to be read, rather than by recursion,
+	# so that deeply nested GeometryCollections cannot exhaust the stack
+	top_dimension_key = -1  # until the first header is read
+	pending = 1
+	while pending:
+		pending -= 1
+		byte_order, _ = parse_ByteOrder(wkb, offset)
+		int_parser = byte_order + "I"
+		geom_type_integer, _ = parse_UInt32(wkb, offset + 1, int_parser)
+		type_code = MapGeometryTypeCode.get(geom_type_integer)
+		if type_code is None:
+			raise invalid_geometry_type(geom_type_integer, MapDimensionCount, range(1, 8))
+		type_units, dimension_key, has_srid = type_code
+		if top_dimension_key < 0:
+			top_dimension_key = dimension_key
+		offset += MapHeaderSize[has_srid]
+		dimension_count = MapDimensionCount[dimension_key]
+		swap = byte_order == swap_byte_order_char
+		run = coordinates.get(dimension_key)
+		if run is None:
+			run = coordinates[dimension_key] = array("d")
+		if type_units == 1:
+			if offset + 8 * dimension_count <= len(wkb) and isnan(unpack_from(byte_order + "d", wkb, offset)[0]):
+				# POINT EMPTY
+				offset += 8 * dimension_count
+			else:
+				offset = append_CoordinateRun(wkb, offset, 1, dimension_count, swap, run)
+			continue
+		count, offset = parse_UInt32(wkb, offset, int_parser)
+		if type_units == 2:
+			offset = append_CoordinateRun(wkb, offset, count, dimension_count, swap, run)
+		elif type_units == 3:
+			for _ in range(count):
+				num_points, offset = parse_UInt32(wkb, offset, int_parser)
+				offset = append_CoordinateRun(wkb, offset, num_points, dimension_count, swap, run)
+		else:
+			pending += count
+	return top_dimension_key, offset
+
+
+def reduce_Bounds(coordinates: Dict[int, array], dimension_key: int) -> Bounds:
+	minimums = []
+	maximums = []
+	for ordinate in MapOrdinateIndex[dimension_key]:
+		lowest = highest = float("nan")
+		for run_dimension_key, run in coordinates.items():
+			index = MapOrdinateIndex[run_dimension_key].get(ordinate)
+			if index is None or not run:
+				continue
+			column = run[index::MapDimensionCount[run_dimension_key]]
+			low, high = min(column), max(column)
+			if not low >= lowest:
+				lowest = low
+			if not high <= highest:
+				highest = high
+		minimums.append(lowest)
+		maximums.append(highest)
+	return (*minimums, *maximums)
+
+
+def wkb_bounds(wkb: WKBBuffer) -> Bounds:
+	"""
+	The bounding box of a WKB (or PostGIS EWKB) geometry, as (minx, miny, maxx, maxy) plus the Z and/or M ranges if
+	the geometry has them, eg. (minx, miny, minz, maxx, maxy, maxz). Coordinates are not decoded into Python objects.
+	"""
+	coordinates: Dict[int, array] = {}
+	with as_memoryview(wkb) as view:
+		dimension_key, offset = collect_Geometry(view, 0, coordinates)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	return reduce_Bounds(coordinates, dimension_key)
+
+
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0) -> Iterator[Optional[Bounds]]:
+	# Same as calling wkb_bounds() on each item.
+	# If an `errors` list is supplied, rows which fail are yielded as None and (row_index, exception) is appended to `errors`
+	for index, wkb in enumerate(wkbs, start):
+		coordinates: Dict[int, array] = {}
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+			dimension_key, offset = collect_Geometry(view, 0, coordinates)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		if offset < len(view):
+			warnings.warn(f"WKB data not fully parsed. {len(view) - offset} bytes remaining in row {index}")
+		yield reduce_Bounds(coordinates, dimension_key)
+
+
+def wkb_bounds_many(
+	wkbs: Iterable[WKBBuffer],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Optional[Bounds]]:
+	if parallel:
+		return parallel_decode(with_settings(parse_many), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors)
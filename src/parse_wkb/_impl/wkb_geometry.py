@@ -0,0 +1,212 @@
+from __future__ import annotations
+from struct import Struct
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .wkb_reader import Double
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import MapGeometryTypeCode
+from .wkb_reader import MapHeaderSize
+from .wkb_reader import MapPointParser
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_reader import invalid_geometry_type
+from .wkb_reader import parse_ByteOrder
+from .wkb_reader import parse_UInt32
+from .wkb_reader import skip_Geometry
+from .wkb_to_geojson import wkb_to_geojson
+from .wkb_to_wkt import wkb_to_wkt
+
+# Read-only views over WKB which decode only what is asked for.
+# Constructing a WKBGeometry reads the header (and the part count) and nothing else; coordinates are unpacked when
+# they are indexed or iterated. The byte offsets of the parts of a Polygon, multi geometry or GeometryCollection are
+# found by walking headers and counts (see skip_Geometry) the first time a part is indexed, and kept for later calls.
+
+Point = Tuple[Double, ...]
+
+MapGeometryTypeName = {
+	1: "Point",
+	2: "LineString",
+	3: "Polygon",
+	4: "MultiPoint",
+	5: "MultiLineString",
+	6: "MultiPolygon",
+	7: "GeometryCollection",
+}
+
+MapDimensionNames = {
+	0: "XY",
+	1: "XYZ",
+	2: "XYM",
+	3: "XYZM",
+}
+
+
+class WKBCoordinates:
+	"""A run of points (a LineString or LinearRing) inside a WKB buffer. Indexing a point costs one unpack."""
+	__slots__ = ("wkb", "offset", "count", "point_parser")
+
+	def __init__(self, wkb: memoryview, offset: Offset, count: int, point_parser: Struct):
+		end = offset + point_parser.size * count
+		if end > len(wkb):
+			raise Exception(f"WKB data truncated. {count} points need {end - offset} bytes but only {len(wkb) - offset} bytes remain")
+		self.wkb = wkb
+		self.offset = offset
+		self.count = count
+		self.point_parser = point_parser
+
+	def __len__(self) -> int:
+		return self.count
+
+	def __getitem__(self, index: int) -> Point:
+		if index < 0:
+			index += self.count
+		if not 0 <= index < self.count:
+			raise IndexError(f"point index {index} out of range for {self.count} points")
+		return self.point_parser.unpack_from(self.wkb, self.offset + index * self.point_parser.size)
+
+	def __iter__(self) -> Iterator[Point]:
+		return self.point_parser.iter_unpack(self.wkb[self.offset:self.end])
+
+	@property
+	def end(self) -> Offset:
+		return self.offset + self.point_parser.size * self.count
+
+	def __repr__(self) -> str:
+		return f"<WKBCoordinates {self.count} points>"
+
+
+class WKBGeometry:
+	"""
+	A lazy view over the WKB (or PostGIS EWKB) geometry starting at `offset` in `wkb`, which may be anything
+	supporting the buffer protocol. The buffer is not copied.
+	`len(geometry)` and `geometry[i]` give the parts of the geometry:
+	the points of a LineString or MultiPoint (as WKBGeometry for MultiPoint), the rings of a Polygon (as WKBCoordinates),
+	or the members of a MultiLineString, MultiPolygon or GeometryCollection (as WKBGeometry).
+	"""
+	__slots__ = ("wkb", "offset", "int_parser", "point_parser", "type_number", "dimension_key", "srid", "body", "num_parts", "_part_offsets", "_end")
+
+	def __init__(self, wkb: WKBBuffer, offset: Offset = 0):
+		wkb = as_memoryview(wkb)
+		start = offset
+		byte_order, offset = parse_ByteOrder(wkb, offset)
+		int_parser = byte_order + "I"
+		geom_type_integer, offset = parse_UInt32(wkb, offset, int_parser)
+		type_code = MapGeometryTypeCode.get(geom_type_integer)
+		if type_code is None:
+			raise invalid_geometry_type(geom_type_integer, MapDimensionCount, MapGeometryTypeName)
+		type_number, dimension_key, has_srid = type_code
+		self.wkb = wkb
+		self.offset = start
+		self.int_parser = int_parser
+		self.point_parser: Struct = MapPointParser[byte_order, MapDimensionCount[dimension_key]]
+		self.type_number: int = type_number
+		self.dimension_key: int = dimension_key
+		self.srid: Optional[int] = parse_UInt32(wkb, offset, int_parser)[0] if has_srid else None
+		self.body: Offset = start + MapHeaderSize[has_srid]
+		self.num_parts: int = 1 if type_number == 1 else parse_UInt32(wkb, self.body, int_parser)[0]
+		self._part_offsets: Optional[List[Offset]] = None
+		self._end: Offset = 0  # found together with _part_offsets
+
+	@property
+	def type(self) -> str:
+		"""The GeoJSON name of the geometry type, eg. "MultiPolygon" """
+		return MapGeometryTypeName[self.type_number]
+
+	@property
+	def dimensions(self) -> str:
+		"""One of "XY", "XYZ", "XYM" or "XYZM" """
+		return MapDimensionNames[self.dimension_key]
+
+	def __len__(self) -> int:
+		return self.num_parts
+
+	def __getitem__(self, index: int) -> Union[Point, WKBCoordinates, WKBGeometry]:
+		if index < 0:
+			index += self.num_parts
+		if not 0 <= index < self.num_parts:
+			raise IndexError(f"part index {index} out of range for {self.type} with {self.num_parts} parts")
+		if self.type_number <= 2:
+			return self.points()[index]
+		offset = self.part_offsets()[index]
+		if self.type_number == 3:
+			return WKBCoordinates(self.wkb, offset + 4, parse_UInt32(self.wkb, offset, self.int_parser)[0], self.point_parser)
+		return WKBGeometry(self.wkb, offset)
+
+	def __iter__(self) -> Iterator[Union[Point, WKBCoordinates, WKBGeometry]]:
+		if self.type_number <= 2:
+			return iter(self.points())
+		return (self[index] for index in range(self.num_parts))
+
+	def points(self) -> WKBCoordinates:
+		# the coordinates of a Point or LineString
+		if self.type_number == 1:
+			return WKBCoordinates(self.wkb, self.body, 1, self.point_parser)
+		if self.type_number == 2:
+			return WKBCoordinates(self.wkb, self.body + 4, self.num_parts, self.point_parser)
+		raise Exception(f"{self.type} has no coordinates of its own")
+
+	def part_offsets(self) -> List[Offset]:
+		# byte offset of each ring (Polygon) or member geometry, found once by jumping over coordinates.
+		# The offset just past the end of the geometry is kept in _end. The cached list is returned, not a copy
+		if self._part_offsets is None:
+			if self.type_number <= 2:
+				raise Exception(f"{self.type} has no sub-geometries")
+			wkb = self.wkb
+			offsets = []
+			offset = self.body + 4
+			for _ in range(self.num_parts):
+				if offset + 4 > len(wkb):
+					raise self.truncated()
+				offsets.append(offset)
+				if self.type_number == 3:
+					num_points, _ = parse_UInt32(wkb, offset, self.int_parser)
+					offset += 4 + self.point_parser.size * num_points
+				else:
+					end = skip_Geometry(wkb, offset)
+					if end is None:
+						raise self.truncated()
+					offset = end
+			if offset > len(wkb):
+				raise self.truncated()
+			self._part_offsets = offsets
+			self._end = offset
+		return self._part_offsets
+
+	def truncated(self) -> Exception:
+		return Exception(f"WKB data truncated. The {self.type} at byte {self.offset} runs past the end of the data ({len(self.wkb)} bytes)")
+
+	@property
+	def end(self) -> Offset:
+		"""The offset just past the end of this geometry"""
+		if self.type_number <= 2:
+			return self.points().end
+		self.part_offsets()
+		return self._end
+
+	def coordinates(self) -> Iterator[Point]:
+		"""Every point of the geometry, in the order they are stored"""
+		if self.type_number <= 2:
+			yield from self.points()
+			return
+		for part in self:
+			if isinstance(part, WKBCoordinates):
+				yield from part
+			elif isinstance(part, WKBGeometry):
+				yield from part.coordinates()
+
+	def __bytes__(self) -> bytes:
+		return bytes(self.wkb[self.offset:self.end])
+
+	def to_geojson(self):
+		return wkb_to_geojson(self.wkb[self.offset:self.end])
+
+	def to_wkt(self) -> str:
+		return wkb_to_wkt(self.wkb[self.offset:self.end])
+
+	def __repr__(self) -> str:
+		return f"<WKBGeometry {self.type} {self.dimensions} with {self.num_parts} parts>"
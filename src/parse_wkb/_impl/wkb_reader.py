@@ -0,0 +1,211 @@
+from __future__ import annotations
+from array import array
+from struct import Struct
+from struct import unpack_from
+import sys
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+# Shared primitives for the WKB readers.
+# Rather than slicing off the bytes consumed (which copies the whole remainder of the buffer every time)
+# each parser takes a memoryview and an integer offset, and returns the value together with the new offset.
+
+ByteOrderChar = str  # Literal[">", "<"]  # 0 = big = >, 1 = little = <
+
+Byte = int  # char
+UInt32 = int  # 4 byte int
+Double = float  # 8 byte float
+Offset = int  # position of the cursor within the wkb buffer
+WKBBuffer = Union[bytes, bytearray, memoryview]  # or anything else supporting the buffer protocol, see as_memoryview
+
+swap_byte_order_char = ">" if sys.byteorder == "little" else "<"  # coordinates in this byte order need byteswapping
+
+
+def as_memoryview(wkb) -> memoryview:
+	view = memoryview(wkb)
+	if view.format != "B" or view.ndim != 1:
+		view = view.cast("B")
+	return view
+
+
+def parse_Byte(wkb: memoryview, offset: Offset) -> Tuple[Byte, Offset]:
+	return wkb[offset], offset + 1
+
+
+def parse_UInt32(wkb: memoryview, offset: Offset, int_parser: str) -> Tuple[UInt32, Offset]:
+	return unpack_from(int_parser, wkb, offset)[0], offset + 4
+
+
+def parse_ByteOrder(wkb: memoryview, offset: Offset) -> Tuple[ByteOrderChar, Offset]:
+	byte, offset = parse_Byte(wkb, offset)
+	if byte == 0:
+		return ">", offset
+	elif byte == 1:
+		return "<", offset
+	raise Exception(f"Invalid byte order {byte}")
+
+
+def header_key(byte_order: ByteOrderChar, geom_type_integer: UInt32) -> Tuple[Byte, UInt32]:
+	# The key under which HeaderParser finds a geometry header in the MapGeometryHeader tables.
+	# The type number is always read little endian, so for big endian geometry the key holds it byte swapped
+	if byte_order == "<":
+		return 1, geom_type_integer
+	return 0, int.from_bytes(geom_type_integer.to_bytes(4, "big"), "little")
+
+
+def invalid_geometry_header(wkb: memoryview, offset: Offset, dimension_keys, type_keys) -> Exception:
+	byte_order, offset = parse_ByteOrder(wkb, offset)
+	geom_type_integer, offset = parse_UInt32(wkb, offset, byte_order + "I")
+	return invalid_geometry_type(geom_type_integer, dimension_keys, type_keys)
+
+
+def invalid_geometry_type(geom_type_integer: UInt32, dimension_keys, type_keys) -> Exception:
+	if geom_type_integer & EWKB_FLAGS:
+		type_key = geom_type_integer & ~EWKB_FLAGS
+		dimension_key = MapEWKBFlagsDimensionKey[geom_type_integer & (EWKB_Z_FLAG | EWKB_M_FLAG)]
+		if dimension_key not in dimension_keys:
+			return Exception(f"EWKB geometry type number {geom_type_integer:#010x} is not valid. {dimension_key} not in WKBDimensionSets.keys()")
+		return Exception(f"EWKB geometry type number {geom_type_integer:#010x} is not valid. {type_key} not in WKBGeometryTypeInfo.keys()")
+	if geom_type_integer // 1000 not in dimension_keys:
+		return Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer // 1000} not in WKBDimensionSets.keys()")
+	return Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer % 1000} not in WKBGeometryTypeInfo.keys()")
+
+
+def parse_PointRun(wkb: memoryview, offset: Offset, point_parser: Struct, num_points: int) -> Tuple[Iterator[Tuple[Double, ...]], Offset]:
+	# The points of a LineString or LinearRing are stored back to back, so the whole run is unpacked in one pass
+	end = offset + point_parser.size * num_points
+	if end > len(wkb):
+		raise Exception(f"WKB data truncated. {num_points} points need {end - offset} bytes but only {len(wkb) - offset} bytes remain")
+	return point_parser.iter_unpack(wkb[offset:end]), end
+
+
+def append_CoordinateRun(wkb: memoryview, offset: Offset, num_points: int, dimension_count: int, swap: bool, coordinates: array) -> Offset:
+	# Appends a run of coordinates to an array("d") straight from the WKB bytes, byteswapping them in bulk if needed,
+	# so that no Python float is created per coordinate
+	end = offset + 8 * dimension_count * num_points
+	if end > len(wkb):
+		raise Exception(f"WKB data truncated. {num_points} points need {end - offset} bytes but only {len(wkb) - offset} bytes remain")
+	if swap:
+		run = array("d")
+		run.frombytes(wkb[offset:end])
+		run.byteswap()
+		coordinates.extend(run)
+	else:
+		coordinates.frombytes(wkb[offset:end])
+	return end
+
+
+# Reads the byte order flag and geometry type number of a header with one call. See header_key
+HeaderParser = Struct("<BI")
+
+# Precompiled point parsers, so that the format string is not looked up for every point
+MapPointParser: Dict[Tuple[ByteOrderChar, int], Struct] = {
+	(byte_order, dimension_count): Struct(f"{byte_order}{dimension_count}d")
+	for byte_order in "<>"
+	for dimension_count in (2, 3, 4)
+}
+
+
+# PostGIS EWKB sets these flags in the geometry type number instead of adding 1000, 2000 or 3000 (ISO WKB)
+# If the SRID flag is set, the geometry type is followed by a uint32 SRID
+EWKB_Z_FLAG = 0x80000000
+EWKB_M_FLAG = 0x40000000
+EWKB_SRID_FLAG = 0x20000000
+EWKB_FLAGS = EWKB_Z_FLAG | EWKB_M_FLAG | EWKB_SRID_FLAG
+
+MapEWKBFlagsDimensionKey: Dict[int, int] = {
+	0: 0,
+	EWKB_Z_FLAG: 1,
+	EWKB_M_FLAG: 2,
+	EWKB_Z_FLAG | EWKB_M_FLAG: 3,
+}
+
+
+def geometry_type_codes(type_key: int, dimension_key: int) -> Iterator[Tuple[UInt32, bool]]:
+	# Every geometry type number meaning the same type and dimensions: the ISO number and its EWKB equivalents with and without an SRID.
+	# Yields (geom_type_integer, has_srid)
+	yield dimension_key * 1000 + type_key, False
+	for flags, flags_dimension_key in MapEWKBFlagsDimensionKey.items():
+		if flags_dimension_key == dimension_key:
+			if flags:
+				yield flags | type_key, False
+			yield flags | EWKB_SRID_FLAG | type_key, True
+
+
+# Every valid ISO and EWKB geometry type number, resolved to (type_key, dimension_key, has_srid), so that EWKB flags
+# are decoded by a single lookup. dimension_key is in the ISO `geom_type // 1000` convention
+MapGeometryTypeCode: Dict[UInt32, Tuple[int, int, bool]] = {
+	geom_type_integer: (type_key, dimension_key, has_srid)
+	for type_key in range(1, 8)
+	for dimension_key in range(4)
+	for geom_type_integer, has_srid in geometry_type_codes(type_key, dimension_key)
+}
+
+# Bytes from the start of a geometry to its body: byte order, geometry type and, for EWKB with the SRID flag, the SRID
+MapHeaderSize: Dict[bool, int] = {
+	False: 5,
+	True: 9,
+}
+
+
+def parse_SRID(wkb: memoryview, offset: Offset) -> Optional[UInt32]:
+	# The SRID of the EWKB geometry starting at `offset`, or None if its header has no SRID
+	byte_order, offset = parse_ByteOrder(wkb, offset)
+	int_parser = byte_order + "I"
+	geom_type_integer, offset = parse_UInt32(wkb, offset, int_parser)
+	if not geom_type_integer & EWKB_SRID_FLAG:
+		return None
+	return parse_UInt32(wkb, offset, int_parser)[0]
+
+
+# Dimension counts for the ISO `geom_type // 1000` convention, for walkers which only need to know how far to skip
+MapDimensionCount: Dict[int, int] = {
+	0: 2,
+	1: 3,
+	2: 3,
+	3: 4,
+}
+
+
+def skip_Geometry(wkb: memoryview, offset: Offset) -> Optional[Offset]:
+	# Finds where the geometry starting at `offset` ends, reading only headers and counts and jumping over coordinates.
+	# Returns None if `wkb` ends before the size of the geometry is known.
+	# The returned offset may be past the end of `wkb` if the geometry is truncated within a run of coordinates.
+	# Nothing is needed from a geometry once it is skipped, so nesting is handled by counting the geometries still to be
+	# skipped rather than by recursion
+	size = len(wkb)
+	pending = 1
+	while pending:
+		pending -= 1
+		if offset + 5 > size:
+			return None
+		byte_order, offset = parse_ByteOrder(wkb, offset)
+		int_parser = byte_order + "I"
+		geom_type_integer, offset = parse_UInt32(wkb, offset, int_parser)
+		type_code = MapGeometryTypeCode.get(geom_type_integer)
+		if type_code is None:
+			raise invalid_geometry_type(geom_type_integer, MapDimensionCount, range(1, 8))
+		geom_type_units, dimension_key, has_srid = type_code
+		dimension_count = MapDimensionCount[dimension_key]
+		if has_srid:
+			offset += 4
+		if geom_type_units == 1:
+			offset += 8 * dimension_count
+			continue
+		if offset + 4 > size:
+			return None
+		count, offset = parse_UInt32(wkb, offset, int_parser)
+		if geom_type_units == 2:
+			offset += 8 * dimension_count * count
+		elif geom_type_units == 3:
+			for _ in range(count):
+				if offset + 4 > size:
+					return None
+				num_points, offset = parse_UInt32(wkb, offset, int_parser)
+				offset += 8 * dimension_count * num_points
+		else:
+			pending += count
+	return offset
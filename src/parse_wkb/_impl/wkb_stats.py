@@ -0,0 +1,238 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from functools import partial
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from . import geojson_to_wkb as encoder
+from . import speedups
+from . import wkb_walker
+from .geojson_to_wkb import Flavor
+from .geojson_to_wkb import encode_Geometry
+from .geojson_to_wkb import get_srid
+from .geojson_to_wkb import map_type_number_depth_and_encoder
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import Offset
+from .wkb_walker import MapGeometryTypeName
+from .wkb_walker import WKBBuilder
+from .wkb_walker import walk_Geometry
+
+# Opt-in statistics for the readers and geojson_to_wkb.
+# walk_Geometry and geojson_to_wkb each test a module level `profiler` hook, which is None unless collect_stats() is
+# active, so collecting nothing costs one test per geometry.
+#
+# While collecting, each WKB geometry is walked with its builder wrapped in a TimingBuilder, which times the builder
+# calls and counts vertices and nesting depth. The time is split into
+#   walk_seconds   reading headers, counts and runs of coordinates (byte swapping included), outside the builder
+#   build_seconds  making the output from the runs (the lists of wkb_to_geojson, the text of wkb_to_wkt, ...)
+# For geojson_to_wkb, walk_seconds is the pass which sizes the output and build_seconds the pass which writes it.
+# The compiled core cannot say where its time goes, so the pure python backend is used while collecting.
+#
+# Records are kept per (operation, geometry type) of the top level geometry, and can also be passed one at a time to
+# a callback (eg. to feed histograms in a metrics system).
+
+Operation = str  # Literal["wkb_to_geojson", "wkb_to_wkt", "wkb_to_geojson_str", "wkb_to_abstract", "wkb_to_twkb", "walk_wkb", "geojson_to_wkb"]
+
+
+class GeometryRecord(NamedTuple):
+	operation: Operation
+	geometry_type: str  # type of the top level geometry, eg. "MultiPolygon"
+	wkb_bytes: int  # bytes of WKB read, or written by geojson_to_wkb
+	vertices: int
+	depth: int  # nesting of Multi* and GeometryCollection geometry, 0 for Point, LineString and Polygon
+	walk_seconds: float
+	build_seconds: float
+	output_bytes: int  # characters of text written, or bytes of WKB or TWKB. 0 for wkb_to_geojson, wkb_to_abstract and other builders of objects
+
+
+class TypeStats:
+	"""Totals of the GeometryRecords of one operation and geometry type"""
+	__slots__ = ("calls", "wkb_bytes", "vertices", "max_depth", "walk_seconds", "build_seconds", "output_bytes")
+
+	def __init__(self):
+		self.calls = 0
+		self.wkb_bytes = 0
+		self.vertices = 0
+		self.max_depth = 0
+		self.walk_seconds = 0.0
+		self.build_seconds = 0.0
+		self.output_bytes = 0
+
+	def add(self, record: GeometryRecord) -> None:
+		self.calls += 1
+		self.wkb_bytes += record.wkb_bytes
+		self.vertices += record.vertices
+		self.max_depth = max(self.max_depth, record.depth)
+		self.walk_seconds += record.walk_seconds
+		self.build_seconds += record.build_seconds
+		self.output_bytes += record.output_bytes
+
+	def as_dict(self) -> dict:
+		return {name: getattr(self, name) for name in self.__slots__}
+
+	def __repr__(self) -> str:
+		return f"<TypeStats {self.calls} calls, {self.vertices} vertices>"
+
+
+class WKBStats:
+	"""The statistics gathered by collect_stats(). `types` maps (operation, geometry type) to TypeStats"""
+
+	def __init__(self, callback: Optional[Callable[[GeometryRecord], None]] = None):
+		self.types: Dict[Tuple[Operation, str], TypeStats] = {}
+		self.callback = callback
+		self.lock = Lock()
+
+	def add(self, record: GeometryRecord) -> None:
+		with self.lock:
+			key = (record.operation, record.geometry_type)
+			stats = self.types.get(key)
+			if stats is None:
+				stats = self.types[key] = TypeStats()
+			stats.add(record)
+		if self.callback is not None:
+			self.callback(record)
+
+	def as_dicts(self) -> List[dict]:
+		"""One dict per operation and geometry type, for export (eg. as JSON)"""
+		with self.lock:
+			return [
+				{"operation": operation, "geometry_type": geometry_type, **stats.as_dict()}
+				for (operation, geometry_type), stats in sorted(self.types.items())
+			]
+
+	def report(self) -> str:
+		"""The statistics as a table"""
+		lines = [f"{'operation':<20} {'type':<19} {'calls':>9} {'WKB MB':>9} {'vertices':>11} {'depth':>5} {'walk s':>9} {'build s':>9} {'output MB':>9}"]
+		for row in self.as_dicts():
+			lines.append(
+				f"{row['operation']:<20} {row['geometry_type']:<19} {row['calls']:>9} {row['wkb_bytes'] / 1e6:>9.3f} {row['vertices']:>11} "
+				f"{row['max_depth']:>5} {row['walk_seconds']:>9.4f} {row['build_seconds']:>9.4f} {row['output_bytes'] / 1e6:>9.3f}"
+			)
+		return "\n".join(lines)
+
+
+class TimingBuilder(WKBBuilder):
+	# Passes every call on to `builder`, timing it and counting vertices and nesting depth on the way
+	__slots__ = ("builder", "seconds", "vertices", "depth", "max_depth", "type_key")
+
+	def __init__(self, builder: WKBBuilder):
+		self.builder = builder
+		self.seconds = 0.0
+		self.vertices = 0
+		self.depth = 0
+		self.max_depth = 0
+		self.type_key = 0
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: list) -> None:
+		start = perf_counter()
+		self.builder.geometry(type_key, dimension_key, byte_order, srid, runs)
+		self.seconds += perf_counter() - start
+		if not self.type_key:
+			self.type_key = type_key
+		self.vertices += sum(map(len, runs)) // MapDimensionCount[dimension_key]
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		start = perf_counter()
+		self.builder.begin_collection(type_key, dimension_key, byte_order, srid, count)
+		self.seconds += perf_counter() - start
+		if not self.type_key:
+			self.type_key = type_key
+		self.depth += 1
+		self.max_depth = max(self.max_depth, self.depth)
+
+	def end_collection(self) -> None:
+		start = perf_counter()
+		self.builder.end_collection()
+		self.seconds += perf_counter() - start
+		self.depth -= 1
+
+
+def profile_walk(stats: WKBStats, wkb: memoryview, offset: Offset, builder: WKBBuilder, max_depth: Optional[int], max_elements: Optional[int]) -> Offset:
+	# walk_Geometry, recording a GeometryRecord. Text builders append to an `out` list, whose growth is the output.
+	# Other builders count as output the length of their result if it is bytes (wkb_to_twkb), and 0 otherwise.
+	# The operation recorded is the `operation` class attribute of the builder
+	timer = TimingBuilder(builder)
+	out = getattr(builder, "out", None)
+	pieces = 0 if out is None else len(out)
+	start = perf_counter()
+	end = walk_Geometry(wkb, offset, timer, max_depth, max_elements, False)
+	seconds = perf_counter() - start
+	if out is None:
+		result = builder.result()
+		output_bytes = len(result) if isinstance(result, bytes) else 0
+	else:
+		output_bytes = sum(map(len, out[pieces:]))
+	stats.add(GeometryRecord(
+		getattr(builder, "operation", "walk_wkb"),
+		MapGeometryTypeName[timer.type_key],
+		end - offset,
+		timer.vertices,
+		timer.max_depth,
+		seconds - timer.seconds,
+		timer.seconds,
+		output_bytes,
+	))
+	return end
+
+
+def measure_GeoJSON(geojson: Dict) -> Tuple[int, int]:
+	# (vertices, depth) of a GeoJSON geometry
+	type_name = geojson["type"]
+	if type_name == "GeometryCollection":
+		vertices = depth = 0
+		for member in geojson["geometries"]:
+			member_vertices, member_depth = measure_GeoJSON(member)
+			vertices += member_vertices
+			depth = max(depth, member_depth)
+		return vertices, depth + 1
+	items = [geojson["coordinates"]]
+	nesting = map_type_number_depth_and_encoder[type_name][1]
+	assert nesting is not None  # None only for GeometryCollection, handled above
+	for _ in range(nesting):
+		items = [item for sub_items in items for item in sub_items]
+	return len(items), 1 if type_name.startswith("Multi") else 0
+
+
+def profile_encode(stats: WKBStats, geojson: Dict, flavor: Flavor, srid: Optional[int]) -> bytes:
+	# geojson_to_wkb, timing the pass which sizes the output and the pass which writes it
+	start = perf_counter()
+	srid = get_srid(geojson, flavor, srid)
+	buffer = bytearray(map_type_number_depth_and_encoder[geojson["type"]][3](geojson) + (0 if srid is None else 4))
+	sized = perf_counter()
+	with memoryview(buffer) as view:
+		encode_Geometry(geojson, view, 0, flavor, srid)
+	written = perf_counter()
+	vertices, depth = measure_GeoJSON(geojson)
+	stats.add(GeometryRecord("geojson_to_wkb", geojson["type"], len(buffer), vertices, depth, sized - start, written - sized, len(buffer)))
+	return bytes(buffer)
+
+
+@contextmanager
+def collect_stats(callback: Optional[Callable[[GeometryRecord], None]] = None) -> Iterator[WKBStats]:
+	"""
+	Collects statistics of every geometry read or written by this process within the `with` block:
+
+		with collect_stats() as stats:
+			rows = list(wkb_to_wkt_many(wkbs))
+		print(stats.report())
+
+	`callback`, if given, is called with a GeometryRecord for each geometry as it is done.
+	The pure python backend is used within the block, as the compiled core cannot report where its time goes.
+	Work done in other processes (eg. `parallel=True`) is not counted.
+	"""
+	stats = WKBStats(callback)
+	previous = wkb_walker.profiler, encoder.profiler, speedups.compiled
+	wkb_walker.profiler = partial(profile_walk, stats)
+	encoder.profiler = partial(profile_encode, stats)
+	speedups.compiled = None
+	try:
+		yield stats
+	finally:
+		wkb_walker.profiler, encoder.profiler, speedups.compiled = previous
@@ -0,0 +1,90 @@
+from __future__ import annotations
+from struct import Struct
+from typing import BinaryIO
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import Union
+from typing import cast
+
+from .wkb_reader import Offset
+from .wkb_reader import as_memoryview
+from .wkb_reader import skip_Geometry
+
+# Reads a sequence of WKB records one at a time, from either
+#  - something supporting the buffer protocol (bytes, mmap.mmap, ...) which is walked in place without copying, or
+#  - a binary file object, which is read in chunks so that memory use is bounded by the largest record.
+#
+# framing="raw" expects geometries back to back with nothing in between. The length of each record is found by
+#   walking its headers and counts (skip_Geometry), without decoding any coordinates.
+# framing="length_prefixed" expects each geometry to be preceded by its length in bytes as a little endian uint32.
+
+Framing = str  # Literal["raw", "length_prefixed"]
+WKBSource = Union[bytes, bytearray, memoryview, BinaryIO]
+
+DEFAULT_READ_SIZE = 1 << 20
+
+LengthPrefixParser = Struct("<I")
+
+
+def next_record(wkb: memoryview, offset: Offset, framing: Framing) -> Tuple[Offset, Optional[Offset]]:
+	# Returns (start, end) of the record starting at `offset`, or None if `wkb` ends before the end of the record is known
+	if framing == "raw":
+		return offset, skip_Geometry(wkb, offset)
+	if framing == "length_prefixed":
+		if offset + 4 > len(wkb):
+			return offset, None
+		return offset + 4, offset + 4 + LengthPrefixParser.unpack_from(wkb, offset)[0]
+	raise Exception(f"Unknown WKB framing {framing!r}. Expected 'raw' or 'length_prefixed'")
+
+
+def iter_wkb_buffer(view: memoryview, framing: Framing) -> Iterator[memoryview]:
+	offset = 0
+	while offset < len(view):
+		start, end = next_record(view, offset, framing)
+		if end is None or end > len(view):
+			raise Exception(f"WKB stream truncated. The record at byte {offset} runs past the end of the data ({len(view)} bytes)")
+		yield view[start:end]
+		offset = end
+
+
+def iter_wkb_file(source: BinaryIO, framing: Framing, read_size: int) -> Iterator[bytes]:
+	buffer = bytearray()
+	offset = 0
+	position = 0  # position of buffer[0] within the stream, for error messages
+	end_of_stream = False
+	while True:
+		with memoryview(buffer) as view:
+			start, end = next_record(view, offset, framing) if offset < len(view) else (offset, None)
+			if end is not None and end <= len(view):
+				record = bytes(view[start:end])
+				offset = end
+			else:
+				record = None
+				missing = 0 if end is None else end - len(view)
+		if record is not None:
+			yield record
+			continue
+		if end_of_stream:
+			if offset < len(buffer):
+				raise Exception(f"WKB stream truncated. The record at byte {position + offset} runs past the end of the stream")
+			return
+		# drop the records already yielded, then read at least enough to finish the current record
+		del buffer[:offset]
+		position += offset
+		offset = 0
+		chunk = source.read(max(read_size, missing))
+		if chunk:
+			buffer += chunk
+		else:
+			end_of_stream = True
+
+
+def iter_wkb(source: WKBSource, framing: Framing = "raw", read_size: int = DEFAULT_READ_SIZE) -> Iterator[Union[bytes, memoryview]]:
+	if read_size < 1:
+		raise Exception(f"read_size must be at least 1, got {read_size}")
+	try:
+		view = as_memoryview(source)
+	except TypeError:
+		return iter_wkb_file(cast(BinaryIO, source), framing, read_size)
+	return iter_wkb_buffer(view, framing)
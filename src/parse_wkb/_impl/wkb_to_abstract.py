@@ -1,13 +1,27 @@
 from __future__ import annotations
-from struct import unpack
-from typing import Any, Dict
-from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Sequence
 # from typing import Literal
 from typing import Tuple
 from typing import Union
 import warnings
 
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_walker import MapExtraDimensionNames
+from .wkb_walker import Run
+from .wkb_walker import WKBBuilder
+from .wkb_walker import walk_Geometry
+from .wkb_walker import with_settings
+
 DimensionCount = int  # Literal[2, 3, 4]
 DimensionNames = str  # Literal["XY", "XYZ", "XYM", "XYZM"]
 
@@ -27,121 +41,121 @@ Polygon = List[LinearRing]
 Geometry = Dict[str, Union[str, List[Union[Point, LineString, Polygon, List[Point], List[LineString]]]]]
 
 
-def multi_parse(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, func: Callable[[bytearray, str, str, DimensionCount], Tuple[Any, bytearray]], repeat_count: int) -> Tuple[Tuple[Any, ...], bytearray]:
-	# oh Haskell, how I miss thee, thine curried functions, thine folds. Here I wallow in constant reinvention, apart from thine warm aura of glorious composition.
-	result = []
-	for _ in range(repeat_count):
-		item_result, wkb = func(wkb, int_parser, point_parser, dimension_count)
-		result.append(item_result)
-	return tuple(result), wkb
-
-
-def parse_Byte(wkb: bytearray) -> Tuple[Byte, bytearray]:
-	return wkb[0], wkb[1:]
-
-
-def parse_UInt32(wkb: bytearray, int_parser) -> Tuple[UInt32, bytearray]:
-	return unpack(int_parser, wkb[:4])[0], wkb[4:]
-
-
-# def parse_Double(wkb: bytearray, int_parser:str, point_parser:str) -> (Double, bytearray):
-# 	# hopefully parses 8 byte IEEE 754 Double
-# 	return unpack(byte_order[0] + " d", wkb[:8])[0], wkb[8:]
-
-
-def parse_Point(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[Point, bytearray]:
-	return tuple(unpack(point_parser, wkb[:8 * dimension_count])), wkb[8 * dimension_count:]
-
-
-def parse_LinearRing(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[LinearRing, bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	points, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_Point, num_points)
-	return (num_points, *points), wkb
-
-
-def parse_LineString(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[LineString, bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	points, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_Point, num_points)
-	return (num_points, *points), wkb
-
-
-def parse_Polygon(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[Polygon, bytearray]:
-	# TODO: The first and last point of a linear ring should be the same value. enforce?
-	num_rings, wkb = parse_UInt32(wkb, int_parser)
-	polygon, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_LinearRing, num_rings)
-	return (num_rings, *polygon), wkb
-
-
-def parse_MultiPoint(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[list[Point], bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	points, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_Geometry, num_points)
-	return (num_points, *points), wkb
-
-
-def parse_MultiLineString(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[list[LineString], bytearray]:
-	num_strings, wkb = parse_UInt32(wkb, int_parser)
-	linestrings, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_Geometry, num_strings)
-	return (num_strings, *linestrings), wkb
-
-
-def parse_MultiPolygon(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[list[Polygon], bytearray]:
-	num_polygons, wkb = parse_UInt32(wkb, int_parser)
-	polygons, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_Geometry, num_polygons)
-	return (num_polygons, *polygons), wkb
-
-
-def parse_GeometryCollection(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[list[Geometry], bytearray]:
-	num_geometries, wkb = parse_UInt32(wkb, int_parser)
-	geoms, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, parse_Geometry, num_geometries)
-	return (num_geometries, *geoms), wkb
+def points_of(run: Sequence[Double], dimension_count: DimensionCount) -> List[Tuple[Double, ...]]:
+	return list(zip(*[iter(run)] * dimension_count))
+
+
+class AbstractBuilder(WKBBuilder):
+	# Builds the abstract representation of a geometry from the parts given by walk_Geometry.
+	# `stack` holds the partly built tuple items of each collection being built
+	__slots__ = ("stack", "value")
+	operation = "wkb_to_abstract"
+
+	def __init__(self):
+		self.stack: List[list] = []
+		self.value: Optional[tuple] = None
+
+	def add(self, item: tuple) -> None:
+		if self.stack:
+			self.stack[-1].append(item)
+		else:
+			self.value = item
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: List[Run]) -> None:
+		head: tuple = MapHead[byte_order, type_key, dimension_key]
+		if srid is not None:
+			head += (("SRID", srid),)
+		if type_key == 1:
+			self.add((*head, *runs[0]))
+			return
+		dimension_count = MapDimensionCount[dimension_key]
+		if type_key == 2:
+			run = runs[0]
+			self.add((*head, len(run) // dimension_count, *points_of(run, dimension_count)))
+			return
+		self.add((*head, len(runs), *[(len(run) // dimension_count, *points_of(run, dimension_count)) for run in runs]))
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		head: tuple = MapHead[byte_order, type_key, dimension_key]
+		if srid is not None:
+			head += (("SRID", srid),)
+		self.stack.append([*head, count])
+
+	def end_collection(self) -> None:
+		self.add(tuple(self.stack.pop()))
+
+	def result(self) -> tuple:
+		assert self.value is not None
+		return self.value
+
+
+MapByteOrderName = {
+	">": "BEnd",
+	"<": "LEnd",
+}
 
+MapGeometryTypeName = {
+	1: "Point",
+	2: "LineString",
+	3: "Polygon",
+	4: "MultiPoint",
+	5: "MultiLineString",
+	6: "MultiPolygon",
+	7: "Geometrycollection",
+}
 
-def parse_Geometry(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount) -> Tuple[Geometry, bytearray]:
-	byte_order, byte_order_name, wkb = parse_ByteOrder(wkb)
-	int_parser = byte_order + "I"
-	geom_type_integer, wkb = parse_UInt32(wkb, int_parser)
-	dimension_count, extra_dimension_names, point_parser = MapExtraDimensionNames.get(geom_type_integer // 1000, (None, None))
-	if dimension_count is None:
-		raise Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer // 1000} not in WKBDimensionSets.keys()")
-	point_parser = byte_order + point_parser
-	type_name, parser = MapGeometryTypeNameAndParser.get(geom_type_integer % 1000, (None, None))
-	if type_name is None:
-		raise Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer % 1000} not in WKBGeometryTypeInfo.keys()")
-	if parser is None:
-		raise Exception(f"Parser is not implemented for {type_name}")
-	geom, wkb = parser(wkb, int_parser, point_parser, dimension_count)
-	return (byte_order_name, (type_name, extra_dimension_names), *geom), wkb
 
+# (byte_order, type_key, dimension_key): the first items of the tuple of each geometry
+MapHead = {
+	(byte_order, type_key, dimension_key): (byte_order_name, (type_name, extra_dimension_names))
+	for byte_order, byte_order_name in MapByteOrderName.items()
+	for type_key, type_name in MapGeometryTypeName.items()
+	for dimension_key, (dimension_count, extra_dimension_names) in MapExtraDimensionNames.items()
+}
 
-def parse_ByteOrder(wkb: bytearray) -> Tuple[ByteOrderChar, bytearray]:
-	byte, wkb = parse_Byte(wkb)
-	if byte == 0:
-		return ">", "BEnd", wkb
-	elif byte == 1:
-		return "<", "LEnd", wkb
-	raise Exception(f"Invalid byte order {byte}")
 
+def parse_Geometry(wkb: memoryview, offset: Offset) -> Tuple[tuple, Offset]:
+	builder = AbstractBuilder()
+	offset = walk_Geometry(wkb, offset, builder)
+	return builder.result(), offset
 
-MapExtraDimensionNames: dict[int: Tuple[DimensionCount, DimensionNames]] = {
-	0: (2, "XY", "2d"),
-	1: (3, "XYZ", "3d"),
-	2: (3, "XYM", "3d"),
-	3: (4, "XYZM", "4d")
-}
 
-MapGeometryTypeNameAndParser = {
-	1: ("Point", parse_Point),
-	2: ("LineString", parse_LineString),
-	3: ("Polygon", parse_Polygon),
-	4: ("MultiPoint", parse_MultiPoint),
-	5: ("MultiLineString", parse_MultiLineString),
-	6: ("MultiPolygon", parse_MultiPolygon),
-	7: ("Geometrycollection", parse_GeometryCollection),
-}
+def wkb_to_abstract(wkb: WKBBuffer) -> list[Geometry]:
+	with as_memoryview(wkb) as view:
+		result, offset = parse_Geometry(view, 0)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	return result
 
 
-def wkb_to_abstract(wkb: bytearray) -> list[Geometry]:
-	result, wkb = parse_Geometry(wkb, None, None, None)
-	if len(wkb) > 0:
-		warnings.warn(f"WKB data not fully parsed. {len(wkb)} bytes remaining")
-	return result
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0) -> Iterator[Optional[tuple]]:
+	# Same as calling wkb_to_abstract() on each item.
+	# If an `errors` list is supplied, rows which fail are yielded as None and (row_index, exception) is appended to `errors`
+	for index, wkb in enumerate(wkbs, start):
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+			result, offset = parse_Geometry(view, 0)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		if offset < len(view):
+			warnings.warn(f"WKB data not fully parsed. {len(view) - offset} bytes remaining in row {index}")
+		yield result
+
+
+def wkb_to_abstract_many(
+	wkbs: Iterable[WKBBuffer],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Optional[tuple]]:
+	if parallel:
+		return parallel_decode(with_settings(parse_many), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors)
@@ -0,0 +1,167 @@
+from __future__ import annotations
+from array import array
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+import warnings
+
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import MapGeometryTypeCode
+from .wkb_reader import MapHeaderSize
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import append_CoordinateRun
+from .wkb_reader import as_memoryview
+from .wkb_reader import invalid_geometry_type
+from .wkb_reader import parse_ByteOrder
+from .wkb_reader import parse_UInt32
+from .wkb_reader import swap_byte_order_char
+
+# Decodes a batch of WKB into the GeoArrow "native" columnar layout: one flat array("d") of interleaved coordinates,
+# plus one array("I") of offsets per level of nesting, outermost first. Offsets index into the next level down,
+# the innermost into coordinates (counted in points, not doubles). Each array starts with 0 and is one longer than
+# the number of items it describes.
+#
+#   Point            []
+#   LineString       [geometry -> point]
+#   Polygon          [geometry -> ring, ring -> point]
+#   MultiPoint       [geometry -> point]
+#   MultiLineString  [geometry -> linestring, linestring -> point]
+#   MultiPolygon     [geometry -> polygon, polygon -> ring, ring -> point]
+#
+# Runs of coordinates are appended straight from the WKB with array.frombytes, so no Python float is created per
+# coordinate and the result takes 8 bytes per double. The arrays support the buffer protocol, so
+# numpy.frombuffer(result.coordinates).reshape(-1, len(result.dimensions)) wraps them without copying.
+#
+# A batch may mix single and multi geometries of the same family (eg. Polygon and MultiPolygon), in which case
+# the multi layout is used. GeometryCollection has no native layout and is rejected.
+
+Family = str  # Literal["point", "linestring", "polygon"]
+Dimensions = str  # Literal["xy", "xyz", "xym", "xyzm"]
+
+
+class GeoArrowArray(NamedTuple):
+	geometry_type: str  # GeoArrow extension name, eg. "geoarrow.multipolygon"
+	dimensions: Dimensions
+	coordinates: array  # array("d"), interleaved
+	offsets: List[array]  # array("I") per level of nesting, outermost first
+
+
+# type_units: (family, is_multi)
+MapGeometryTypeFamily: Dict[int, Tuple[Family, bool]] = {
+	1: ("point", False),
+	2: ("linestring", False),
+	3: ("polygon", False),
+	4: ("point", True),
+	5: ("linestring", True),
+	6: ("polygon", True),
+}
+
+# Levels of offsets in the multi layout of each family
+MapFamilyDepth: Dict[Family, int] = {
+	"point": 1,
+	"linestring": 2,
+	"polygon": 3,
+}
+
+MapDimensionNames: Dict[int, Dimensions] = {
+	0: "xy",
+	1: "xyz",
+	2: "xym",
+	3: "xyzm",
+}
+
+
+def parse_Header(wkb: memoryview, offset: Offset) -> Tuple[str, bool, int, int, Offset]:
+	byte_order, _ = parse_ByteOrder(wkb, offset)
+	int_parser = byte_order + "I"
+	geom_type_integer, _ = parse_UInt32(wkb, offset + 1, int_parser)
+	type_code = MapGeometryTypeCode.get(geom_type_integer)
+	if type_code is None:
+		raise invalid_geometry_type(geom_type_integer, MapDimensionCount, range(1, 8))
+	type_units, dimension_key, has_srid = type_code
+	return int_parser, byte_order == swap_byte_order_char, type_units, dimension_key, offset + MapHeaderSize[has_srid]
+
+
+def append_Point(wkb: memoryview, offset: Offset, int_parser: str, swap: bool, dimension_count: int, coordinates: array, offsets: List[array]) -> Offset:
+	return append_CoordinateRun(wkb, offset, 1, dimension_count, swap, coordinates)
+
+
+def append_LineString(wkb: memoryview, offset: Offset, int_parser: str, swap: bool, dimension_count: int, coordinates: array, offsets: List[array]) -> Offset:
+	num_points, offset = parse_UInt32(wkb, offset, int_parser)
+	offset = append_CoordinateRun(wkb, offset, num_points, dimension_count, swap, coordinates)
+	offsets[-1].append(len(coordinates) // dimension_count)
+	return offset
+
+
+def append_Polygon(wkb: memoryview, offset: Offset, int_parser: str, swap: bool, dimension_count: int, coordinates: array, offsets: List[array]) -> Offset:
+	ring_offsets = offsets[-1]
+	num_rings, offset = parse_UInt32(wkb, offset, int_parser)
+	for _ in range(num_rings):
+		num_points, offset = parse_UInt32(wkb, offset, int_parser)
+		offset = append_CoordinateRun(wkb, offset, num_points, dimension_count, swap, coordinates)
+		ring_offsets.append(len(coordinates) // dimension_count)
+	offsets[-2].append(len(ring_offsets) - 1)
+	return offset
+
+
+MapFamilyAppender = {
+	"point": append_Point,
+	"linestring": append_LineString,
+	"polygon": append_Polygon,
+}
+
+
+def wkb_to_geoarrow(wkbs: Iterable[WKBBuffer]) -> GeoArrowArray:
+	"""
+	Decodes an iterable of WKB blobs of one geometry type (single and multi variants may be mixed) into flat
+	coordinate and offset arrays in the GeoArrow layout. See GeoArrowArray.
+	"""
+	coordinates = array("d")
+	offsets: List[array] = []
+	family: Optional[Family] = None
+	dimension_key = -1  # until the first row is read
+	dimension_count = 0
+	any_multi = False
+	append_member = append_Point
+	for index, wkb in enumerate(wkbs):
+		with as_memoryview(wkb) as view:
+			int_parser, swap, type_units, row_dimension_key, offset = parse_Header(view, 0)
+			row_layout = MapGeometryTypeFamily.get(type_units)
+			if row_layout is None:
+				raise Exception(f"GeometryCollection (row {index}) has no GeoArrow layout")
+			row_family, is_multi = row_layout
+			if family is None:
+				family, dimension_key = row_family, row_dimension_key
+				dimension_count = MapDimensionCount[dimension_key]
+				offsets = [array("I", [0]) for _ in range(MapFamilyDepth[family])]
+				append_member = MapFamilyAppender[family]
+			elif row_family != family:
+				raise Exception(f"Mixed geometry families. Row {index} is a {row_family} but earlier rows are {family}s")
+			if row_dimension_key != dimension_key:
+				raise Exception(f"Mixed dimensions. Row {index} is {MapDimensionNames[row_dimension_key]} but earlier rows are {MapDimensionNames[dimension_key]}")
+			if is_multi:
+				any_multi = True
+				num_members, offset = parse_UInt32(view, offset, int_parser)
+				for _ in range(num_members):
+					int_parser, swap, member_type_units, member_dimension_key, offset = parse_Header(view, offset)
+					if member_type_units != type_units - 3 or member_dimension_key != dimension_key:
+						raise Exception(f"Invalid member of a multi geometry in row {index}: geometry type number {member_dimension_key * 1000 + member_type_units}")
+					offset = append_member(view, offset, int_parser, swap, dimension_count, coordinates, offsets)
+			else:
+				offset = append_member(view, offset, int_parser, swap, dimension_count, coordinates, offsets)
+			remaining = len(view) - offset
+		if remaining > 0:
+			warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining in row {index}")
+		offsets[0].append(len(offsets[1]) - 1 if len(offsets) > 1 else len(coordinates) // dimension_count)
+
+	if family is None:
+		return GeoArrowArray("geoarrow.point", "xy", coordinates, [])
+	if not any_multi:
+		# every geometry holds exactly one member, so the outermost level of offsets is 0, 1, 2, ... and carries nothing
+		offsets = offsets[1:]
+		return GeoArrowArray(f"geoarrow.{family}", MapDimensionNames[dimension_key], coordinates, offsets)
+	return GeoArrowArray(f"geoarrow.multi{family}", MapDimensionNames[dimension_key], coordinates, offsets)
@@ -1,13 +1,30 @@
 from __future__ import annotations
-from struct import unpack
-from typing import Any, Dict
-from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Sequence
 # from typing import Literal
 from typing import Tuple
 from typing import Union
 import warnings
 
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from . import speedups
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_reader import parse_SRID
+from .wkb_walker import MapExtraDimensionNames
+from .wkb_walker import Run
+from .wkb_walker import WKBBuilder
+from .wkb_walker import compiled_limits
+from .wkb_walker import walk_Geometry
+from .wkb_walker import with_settings
+
 DimensionCount = int  # Literal[2, 3, 4]
 DimensionNames = str  # Literal["XY", "XYZ", "XYM", "XYZM"]
 
@@ -24,124 +41,155 @@ LineString = List[Point]
 Polygon = List[LinearRing]
 
 # TODO: python 3.8 will have TypedDict but sadly our current target is 3.7
-Geometry = Dict[str, Union[str, List[Union[Point, LineString, Polygon, List[Point], List[LineString]]]]]
-
-
-def multi_parse(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool, func: Callable[[bytearray, str, str, DimensionCount, bool], Tuple[Any, bytearray]], repeat_count: int) -> Tuple[Tuple[Any, ...], bytearray]:
-	# oh Haskell, how I miss thee, thine curried functions, thine folds. Here I wallow in constant reinvention, apart from thine warm aura of glorious composition.
-	result = []
-	for _ in range(repeat_count):
-		item_result, wkb = func(wkb, int_parser, point_parser, dimension_count, raw)
-		result.append(item_result)
-	return result, wkb
-
-
-def parse_Byte(wkb: bytearray) -> Tuple[Byte, bytearray]:
-	return wkb[0], wkb[1:]
-
-
-def parse_UInt32(wkb: bytearray, int_parser) -> Tuple[UInt32, bytearray]:
-	return unpack(int_parser, wkb[:4])[0], wkb[4:]
-
-
-# def parse_Double(wkb: bytearray, int_parser:str, point_parser:str) -> (Double, bytearray):
-# 	# hopefully parses 8 byte IEEE 754 Double
-# 	return unpack(byte_order[0] + " d", wkb[:8])[0], wkb[8:]
-
-
-def parse_Point(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[Point, bytearray]:
-	return list(unpack(point_parser, wkb[:8 * dimension_count])), wkb[8 * dimension_count:]
-
-
-def parse_LinearRing(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[LinearRing, bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Point, num_points)
-
-
-def parse_LineString(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[LineString, bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Point, num_points)
-
-
-def parse_Polygon(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[Polygon, bytearray]:
-	# TODO: The first and last point of a linear ring should be the same value. enforce?
-	num_rings, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_LinearRing, num_rings)
-
-
-def parse_MultiPoint(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[Point], bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	points, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Geometry, num_points)
-	return points, wkb
-
-
-def parse_MultiLineString(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[LineString], bytearray]:
-	num_strings, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Geometry, num_strings)
-
-
-def parse_MultiPolygon(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[Polygon], bytearray]:
-	num_polygons, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Geometry, num_polygons)
+# the dict is the crs member, present when the EWKB has an SRID. See srid_crs
+Geometry = Dict[str, Union[str, dict, List[Union[Point, LineString, Polygon, List[Point], List[LineString]]]]]
+
+
+def points_of(run: Sequence[Double], dimension_count: DimensionCount) -> List[Point]:
+	# interleaved coordinates as a list of points
+	return list(map(list, zip(*[iter(run)] * dimension_count)))
+
+
+class GeoJSONBuilder(WKBBuilder):
+	# Builds the GeoJSON dict of a geometry from the parts given by walk_Geometry.
+	# `stack` holds (type_key, members) for each collection being built. The members of Multi* geometry are stored as
+	# bare coordinates, and the members of a GeometryCollection as geometry dicts
+	__slots__ = ("stack", "value")
+	operation = "wkb_to_geojson"
+
+	def __init__(self):
+		self.stack: List[Tuple[int, list]] = []
+		self.value: Optional[dict] = None
+
+	def add(self, type_key: int, body: list) -> None:
+		stack = self.stack
+		if stack and stack[-1][0] != 7:
+			stack[-1][1].append(body)
+			return
+		type_name, rest_key_name = MapGeometryTypeNameAndKey[type_key]
+		geometry = {
+			"type":        type_name,
+			rest_key_name: body
+		}
+		if stack:
+			stack[-1][1].append(geometry)
+		else:
+			self.value = geometry
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: List[Run]) -> None:
+		body: list
+		if type_key == 1:
+			body = list(runs[0])
+		elif type_key == 2:
+			body = points_of(runs[0], MapDimensionCount[dimension_key])
+		else:
+			dimension_count = MapDimensionCount[dimension_key]
+			body = [points_of(run, dimension_count) for run in runs]
+		# add(), inlined
+		stack = self.stack
+		if stack and stack[-1][0] != 7:
+			stack[-1][1].append(body)
+			return
+		type_name, rest_key_name = MapGeometryTypeNameAndKey[type_key]
+		geometry = {
+			"type":        type_name,
+			rest_key_name: body
+		}
+		if stack:
+			stack[-1][1].append(geometry)
+		else:
+			self.value = geometry
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		self.stack.append((type_key, []))
+
+	def end_collection(self) -> None:
+		self.add(*self.stack.pop())
+
+	def result(self) -> Geometry:
+		assert self.value is not None
+		return self.value
+
+
+MapGeometryTypeNameAndKey = {
+	1: ("Point", "coordinates"),
+	2: ("LineString", "coordinates"),
+	3: ("Polygon", "coordinates"),
+	4: ("MultiPoint", "coordinates"),
+	5: ("MultiLineString", "coordinates"),
+	6: ("MultiPolygon", "coordinates"),
+	7: ("GeometryCollection", "geometries"),
+}
 
+DimensionMask = speedups.dimension_mask(MapExtraDimensionNames)
 
-def parse_GeometryCollection(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[Geometry], bytearray]:
-	num_geometries, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, False, parse_Geometry, num_geometries)
 
+def parse_Geometry(wkb: memoryview, offset: Offset) -> Tuple[Geometry, Offset]:
+	builder = GeoJSONBuilder()
+	offset = walk_Geometry(wkb, offset, builder)
+	return builder.result(), offset
 
-def parse_Geometry(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[Geometry, bytearray]:
-	byte_order, wkb = parse_ByteOrder(wkb)
-	int_parser = byte_order + "I"
-	geom_type_integer, wkb = parse_UInt32(wkb, int_parser)
-	dimension_count, extra_dimension_names, point_parser = MapExtraDimensionNames.get(geom_type_integer // 1000, (None, None))
-	if dimension_count is None:
-		raise Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer // 1000} not in WKBDimensionSets.keys()")
-	point_parser = byte_order + point_parser
-	type_name, rest_key_name, parser = MapGeometryTypeNameAndParser.get(geom_type_integer % 1000, (None, None))
-	if type_name is None:
-		raise Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer % 1000} not in WKBGeometryTypeInfo.keys()")
-	if parser is None:
-		raise Exception(f"Parser is not implemented for {type_name}")
-	geom, wkb = parser(wkb, int_parser, point_parser, dimension_count, True)
-	rest_props = "coordinates"
-	if raw:
-		return geom, wkb
-	return {
-		"type":        type_name,
-		rest_key_name: geom
-	}, wkb
 
+def srid_crs(srid: int) -> dict:
+	# The SRID of EWKB as a named crs member (GeoJSON 2008). RFC 7946 dropped crs, but it is still the only place for it
+	return {"type": "name", "properties": {"name": f"EPSG:{srid}"}}
 
-def parse_ByteOrder(wkb: bytearray) -> Tuple[ByteOrderChar, bytearray]:
-	byte, wkb = parse_Byte(wkb)
-	if byte == 0:
-		return ">", wkb
-	elif byte == 1:
-		return "<", wkb
-	raise Exception(f"Invalid byte order {byte}")
 
+def parse_TopGeometry(wkb: memoryview) -> Tuple[Geometry, Offset]:
+	# parse_Geometry from the start of `wkb`, in the compiled core if it is in use.
+	# The compiled core gives no details about malformed input, so the pure python reader is run to raise the same exception it would.
+	# It also falls back to the pure python reader (which does not recurse) if it runs out of C stack on deeply nested input
+	compiled = speedups.compiled
+	if compiled is not None:
+		try:
+			return compiled.parse_geojson(wkb, DimensionMask, *compiled_limits())
+		except (compiled.DecodeError, RecursionError):
+			pass
+	return parse_Geometry(wkb, 0)
 
-MapExtraDimensionNames: dict[int: Tuple[DimensionCount, DimensionNames]] = {
-	0: (2, "XY", "2d"),
-	1: (3, "XYZ", "3d"),
-	# 2: (3, "XYM", "3d"),
-	# 3: (4, "XYZM", "4d")
-}
 
-MapGeometryTypeNameAndParser = {
-	1: ("Point", "coordinates", parse_Point),
-	2: ("LineString", "coordinates", parse_LineString),
-	3: ("Polygon", "coordinates", parse_Polygon),
-	4: ("MultiPoint", "coordinates", parse_MultiPoint),
-	5: ("MultiLineString", "coordinates", parse_MultiLineString),
-	6: ("MultiPolygon", "coordinates", parse_MultiPolygon),
-	7: ("GeometryCollection", "geometries", parse_GeometryCollection),
-}
+def wkb_to_geojson(wkb: WKBBuffer) -> Geometry:
+	with as_memoryview(wkb) as view:
+		result, offset = parse_TopGeometry(view)
+		srid = parse_SRID(view, 0)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	if srid is not None:
+		result["crs"] = srid_crs(srid)
+	return result
 
 
-def wkb_to_geojson(wkb: bytearray) -> Geometry:
-	result, wkb = parse_Geometry(wkb, None, None, None, None)
-	if len(wkb) > 0:
-		warnings.warn(f"WKB data not fully parsed. {len(wkb)} bytes remaining")
-	return result
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0) -> Iterator[Optional[Geometry]]:
+	# Same as calling wkb_to_geojson() on each item.
+	# If an `errors` list is supplied, rows which fail are yielded as None and (row_index, exception) is appended to `errors`
+	for index, wkb in enumerate(wkbs, start):
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+			result, offset = parse_TopGeometry(view)
+			srid = parse_SRID(view, 0)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		if offset < len(view):
+			warnings.warn(f"WKB data not fully parsed. {len(view) - offset} bytes remaining in row {index}")
+		if srid is not None:
+			result["crs"] = srid_crs(srid)
+		yield result
+
+
+def wkb_to_geojson_many(
+	wkbs: Iterable[WKBBuffer],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Optional[Geometry]]:
+	if parallel:
+		return parallel_decode(with_settings(parse_many), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors)
@@ -0,0 +1,240 @@
+from __future__ import annotations
+from functools import partial
+from itertools import zip_longest
+import json
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+import warnings
+
+from . import speedups
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_reader import parse_SRID
+from .wkb_to_geojson import DimensionMask
+from .wkb_to_geojson import MapGeometryTypeNameAndKey
+from .wkb_to_geojson import srid_crs
+from .wkb_to_wkt import CoordinateStyle
+from .wkb_to_wkt import DimensionCount
+from .wkb_to_wkt import coordinate_style
+from .wkb_to_wkt import format_Coordinates
+from .wkb_walker import Run
+from .wkb_walker import WKBBuilder
+from .wkb_walker import compiled_limits
+from .wkb_walker import walk_Geometry
+from .wkb_walker import with_settings
+
+# GeoJSON text written straight from WKB, without building the dicts and lists of wkb_to_geojson() first.
+# Pieces of text are appended to one list which is joined at the end (as in wkb_to_wkt), and each run of coordinates
+# is formatted by a single `%` operation. With the default options the text is the same as
+# json.dumps(wkb_to_geojson(wkb)). When the compiled core is in use it writes the same text, whatever the options.
+
+Framing = str  # Literal["ndjson", "feature_collection"]
+MISSING_ROW = object()  # fills in for the shorter of the WKB blobs and the properties, which is an error
+
+
+def format_JSONCoordinates(run: Run, dimension_count: DimensionCount, style: CoordinateStyle) -> str:
+	text = format_Coordinates(run, dimension_count, style)
+	if "n" in text:
+		# the only letters in formatted doubles are "e", "nan" and "inf". json.dumps writes the last two like javascript
+		text = text.replace("nan", "NaN").replace("inf", "Infinity")
+	return text
+
+
+class GeoJSONTextBuilder(WKBBuilder):
+	# Appends the GeoJSON text of a geometry to `out` as walk_Geometry gives its parts (see WKTBuilder).
+	# `stack` holds [type_key, members written so far] for each collection being written
+	__slots__ = ("style", "out", "stack")
+	operation = "wkb_to_geojson_str"
+
+	def __init__(self, style: CoordinateStyle, out: List[str]):
+		self.style = style
+		self.out = out
+		self.stack: List[List[int]] = []
+
+	def begin_member(self) -> bool:
+		# Writes what goes before a geometry within its parent. Returns True if the geometry is written as an object:
+		# members of Multi* geometry are written as bare coordinates
+		stack = self.stack
+		if not stack:
+			return True
+		parent = stack[-1]
+		if parent[1]:
+			self.out.append(", ")
+		parent[1] += 1
+		return parent[0] == 7
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: List[Run]) -> None:
+		out = self.out
+		named = self.begin_member()
+		if named:
+			out.append(MapOpening[type_key])
+		dimension_count = MapDimensionCount[dimension_key]
+		if type_key == 1:
+			out.append(format_JSONCoordinates(runs[0], dimension_count, self.style))
+		elif type_key == 2:
+			out.append(f"[{format_JSONCoordinates(runs[0], dimension_count, self.style)}]")
+		else:
+			out.append("[")
+			for index, run in enumerate(runs):
+				text = format_JSONCoordinates(run, dimension_count, self.style)
+				out.append(f", [{text}]" if index else f"[{text}]")
+			out.append("]")
+		if named:
+			out.append("}")
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		named = self.begin_member()
+		if named:
+			self.out.append(MapOpening[type_key])
+		self.out.append("[")
+		self.stack.append([type_key, 0, named])
+
+	def end_collection(self) -> None:
+		type_key, count, named = self.stack.pop()
+		self.out.append("]}" if named else "]")
+
+	def result(self) -> str:
+		return "".join(self.out)
+
+
+MapOpening = {
+	type_key: f'{{"type": "{type_name}", "{rest_key_name}": '
+	for type_key, (type_name, rest_key_name) in MapGeometryTypeNameAndKey.items()
+}
+
+
+def geojson_style(precision: Optional[int], trim: bool, cache_size: int) -> CoordinateStyle:
+	return coordinate_style(precision, trim, cache_size, "[", ", ", "]")
+
+
+def write_TopGeometry(wkb: memoryview, style: CoordinateStyle, precision: Optional[int], trim: bool, out: List[str]) -> Offset:
+	# Writes the geometry at the start of `wkb`, in the compiled core if it is in use. `style` is for the pure python
+	# writer, and the compiled core formats coordinates from `precision` and `trim` to the same text (it has no use for
+	# a cache of formatted values).
+	# On malformed input, or deeply nested input which runs out of C stack, the pure python writer is run instead, as in
+	# wkb_to_wkt
+	compiled = speedups.compiled
+	if compiled is not None:
+		try:
+			text, offset = compiled.parse_geojson_str(wkb, DimensionMask, *compiled_limits(), -1 if precision is None else precision, trim)
+			out.append(text)
+			return offset
+		except (compiled.DecodeError, RecursionError):
+			pass
+	return walk_Geometry(wkb, 0, GeoJSONTextBuilder(style, out))
+
+
+def write_GeoJSON(view: memoryview, style: CoordinateStyle, precision: Optional[int], trim: bool, out: List[str]) -> Offset:
+	offset = write_TopGeometry(view, style, precision, trim, out)
+	srid = parse_SRID(view, 0)
+	if srid is not None:
+		out[-1] = out[-1][:-1] + f', "crs": {json.dumps(srid_crs(srid))}}}'
+	return offset
+
+
+def wkb_to_geojson_str(wkb: WKBBuffer, precision: Optional[int] = None, trim: bool = False, cache_size: int = 0) -> str:
+	"""
+	Converts WKB (or PostGIS EWKB) into GeoJSON text. With the default options this is the same as
+	`json.dumps(wkb_to_geojson(wkb))`, but no intermediate dicts, lists or floats are built.
+	`precision`, `trim` and `cache_size` are as for wkb_to_wkt()
+	"""
+	out: List[str] = []
+	with as_memoryview(wkb) as view:
+		offset = write_GeoJSON(view, geojson_style(precision, trim, cache_size), precision, trim, out)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	return "".join(out)
+
+
+def wkb_to_geojson_bytes(wkb: WKBBuffer, precision: Optional[int] = None, trim: bool = False, cache_size: int = 0) -> bytes:
+	"""Same as wkb_to_geojson_str(), encoded as UTF-8 (eg. for an HTTP response body)"""
+	return wkb_to_geojson_str(wkb, precision, trim, cache_size).encode()
+
+
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0, precision: Optional[int] = None, trim: bool = False, cache_size: int = 0) -> Iterator[Optional[str]]:
+	# Same as calling wkb_to_geojson_str() on each item.
+	# If an `errors` list is supplied, rows which fail are yielded as None and (row_index, exception) is appended to `errors`
+	style = geojson_style(precision, trim, cache_size)
+	for index, wkb in enumerate(wkbs, start):
+		out: List[str] = []
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+			offset = write_GeoJSON(view, style, precision, trim, out)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		if offset < len(view):
+			warnings.warn(f"WKB data not fully parsed. {len(view) - offset} bytes remaining in row {index}")
+		yield "".join(out)
+
+
+def wkb_to_geojson_str_many(
+	wkbs: Iterable[WKBBuffer],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	precision: Optional[int] = None,
+	trim: bool = False,
+	cache_size: int = 0,
+) -> Iterator[Optional[str]]:
+	if parallel:
+		return parallel_decode(with_settings(partial(parse_many, precision=precision, trim=trim, cache_size=cache_size)), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors, 0, precision, trim, cache_size)
+
+
+def wkb_to_geojson_stream(
+	wkbs: Iterable[WKBBuffer],
+	framing: Framing = "feature_collection",
+	properties: Optional[Iterable[Optional[dict]]] = None,
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	precision: Optional[int] = None,
+	trim: bool = False,
+	cache_size: int = 0,
+) -> Iterator[bytes]:
+	"""
+	Writes each WKB blob as a GeoJSON Feature, yielding UTF-8 chunks which can be written to a file or returned as a
+	streaming HTTP response body. `framing="feature_collection"` wraps the features in a FeatureCollection, and
+	`framing="ndjson"` writes one feature per line (newline delimited GeoJSON).
+	`properties` is an optional iterable of dicts, one per WKB blob. An Exception is raised if the two differ in length.
+	Rows which fail (when `errors` is given) are written with a null geometry.
+	"""
+	if framing == "feature_collection":
+		opening, separator, closing = b'{"type": "FeatureCollection", "features": [', b", ", b"]}"
+	elif framing == "ndjson":
+		opening, separator, closing = b"", b"", b""
+	else:
+		raise Exception(f"Unknown framing {framing!r}. Expected 'feature_collection' or 'ndjson'")
+	suffix = b"\n" if framing == "ndjson" else b""
+	geometries = wkb_to_geojson_str_many(wkbs, errors, parallel, max_workers, chunk_size, precision, trim, cache_size)
+	rows: Iterator[tuple]
+	if properties is None:
+		rows = ((geometry, None) for geometry in geometries)
+	else:
+		rows = zip_longest(geometries, properties, fillvalue=MISSING_ROW)
+	if opening:
+		yield opening
+	for index, (geometry, row_properties) in enumerate(rows):
+		if geometry is MISSING_ROW or row_properties is MISSING_ROW:
+			shorter = "WKB blobs" if geometry is MISSING_ROW else "properties"
+			raise Exception(f"The WKB blobs and the properties differ in length. The {shorter} end after {index} rows")
+		feature = f'{{"type": "Feature", "geometry": {"null" if geometry is None else geometry}, "properties": {json.dumps(row_properties)}}}'
+		yield (separator if index else b"") + feature.encode() + suffix
+	if closing:
+		yield closing
@@ -1,13 +1,32 @@
 from __future__ import annotations
-from struct import unpack
-from typing import Any, Dict
+from functools import lru_cache
+from functools import partial
+from typing import Dict
 from typing import Callable
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
 # from typing import Literal
 from typing import Tuple
 from typing import Union
 import warnings
 
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from . import speedups
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_reader import parse_SRID
+from .wkb_walker import MapExtraDimensionNames
+from .wkb_walker import Run
+from .wkb_walker import WKBBuilder
+from .wkb_walker import compiled_limits
+from .wkb_walker import walk_Geometry
+from .wkb_walker import with_settings
+
 DimensionCount = int  # Literal[2, 3, 4]
 DimensionNames = str  # Literal["XY", "XYZ", "XYM", "XYZM"]
 
@@ -26,127 +45,221 @@ Polygon = List[LinearRing]
 # TODO: python 3.8 will have TypedDict but sadly our current target is 3.7
 Geometry = Dict[str, Union[str, List[Union[Point, LineString, Polygon, List[Point], List[LineString]]]]]
 
-
-def multi_parse(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool, func: Callable[[bytearray, str, str, DimensionCount, bool], Tuple[Any, bytearray]], repeat_count: int) -> Tuple[Tuple[Any, ...], bytearray]:
-	# oh Haskell, how I miss thee, thine curried functions, thine folds. Here I wallow in constant reinvention, apart from thine warm aura of glorious composition.
-	result = []
-	for _ in range(repeat_count):
-		item_result, wkb = func(wkb, int_parser, point_parser, dimension_count, raw)
-		result.append(item_result)
-	return result, wkb
-
-
-def parse_Byte(wkb: bytearray) -> Tuple[Byte, bytearray]:
-	return wkb[0], wkb[1:]
-
-
-def parse_UInt32(wkb: bytearray, int_parser) -> Tuple[UInt32, bytearray]:
-	return unpack(int_parser, wkb[:4])[0], wkb[4:]
-
-
-# def parse_Double(wkb: bytearray, int_parser:str, point_parser:str) -> (Double, bytearray):
-# 	# hopefully parses 8 byte IEEE 754 Double
-# 	return unpack(byte_order[0] + " d", wkb[:8])[0], wkb[8:]
-
-
-def parse_Point(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[Point, bytearray]:
-	return " ".join(map(str, unpack(point_parser, wkb[:8 * dimension_count]))), wkb[8 * dimension_count:]
-
-
-def parse_LinearRing(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[LinearRing, bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	return multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Point, num_points)
-
-
-def parse_LineString(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[LineString, bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	points, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Point, num_points)
-	return ", ".join(points), wkb
-
-
-def parse_Polygon(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[Polygon, bytearray]:
-	# TODO: The first and last point of a linear ring should be the same value. enforce?
-	num_rings, wkb = parse_UInt32(wkb, int_parser)
-	rings, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_LinearRing, num_rings)
-	return ', '.join(f"({', '.join(item)})" for item in rings), wkb
-
-
-def parse_MultiPoint(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[Point], bytearray]:
-	num_points, wkb = parse_UInt32(wkb, int_parser)
-	points, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Geometry, num_points)
-	return ", ".join(points), wkb
-
-
-def parse_MultiLineString(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[LineString], bytearray]:
-	num_strings, wkb = parse_UInt32(wkb, int_parser)
-	linestrings, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Geometry, num_strings)
-	return ", ".join(f"({item})" for item in linestrings), wkb
-
-
-def parse_MultiPolygon(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[Polygon], bytearray]:
-	num_polygons, wkb = parse_UInt32(wkb, int_parser)
-	polygons, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, raw, parse_Geometry, num_polygons)
-	return ", ".join(f"({item})" for item in polygons), wkb
-
-
-def parse_GeometryCollection(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[list[Geometry], bytearray]:
-	num_geometries, wkb = parse_UInt32(wkb, int_parser)
-	geoms, wkb = multi_parse(wkb, int_parser, point_parser, dimension_count, False, parse_Geometry, num_geometries)
-	return ", ".join(geoms), wkb
-
-
-def parse_Geometry(wkb: bytearray, int_parser: str, point_parser: str, dimension_count: DimensionCount, raw: bool) -> Tuple[Geometry, bytearray]:
-	byte_order, wkb = parse_ByteOrder(wkb)
-	int_parser = byte_order + "I"
-	geom_type_integer, wkb = parse_UInt32(wkb, int_parser)
-	dimension_count, extra_dimension_names, point_parser = MapExtraDimensionNames.get(geom_type_integer // 1000, (None, None))
-	if dimension_count is None:
-		raise Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer // 1000} not in WKBDimensionSets.keys()")
-	point_parser = byte_order + point_parser
-	type_name, parser = MapGeometryTypeNameAndParser.get(geom_type_integer % 1000, (None, None))
-	if type_name is None:
-		raise Exception(f"WKB geometry type number {geom_type_integer} is not valid. {geom_type_integer % 1000} not in WKBGeometryTypeInfo.keys()")
-	if parser is None:
-		raise Exception(f"Parser is not implemented for {type_name}")
-	geom, wkb = parser(wkb, int_parser, point_parser, dimension_count, True)
-	
-	if raw:
-		return geom, wkb
-	if not extra_dimension_names == "XY":
-		type_name += " " + extra_dimension_names[2:]
-	
-	return f"{type_name} ({geom})", wkb
-
-
-def parse_ByteOrder(wkb: bytearray) -> Tuple[ByteOrderChar, bytearray]:
-	byte, wkb = parse_Byte(wkb)
-	if byte == 0:
-		return ">", wkb
-	elif byte == 1:
-		return "<", wkb
-	raise Exception(f"Invalid byte order {byte}")
-
-
-MapExtraDimensionNames: dict[int: Tuple[DimensionCount, DimensionNames]] = {
-	0: (2, "XY", "2d"),
-	1: (3, "XYZ", "3d"),
-	2: (3, "XYM", "3d"),
-	3: (4, "XYZM", "4d")
+# (point format per dimension count, per value formatter or None). See coordinate_style
+CoordinateStyle = Tuple[Dict[DimensionCount, str], Optional[Callable[[Double], str]]]
+
+
+def trim_value(value_format: str, value: Double) -> str:
+	# fixed decimals with the trailing zeros (and a trailing decimal point) removed
+	text = value_format % value
+	if "." in text:
+		text = text.rstrip("0").rstrip(".")
+	return text
+
+
+def cache_values(format_value: Callable[[Double], str], cache_size: int) -> Callable[[Double], str]:
+	# format_value with the text of the `cache_size` most recent values kept. 0.0 and -0.0 are equal (and so the same
+	# cache key) but are written differently, so zeros are always formatted afresh
+	cached = lru_cache(maxsize=cache_size)(format_value)
+	return lambda value: cached(value) if value else format_value(value)
+
+
+@lru_cache(maxsize=None)
+def coordinate_style(precision: Optional[int], trim: bool, cache_size: int, opening: str = "", separator: str = " ", closing: str = "") -> CoordinateStyle:
+	# The formats used to write coordinates as text. Returns (point format per dimension count, per value formatter or None).
+	# Without a per value formatter a whole run of coordinates is written by a single `%` operation.
+	# Each point is written as `opening`, the values joined by `separator`, then `closing`.
+	# Kept in a cache so that the value cache (if any) lives across calls with the same options, and so that the same
+	# options always give the same object (see DefaultStyle)
+	if precision is not None and precision < 0:
+		raise Exception(f"precision must be None or at least 0, got {precision}")
+	format_value: Optional[Callable[[Double], str]] = None
+	if precision is None:
+		# repr is the shortest text which reads back as the same double
+		value_format = "%r"
+	elif trim:
+		value_format = "%s"
+		format_value = partial(trim_value, f"%.{precision}f")
+	else:
+		value_format = f"%.{precision}f"
+	if cache_size:
+		if format_value is None:
+			format_value = value_format.__mod__
+			value_format = "%s"
+		format_value = cache_values(format_value, cache_size)
+	point_formats = {dimension_count: opening + separator.join([value_format] * dimension_count) + closing for dimension_count in (2, 3, 4)}
+	return point_formats, format_value
+
+
+DefaultStyle = coordinate_style(None, False, 0)
+
+
+def format_Coordinates(run: Run, dimension_count: DimensionCount, style: CoordinateStyle) -> str:
+	# a run of interleaved coordinates as text, with the points separated by ", "
+	point_formats, format_value = style
+	values = tuple(run) if format_value is None else tuple(map(format_value, run))
+	return ", ".join([point_formats[dimension_count]] * (len(run) // dimension_count)) % values
+
+
+class WKTBuilder(WKBBuilder):
+	# Appends the WKT of a geometry to `out` as walk_Geometry gives its parts. The text is joined once at the end,
+	# rather than joining intermediate strings at every level of nesting.
+	# `stack` holds [type_key, members written so far, named, wrapped] for each collection being written
+	__slots__ = ("style", "out", "stack")
+	operation = "wkb_to_wkt"
+
+	def __init__(self, style: CoordinateStyle, out: List[str]):
+		self.style = style
+		self.out = out
+		self.stack: List[List[int]] = []
+
+	def begin_member(self) -> Tuple[bool, bool]:
+		# Writes what goes before a geometry within its parent. Returns (named, wrapped):
+		# members of Multi* geometry are written without their type name, and lines and polygons within them are wrapped in ()
+		stack = self.stack
+		if not stack:
+			return True, False
+		parent = stack[-1]
+		if parent[1]:
+			self.out.append(", ")
+		parent[1] += 1
+		if parent[0] == 7:
+			return True, False
+		if parent[0] == 4:
+			return False, False
+		self.out.append("(")
+		return False, True
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], runs: List[Run]) -> None:
+		out = self.out
+		named, wrapped = self.begin_member()
+		if named:
+			out.append(MapTypeName[type_key, dimension_key])
+			out.append(" (")
+		dimension_count = MapDimensionCount[dimension_key]
+		if type_key == 3:
+			for index, run in enumerate(runs):
+				out.append(", (" if index else "(")
+				out.append(format_Coordinates(run, dimension_count, self.style))
+				out.append(")")
+		else:
+			out.append(format_Coordinates(runs[0], dimension_count, self.style))
+		if named:
+			out.append(")")
+		if wrapped:
+			out.append(")")
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: str, srid: Optional[int], count: int) -> None:
+		named, wrapped = self.begin_member()
+		if named:
+			self.out.append(MapTypeName[type_key, dimension_key])
+			self.out.append(" (")
+		self.stack.append([type_key, 0, named, wrapped])
+
+	def end_collection(self) -> None:
+		type_key, count, named, wrapped = self.stack.pop()
+		if named:
+			self.out.append(")")
+		if wrapped:
+			self.out.append(")")
+
+	def result(self) -> str:
+		return "".join(self.out)
+
+
+MapGeometryTypeName = {
+	1: "POINT",
+	2: "LINESTRING",
+	3: "POLYGON",
+	4: "MULTIPOINT",
+	5: "MULTILINESTRING",
+	6: "MULTIPOLYGON",
+	7: "GEOMETRYCOLLECTION",
 }
 
-MapGeometryTypeNameAndParser = {
-	1: ("POINT", parse_Point),
-	2: ("LINESTRING", parse_LineString),
-	3: ("POLYGON", parse_Polygon),
-	4: ("MULTIPOINT", parse_MultiPoint),
-	5: ("MULTILINESTRING", parse_MultiLineString),
-	6: ("MULTIPOLYGON", parse_MultiPolygon),
-	7: ("GEOMETRYCOLLECTION", parse_GeometryCollection),
+# (type_key, dimension_key): the name written before the geometry, eg. "POINT ZM"
+MapTypeName = {
+	(type_key, dimension_key): type_name if extra_dimension_names == "XY" else f"{type_name} {extra_dimension_names[2:]}"
+	for dimension_key, (dimension_count, extra_dimension_names) in MapExtraDimensionNames.items()
+	for type_key, type_name in MapGeometryTypeName.items()
 }
 
 
-def wkb_to_wkt(wkb: bytearray) -> list[Geometry]:
-	result, wkb = parse_Geometry(wkb, None, None, None, None)
-	if len(wkb) > 0:
-		warnings.warn(f"WKB data not fully parsed. {len(wkb)} bytes remaining")
-	return result
+DimensionMask = speedups.dimension_mask(MapExtraDimensionNames)
+
+
+def write_TopGeometry(wkb: memoryview, style: CoordinateStyle, out: List[str]) -> Offset:
+	# Writes the geometry at the start of `wkb`, in the compiled core if it is in use and the options are the defaults.
+	# The compiled core gives no details about malformed input, so the pure python writer is run to raise the same exception it would.
+	# It also falls back to the pure python writer (which does not recurse) if it runs out of C stack on deeply nested input
+	compiled = speedups.compiled
+	if compiled is not None and style is DefaultStyle:
+		try:
+			text, offset = compiled.parse_wkt(wkb, DimensionMask, *compiled_limits())
+			out.append(text)
+			return offset
+		except (compiled.DecodeError, RecursionError):
+			pass
+	return walk_Geometry(wkb, 0, WKTBuilder(style, out))
+
+
+def wkb_to_wkt(wkb: WKBBuffer, precision: Optional[int] = None, trim: bool = False, cache_size: int = 0) -> str:
+	"""
+	Converts WKB (or PostGIS EWKB) into WKT.
+	By default coordinates are written as the shortest text which reads back as the same double.
+	`precision=n` writes n decimal places instead, and `trim=True` drops the trailing zeros.
+	`cache_size=n` remembers the text of the n most recently written coordinate values, which pays off when the same
+	values repeat a lot (eg. polygons sharing boundaries).
+	"""
+	style = coordinate_style(precision, trim, cache_size)
+	out: List[str] = []
+	with as_memoryview(wkb) as view:
+		offset = write_TopGeometry(view, style, out)
+		srid = parse_SRID(view, 0)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	if srid is not None:
+		return f"SRID={srid};" + "".join(out)
+	return "".join(out)
+
+
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0, precision: Optional[int] = None, trim: bool = False, cache_size: int = 0) -> Iterator[Optional[str]]:
+	# Same as calling wkb_to_wkt() on each item, but the lookups are hoisted out of the loop.
+	# If an `errors` list is supplied, rows which fail are yielded as None and (row_index, exception) is appended to `errors`
+	style = coordinate_style(precision, trim, cache_size)
+	for index, wkb in enumerate(wkbs, start):
+		out: List[str] = []
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+			offset = write_TopGeometry(view, style, out)
+			srid = parse_SRID(view, 0)
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		if offset < len(view):
+			warnings.warn(f"WKB data not fully parsed. {len(view) - offset} bytes remaining in row {index}")
+		if srid is None:
+			yield "".join(out)
+		else:
+			yield f"SRID={srid};" + "".join(out)
+
+
+def wkb_to_wkt_many(
+	wkbs: Iterable[WKBBuffer],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	precision: Optional[int] = None,
+	trim: bool = False,
+	cache_size: int = 0,
+) -> Iterator[Optional[str]]:
+	if parallel:
+		return parallel_decode(with_settings(partial(parse_many, precision=precision, trim=trim, cache_size=cache_size)), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors, 0, precision, trim, cache_size)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+from array import array
+from struct import Struct
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import warnings
+
+from .wkb_reader import ByteOrderChar
+from .wkb_reader import EWKB_M_FLAG
+from .wkb_reader import EWKB_SRID_FLAG
+from .wkb_reader import EWKB_Z_FLAG
+from .wkb_reader import MapGeometryTypeCode
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_reader import invalid_geometry_type
+from .wkb_reader import parse_ByteOrder
+from .wkb_reader import parse_UInt32
+from .wkb_walker import MIN_GEOMETRY_SIZE
+from .wkb_walker import MIN_RING_SIZE
+from .wkb_walker import UNLIMITED_ELEMENTS
+from .wkb_walker import get_limits
+from .wkb_walker import too_many_elements
+from .wkb_walker import truncated_count
+
+# Rewrites WKB as WKB, walking the structure once and writing straight into the output buffer.
+# Runs of coordinates are copied as-is when nothing about them changes, otherwise they are loaded into an array("d")
+# and byteswapped and/or have their columns rearranged in bulk. No Python object is created per coordinate.
+#
+# Input may be ISO WKB or PostGIS EWKB (Z/M/SRID flags in the high bits of the geometry type).
+# flavor="iso" writes ISO WKB, dropping any SRID.
+# flavor="extended" writes EWKB flags, and keeps the SRID of the outermost geometry if it had one.
+# Nesting and size are bounded by the limits of set_limits(), as for the other readers.
+
+DimensionNames = str  # Literal["XY", "XYZ", "XYM", "XYZM"]
+Flavor = str  # Literal["iso", "extended"]
+SRID = Optional[int]
+
+MapExtraDimensionNames: Dict[int, DimensionNames] = {
+	0: "XY",
+	1: "XYZ",
+	2: "XYM",
+	3: "XYZM",
+}
+
+MapDimensionNamesTypeOffset: Dict[DimensionNames, int] = {
+	"XY": 0,
+	"XYZ": 1000,
+	"XYM": 2000,
+	"XYZM": 3000,
+}
+
+MapDimensionNamesEWKBFlags: Dict[DimensionNames, int] = {
+	"XY": 0,
+	"XYZ": EWKB_Z_FLAG,
+	"XYM": EWKB_M_FLAG,
+	"XYZM": EWKB_Z_FLAG | EWKB_M_FLAG,
+}
+
+MapForcedDimensionNames: Dict[Optional[int], Optional[DimensionNames]] = {
+	None: None,
+	2: "XY",
+	3: "XYZ",
+	4: "XYZM",
+}
+
+# For each (input, output) pair of dimension names, which input column each output column comes from.
+# None means the output column has no source and is filled with 0.0
+MapColumns: Dict[Tuple[DimensionNames, DimensionNames], List[Optional[int]]] = {
+	(in_names, out_names): [in_names.index(axis) if axis in in_names else None for axis in out_names]
+	for in_names in MapDimensionNamesTypeOffset
+	for out_names in MapDimensionNamesTypeOffset
+}
+
+MapByteOrderByte: Dict[ByteOrderChar, int] = {
+	">": 0,
+	"<": 1,
+}
+
+MapUInt32Encoder: Dict[ByteOrderChar, Struct] = {byte_order: Struct(byte_order + "I") for byte_order in "<>"}
+MapHeaderEncoder: Dict[ByteOrderChar, Struct] = {byte_order: Struct(byte_order + "BI") for byte_order in "<>"}
+MapHeaderWithSRIDEncoder: Dict[ByteOrderChar, Struct] = {byte_order: Struct(byte_order + "BII") for byte_order in "<>"}
+
+
+def parse_Header(wkb: memoryview, offset: Offset) -> Tuple[ByteOrderChar, DimensionNames, int, SRID, Offset]:
+	byte_order, offset = parse_ByteOrder(wkb, offset)
+	int_parser = byte_order + "I"
+	geom_type_integer, offset = parse_UInt32(wkb, offset, int_parser)
+	type_code = MapGeometryTypeCode.get(geom_type_integer)
+	if type_code is None:
+		raise invalid_geometry_type(geom_type_integer, MapExtraDimensionNames, range(1, 8))
+	type_units, dimension_key, has_srid = type_code
+	srid = None
+	if has_srid:
+		srid, offset = parse_UInt32(wkb, offset, int_parser)
+	return byte_order, MapExtraDimensionNames[dimension_key], type_units, srid, offset
+
+
+def transcode_CoordinateRun(wkb: memoryview, offset: Offset, num_points: int, in_names: DimensionNames, out_names: DimensionNames, swap: bool, out: bytearray) -> Offset:
+	in_dimension_count = len(in_names)
+	end = offset + 8 * in_dimension_count * num_points
+	if end > len(wkb):
+		raise Exception(f"WKB data truncated. {num_points} points need {end - offset} bytes but only {len(wkb) - offset} bytes remain")
+	if in_names == out_names and not swap:
+		out += wkb[offset:end]
+		return end
+	coordinates = array("d")
+	coordinates.frombytes(wkb[offset:end])
+	if in_names != out_names:
+		# picking columns does not care about byte order, since each double is moved as a whole
+		out_dimension_count = len(out_names)
+		rearranged = array("d", bytes(8 * out_dimension_count * num_points))
+		for out_column, in_column in enumerate(MapColumns[in_names, out_names]):
+			if in_column is not None:
+				rearranged[out_column::out_dimension_count] = coordinates[in_column::in_dimension_count]
+		coordinates = rearranged
+	if swap:
+		coordinates.byteswap()
+	out += memoryview(coordinates).cast("B")
+	return end
+
+
+def transcode_Geometry(wkb: memoryview, offset: Offset, out: bytearray, out_byte_order: ByteOrderChar, forced_names: Optional[DimensionNames], flavor: Flavor, forced_srid: SRID = None) -> Offset:
+	# Nested geometry is transcoded with an explicit stack, as in walk_Geometry: `left` is the number of members still
+	# to be written in the innermost open collection, and `outer` holds the same for each enclosing collection.
+	# Only the outermost geometry keeps (or is given) an SRID
+	max_depth, max_elements = get_limits()
+	elements_left = UNLIMITED_ELEMENTS if max_elements is None else max_elements
+	out_uint32 = MapUInt32Encoder[out_byte_order]
+	byte_order_byte = MapByteOrderByte[out_byte_order]
+	size = len(wkb)
+	outer: List[int] = []
+	left = 0
+	while True:
+		byte_order, in_names, type_units, srid, offset = parse_Header(wkb, offset)
+		if outer:
+			srid = None
+		elif forced_srid is not None:
+			srid = forced_srid
+		out_names = forced_names or in_names
+		swap = byte_order != out_byte_order
+		int_parser = byte_order + "I"
+		elements_left -= 1
+
+		if flavor == "extended":
+			geom_type_integer = type_units | MapDimensionNamesEWKBFlags[out_names]
+			if srid is not None:
+				out += MapHeaderWithSRIDEncoder[out_byte_order].pack(byte_order_byte, geom_type_integer | EWKB_SRID_FLAG, srid)
+			else:
+				out += MapHeaderEncoder[out_byte_order].pack(byte_order_byte, geom_type_integer)
+		else:
+			out += MapHeaderEncoder[out_byte_order].pack(byte_order_byte, type_units + MapDimensionNamesTypeOffset[out_names])
+
+		if type_units == 1:
+			if elements_left < 0:
+				raise too_many_elements(max_elements)
+			offset = transcode_CoordinateRun(wkb, offset, 1, in_names, out_names, swap, out)
+		else:
+			count, offset = parse_UInt32(wkb, offset, int_parser)
+			out += out_uint32.pack(count)
+			elements_left -= count
+			if elements_left < 0:
+				raise too_many_elements(max_elements)
+			if type_units == 2:
+				offset = transcode_CoordinateRun(wkb, offset, count, in_names, out_names, swap, out)
+			elif type_units == 3:
+				if count * MIN_RING_SIZE > size - offset:
+					raise truncated_count(count, "rings", MIN_RING_SIZE, size - offset)
+				for _ in range(count):
+					num_points, offset = parse_UInt32(wkb, offset, int_parser)
+					elements_left -= num_points
+					if elements_left < 0:
+						raise too_many_elements(max_elements)
+					out += out_uint32.pack(num_points)
+					offset = transcode_CoordinateRun(wkb, offset, num_points, in_names, out_names, swap, out)
+			else:
+				if count * MIN_GEOMETRY_SIZE > size - offset:
+					raise truncated_count(count, "members", MIN_GEOMETRY_SIZE, size - offset)
+				if len(outer) >= max_depth:
+					raise Exception(f"WKB geometry is nested more than {max_depth} deep. See set_limits()")
+				if count:
+					outer.append(left)
+					left = count
+					continue
+		# a geometry is complete, and with it any collections it was the last member of
+		while True:
+			if not outer:
+				return offset
+			left -= 1
+			if left:
+				break
+			left = outer.pop()
+
+
+def wkb_transcode(wkb: WKBBuffer, byte_order: ByteOrderChar = "<", dimensions: Optional[int] = None, flavor: Flavor = "iso", srid: SRID = None) -> bytes:
+	"""
+	Rewrites WKB with a different byte order (`"<"` little endian or `">"` big endian),
+	number of dimensions (`None` to keep, `2` for XY, `3` for XYZ, `4` for XYZM; missing Z or M values are filled with 0.0)
+	or flavor (`"iso"` to write ISO WKB without SRID, `"extended"` to write PostGIS EWKB and keep the SRID).
+	With flavor="extended", `srid` sets (or replaces) the SRID of the outermost geometry.
+	"""
+	if byte_order not in MapByteOrderByte:
+		raise Exception(f"Invalid byte order {byte_order!r}. Expected '<' or '>'")
+	if dimensions not in MapForcedDimensionNames:
+		raise Exception(f"Invalid dimensions {dimensions!r}. Expected None, 2, 3 or 4")
+	if flavor not in ("iso", "extended"):
+		raise Exception(f"Invalid flavor {flavor!r}. Expected 'iso' or 'extended'")
+	if srid is not None and flavor != "extended":
+		raise Exception("An SRID can only be written with flavor='extended'")
+	out = bytearray()
+	with as_memoryview(wkb) as view:
+		offset = transcode_Geometry(view, 0, out, byte_order, MapForcedDimensionNames[dimensions], flavor, srid)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	return bytes(out)
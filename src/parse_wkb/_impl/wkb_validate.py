@@ -0,0 +1,248 @@
+from __future__ import annotations
+from functools import partial
+from math import isnan
+from struct import unpack_from
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+import zlib
+
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from .wkb_reader import HeaderParser
+from .wkb_reader import Offset
+from .wkb_reader import WKBBuffer
+from .wkb_reader import as_memoryview
+from .wkb_reader import invalid_geometry_header
+from .wkb_walker import DimensionNames
+from .wkb_walker import MIN_GEOMETRY_SIZE
+from .wkb_walker import MIN_RING_SIZE
+from .wkb_walker import MapExtraDimensionNames
+from .wkb_walker import MapGeometryHeader
+from .wkb_walker import MapGeometryTypeName
+from .wkb_walker import get_limits
+from .wkb_walker import with_settings
+
+# Validation of untrusted WKB without decoding it.
+# validate_Geometry walks the headers and counts like walk_Geometry, but jumps over each run of coordinates by
+# arithmetic instead of reading it. The only coordinates looked at are the first and last point of each ring (compared
+# as bytes, to find unclosed rings) and the first ordinate of each Point (to recognise POINT EMPTY).
+#
+# Problems are collected rather than raised. Those which leave the rest of the buffer unreadable (a bad byte order or
+# geometry type, truncation, nesting deeper than set_limits() allows) end the walk; the others (unclosed rings, members
+# of the wrong type or dimensions, bytes left over) are reported and the walk carries on.
+
+ProblemCode = str  # Literal["byte_order", "geometry_type", "truncated", "too_deep", "member_type", "member_dimensions", "unclosed_ring", "trailing_bytes"]
+
+# (type name, dimension names, members). members is empty except for Multi* and GeometryCollection
+TypeTree = Tuple[str, DimensionNames, list]
+
+
+class WKBProblem(NamedTuple):
+	code: ProblemCode
+	offset: Offset  # position in the WKB at which the problem was found
+	message: str
+
+
+class WKBValidation(NamedTuple):
+	valid: bool  # True if there are no problems
+	size: int  # bytes read; the size of the geometry if it is complete
+	tree: Optional[TypeTree]  # None if not requested or if not even the first header could be read
+	vertex_count: int  # points in all of the runs read, not counting POINT EMPTY
+	problems: List[WKBProblem]
+	checksum: int  # zlib.crc32 of the `size` bytes read
+
+
+# problems after which nothing more can be read
+FATAL_PROBLEMS = {"byte_order", "geometry_type", "truncated", "too_deep"}
+
+# Multi* type_key: type_key of its members
+MapMemberTypeKey = {
+	4: 1,
+	5: 2,
+	6: 3,
+}
+
+
+def truncated(offset: Offset, what: str, needed: int, remaining: int) -> WKBProblem:
+	return WKBProblem("truncated", offset, f"WKB data truncated. {what} {needed} bytes but only {remaining} bytes remain")
+
+
+def validate_Geometry(wkb: memoryview, offset: Offset, tree: bool, max_depth: int) -> Tuple[Optional[TypeTree], int, Offset, List[WKBProblem]]:
+	# Walks the geometry starting at `offset`, returning (tree, vertex_count, offset, problems). The offset is just past
+	# the end of the geometry, or at the start of the part which could not be read.
+	# As in walk_Geometry, `left` is the number of members still to be read in the innermost open collection and `outer`
+	# holds the same for each enclosing collection, along with what is expected of their members.
+	get_header = MapGeometryHeader.get
+	unpack_header = HeaderParser.unpack_from
+	size = len(wkb)
+	problems: List[WKBProblem] = []
+	vertex_count = 0
+	root: list = []
+	members = root
+	parent_type_key = 0
+	parent_dimension_key = 0
+	outer: List[Tuple[int, list, int, int]] = []
+	left = 0
+	while True:
+		if size - offset < 5:
+			problems.append(truncated(offset, "A geometry header needs", 5, size - offset))
+			break
+		header = get_header(unpack_header(wkb, offset))
+		if header is None:
+			byte = wkb[offset]
+			if byte > 1:
+				problems.append(WKBProblem("byte_order", offset, f"Invalid byte order {byte}"))
+			else:
+				message = str(invalid_geometry_header(wkb, offset, MapExtraDimensionNames, MapGeometryTypeName))
+				problems.append(WKBProblem("geometry_type", offset + 1, message))
+			break
+		byte_order, int_parser, point_parser, swap, type_key, dimension_key, dimension_count, header_size = header
+		if size - offset < header_size:
+			problems.append(truncated(offset, "A geometry header with an SRID needs", header_size, size - offset))
+			break
+		if parent_type_key:
+			if parent_type_key != 7 and type_key != MapMemberTypeKey[parent_type_key]:
+				problems.append(WKBProblem("member_type", offset, f"{MapGeometryTypeName[parent_type_key]} has a {MapGeometryTypeName[type_key]} member"))
+			# the members of a Multi* geometry share its dimensions. A GeometryCollection has Z if any member has Z, and M
+			# if any member has M (dimension_key bit 1 is Z, bit 2 is M), so each member only needs a subset of them
+			if dimension_key & ~parent_dimension_key if parent_type_key == 7 else dimension_key != parent_dimension_key:
+				problems.append(WKBProblem("member_dimensions", offset, f"{MapExtraDimensionNames[parent_dimension_key][1]} {MapGeometryTypeName[parent_type_key]} has an {MapExtraDimensionNames[dimension_key][1]} member"))
+		start = offset
+		offset += header_size
+		point_size = point_parser.size
+		if type_key == 1:
+			if size - offset < point_size:
+				problems.append(truncated(offset, "1 points need", point_size, size - offset))
+				offset = start
+				break
+			if not isnan(unpack_from(byte_order + "d", wkb, offset)[0]):
+				vertex_count += 1
+			offset += point_size
+		else:
+			if size - offset < 4:
+				problems.append(truncated(offset, "A count needs", 4, size - offset))
+				offset = start
+				break
+			count = unpack_from(int_parser, wkb, offset)[0]
+			offset += 4
+			if type_key == 2:
+				if count * point_size > size - offset:
+					problems.append(truncated(offset, f"{count} points need", count * point_size, size - offset))
+					offset = start
+					break
+				vertex_count += count
+				offset += count * point_size
+			elif type_key == 3:
+				if count * MIN_RING_SIZE > size - offset:
+					problems.append(truncated(offset, f"{count} rings need at least", count * MIN_RING_SIZE, size - offset))
+					offset = start
+					break
+				for _ in range(count):
+					if size - offset < 4:
+						problem = truncated(offset, "A ring needs", 4, size - offset)
+						break
+					num_points = unpack_from(int_parser, wkb, offset)[0]
+					run_size = num_points * point_size
+					if run_size > size - offset - 4:
+						problem = truncated(offset + 4, f"{num_points} points need", run_size, size - offset - 4)
+						break
+					end = offset + 4 + run_size
+					if num_points and wkb[offset + 4:offset + 4 + point_size] != wkb[end - point_size:end]:
+						problems.append(WKBProblem("unclosed_ring", offset, f"Ring of {num_points} points does not end at its first point"))
+					vertex_count += num_points
+					offset = end
+				else:
+					problem = None
+				if problem is not None:
+					problems.append(problem)
+					offset = start
+					break
+			else:
+				if count * MIN_GEOMETRY_SIZE > size - offset:
+					problems.append(truncated(offset, f"{count} members need at least", count * MIN_GEOMETRY_SIZE, size - offset))
+					offset = start
+					break
+				if len(outer) >= max_depth:
+					problems.append(WKBProblem("too_deep", start, f"WKB geometry is nested more than {max_depth} deep. See set_limits()"))
+					offset = start
+					break
+				node_members: list = []
+				if tree:
+					members.append((MapGeometryTypeName[type_key], MapExtraDimensionNames[dimension_key][1], node_members))
+				if count:
+					outer.append((left, members, parent_type_key, parent_dimension_key))
+					left = count
+					members = node_members
+					parent_type_key = type_key
+					parent_dimension_key = dimension_key
+					continue
+		if tree and type_key < 4:
+			members.append((MapGeometryTypeName[type_key], MapExtraDimensionNames[dimension_key][1], []))
+		# a geometry is complete, and with it any collections it was the last member of
+		while True:
+			if not outer:
+				return (root[0] if root else None), vertex_count, offset, problems
+			left -= 1
+			if left:
+				break
+			left, members, parent_type_key, parent_dimension_key = outer.pop()
+	return (root[0] if root else None), vertex_count, offset, problems
+
+
+def validate_View(view: memoryview, tree: bool, max_depth: Optional[int]) -> WKBValidation:
+	if max_depth is None:
+		max_depth = get_limits()[0]
+	type_tree, vertex_count, offset, problems = validate_Geometry(view, 0, tree, max_depth)
+	if offset < len(view) and not (problems and problems[-1].code in FATAL_PROBLEMS):
+		problems.append(WKBProblem("trailing_bytes", offset, f"WKB data not fully parsed. {len(view) - offset} bytes remaining"))
+	return WKBValidation(not problems, offset, type_tree, vertex_count, problems, zlib.crc32(view[:offset]))
+
+
+def wkb_validate(wkb: WKBBuffer, tree: bool = True, max_depth: Optional[int] = None) -> WKBValidation:
+	"""
+	Checks the structure of WKB (or PostGIS EWKB) geometry without decoding its coordinates, and returns a
+	WKBValidation: whether it is valid, the bytes read, the tree of geometry types, the vertex count, the problems
+	found (bad byte order or type codes, truncation, unclosed rings, members of the wrong type or dimensions, trailing
+	bytes) and a CRC32 of the bytes read. Nothing is raised for bad WKB.
+	`tree=False` skips building the tree of geometry types. `max_depth` defaults to the limit of set_limits().
+	"""
+	with as_memoryview(wkb) as view:
+		return validate_View(view, tree, max_depth)
+
+
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0, tree: bool = True, max_depth: Optional[int] = None) -> Iterator[Optional[WKBValidation]]:
+	# Same as calling wkb_validate() on each item.
+	# Bad WKB is reported in the result, so only items which are not buffers at all fail. If an `errors` list is
+	# supplied those are yielded as None and (row_index, exception) is appended to `errors`
+	if max_depth is None:
+		max_depth = get_limits()[0]
+	for index, wkb in enumerate(wkbs, start):
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		yield validate_View(view, tree, max_depth)
+
+
+def wkb_validate_many(
+	wkbs: Iterable[WKBBuffer],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	tree: bool = True,
+	max_depth: Optional[int] = None,
+) -> Iterator[Optional[WKBValidation]]:
+	if parallel:
+		return parallel_decode(with_settings(partial(parse_many, tree=tree, max_depth=max_depth)), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors, 0, tree, max_depth)
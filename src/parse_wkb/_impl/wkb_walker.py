@@ -0,0 +1,310 @@
+from __future__ import annotations
+from array import array
+from functools import partial
+from struct import unpack_from
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+import warnings
+
+from . import speedups
+from .parallel import DEFAULT_CHUNK_SIZE
+from .parallel import parallel_decode
+from .wkb_reader import ByteOrderChar
+from .wkb_reader import HeaderParser
+from .wkb_reader import MapDimensionCount
+from .wkb_reader import MapHeaderSize
+from .wkb_reader import MapPointParser
+from .wkb_reader import Offset
+from .wkb_reader import UInt32
+from .wkb_reader import WKBBuffer
+from .wkb_reader import append_CoordinateRun
+from .wkb_reader import as_memoryview
+from .wkb_reader import geometry_type_codes
+from .wkb_reader import header_key
+from .wkb_reader import invalid_geometry_header
+from .wkb_reader import parse_UInt32
+from .wkb_reader import swap_byte_order_char
+
+# The one walker behind wkb_to_geojson, wkb_to_wkt, wkb_to_geojson_str and wkb_to_abstract.
+# walk_Geometry reads the headers and counts, reads each run of coordinates in bulk into an array("d") (in native byte
+# order, see append_CoordinateRun) and hands the pieces to a builder, which decides what to make of them.
+# The single point of a Point is unpacked to a tuple instead, which is cheaper for one point.
+# Point, LineString and Polygon arrive in one call with all of their runs. Multi* and GeometryCollection arrive as
+# begin_collection, then each member, then end_collection.
+# Counts are checked against the bytes remaining before anything is read or allocated for them.
+
+DimensionCount = int  # Literal[2, 3, 4]
+DimensionNames = str  # Literal["XY", "XYZ", "XYM", "XYZM"]
+Run = Sequence[float]  # a tuple holding the one point of a Point, or an array("d") of interleaved coordinates
+
+MapExtraDimensionNames: Dict[int, Tuple[DimensionCount, DimensionNames]] = {
+	0: (2, "XY"),
+	1: (3, "XYZ"),
+	2: (3, "XYM"),
+	3: (4, "XYZM")
+}
+
+MapGeometryTypeName: Dict[int, str] = {
+	1: "Point",
+	2: "LineString",
+	3: "Polygon",
+	4: "MultiPoint",
+	5: "MultiLineString",
+	6: "MultiPolygon",
+	7: "GeometryCollection",
+}
+
+
+class WKBBuilder:
+	"""
+	Receives the parts of a WKB geometry from walk_wkb(), in the order they are stored.
+	Subclass it and override the methods to build any representation without going through GeoJSON first.
+
+	- `type_key` is 1 to 7 (Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon, GeometryCollection)
+	- `dimension_key` is 0 to 3 (XY, XYZ, XYM, XYZM)
+	- `byte_order` is "<" or ">", and `srid` is the PostGIS EWKB SRID or None
+	- each run is a sequence of interleaved coordinates: a tuple holding the one point of a Point, or an `array("d")`
+	  (in native byte order) of the points of a LineString or of one ring of a Polygon
+	"""
+	__slots__ = ()
+
+	def geometry(self, type_key: int, dimension_key: int, byte_order: ByteOrderChar, srid: Optional[UInt32], runs: List[Run]) -> None:
+		"""A Point, LineString or Polygon"""
+
+	def begin_collection(self, type_key: int, dimension_key: int, byte_order: ByteOrderChar, srid: Optional[UInt32], count: int) -> None:
+		"""A MultiPoint, MultiLineString, MultiPolygon or GeometryCollection, followed by its `count` members"""
+
+	def end_collection(self) -> None:
+		"""The end of the members of the most recent begin_collection()"""
+
+	def result(self) -> Any:
+		"""What walk_wkb() returns"""
+
+
+# Limits on the geometry walk_Geometry will read, so that hostile or broken input fails fast rather than using a lot of
+# time or memory. See set_limits
+DEFAULT_MAX_DEPTH = 1000
+depth_limit: int = DEFAULT_MAX_DEPTH
+element_limit: Optional[int] = None
+
+# The smallest possible geometry (byte order, type number and a count of 0) and ring (a count of 0), used to reject
+# counts which could not possibly fit in the bytes remaining
+MIN_GEOMETRY_SIZE = 9
+MIN_RING_SIZE = 4
+
+# more elements than any WKB could hold, used when there is no element limit
+UNLIMITED_ELEMENTS = 1 << 62
+
+# set by collect_stats(), see wkb_stats.py
+profiler: Optional[Callable[[memoryview, Offset, WKBBuilder, Optional[int], Optional[int]], Offset]] = None
+
+
+def set_limits(max_depth: int = DEFAULT_MAX_DEPTH, max_elements: Optional[int] = None) -> None:
+	"""
+	Sets the limits applied by every WKB reader in this process.
+	`max_depth` is the deepest nesting of Multi* and GeometryCollection geometry accepted (a MultiPoint is 1 deep, a
+	GeometryCollection holding a MultiPoint is 2 deep). `max_elements` is the largest number of geometries, rings and
+	points accepted in one WKB geometry, or None for no limit.
+	"""
+	global depth_limit, element_limit
+	if max_depth < 0:
+		raise Exception(f"max_depth must be at least 0, got {max_depth}")
+	if max_elements is not None and max_elements < 0:
+		raise Exception(f"max_elements must be None or at least 0, got {max_elements}")
+	depth_limit = max_depth
+	element_limit = max_elements
+
+
+def get_limits() -> Tuple[int, Optional[int]]:
+	"""The limits set by set_limits(), as (max_depth, max_elements)"""
+	return depth_limit, element_limit
+
+
+def run_with_settings(convert_many: Callable, max_depth: int, max_elements: Optional[int], backend: speedups.Backend, items: Iterable, errors: Optional[List[Tuple[int, Exception]]], start: int) -> Iterator[Any]:
+	# runs in a worker process: applies the limits and backend of the parent process, then converts a chunk
+	set_limits(max_depth, max_elements)
+	speedups.set_backend(backend)
+	return convert_many(items, errors, start)
+
+
+def with_settings(convert_many: Callable) -> Callable:
+	# convert_many (a parse_many or encode_many) for a worker process, taking along the limits of set_limits() and the
+	# backend of set_backend(). Workers started with the "spawn" method (the default on macOS and Windows) import the
+	# package afresh, and would otherwise fall back to the defaults
+	return partial(run_with_settings, convert_many, depth_limit, element_limit, speedups.get_backend())
+
+
+def compiled_limits() -> Tuple[int, int]:
+	# the limits of set_limits() in the form taken by the compiled core
+	return depth_limit, -1 if element_limit is None else element_limit
+
+
+def walk_Geometry(wkb: memoryview, offset: Offset, builder: WKBBuilder, max_depth: Optional[int] = None, max_elements: Optional[int] = None, profile: bool = True) -> Offset:
+	# Walks the geometry starting at `offset`, returning the offset just past its end. `max_depth` and `max_elements`
+	# default to the limits of set_limits().
+	# While collect_stats() is active the walk is handed to `profiler`, which times it and walks again with
+	# profile=False. Otherwise the hook costs one test per geometry.
+	# Nested geometry is walked with an explicit stack rather than by recursion, so that nesting costs no python frames
+	# and is only limited by `max_depth`. `left` is the number of members still to be read in the innermost open
+	# collection, and `outer` holds the same for each enclosing collection.
+	if profiler is not None and profile:
+		return profiler(wkb, offset, builder, max_depth, max_elements)
+	if max_depth is None:
+		max_depth = depth_limit
+	if max_elements is None:
+		max_elements = element_limit
+	elements_left = UNLIMITED_ELEMENTS if max_elements is None else max_elements
+	get_header = MapGeometryHeader.get
+	unpack_header = HeaderParser.unpack_from
+	geometry = builder.geometry
+	size = len(wkb)
+	outer: List[int] = []
+	left = 0
+	while True:
+		header = get_header(unpack_header(wkb, offset))
+		if header is None:
+			raise invalid_geometry_header(wkb, offset, MapExtraDimensionNames, MapGeometryTypeName)
+		byte_order, int_parser, point_parser, swap, type_key, dimension_key, dimension_count, header_size = header
+		srid = unpack_from(int_parser, wkb, offset + 5)[0] if header_size == 9 else None
+		offset += header_size
+		elements_left -= 1
+		if type_key == 1:
+			end = offset + point_parser.size
+			if end > size:
+				raise Exception(f"WKB data truncated. 1 points need {point_parser.size} bytes but only {size - offset} bytes remain")
+			if elements_left < 0:
+				raise too_many_elements(max_elements)
+			geometry(1, dimension_key, byte_order, srid, [point_parser.unpack_from(wkb, offset)])
+			offset = end
+		else:
+			count, offset = parse_UInt32(wkb, offset, int_parser)
+			elements_left -= count
+			if elements_left < 0:
+				raise too_many_elements(max_elements)
+			if type_key == 2:
+				run = array("d")
+				offset = append_CoordinateRun(wkb, offset, count, dimension_count, swap, run)
+				geometry(2, dimension_key, byte_order, srid, [run])
+			elif type_key == 3:
+				# rings are not checked for closure here. wkb_validate reports unclosed rings
+				if count * MIN_RING_SIZE > size - offset:
+					raise truncated_count(count, "rings", MIN_RING_SIZE, size - offset)
+				runs: List[Run] = []
+				for _ in range(count):
+					num_points, offset = parse_UInt32(wkb, offset, int_parser)
+					elements_left -= num_points
+					if elements_left < 0:
+						raise too_many_elements(max_elements)
+					run = array("d")
+					offset = append_CoordinateRun(wkb, offset, num_points, dimension_count, swap, run)
+					runs.append(run)
+				geometry(3, dimension_key, byte_order, srid, runs)
+			else:
+				if count * MIN_GEOMETRY_SIZE > size - offset:
+					raise truncated_count(count, "members", MIN_GEOMETRY_SIZE, size - offset)
+				if len(outer) >= max_depth:
+					raise Exception(f"WKB geometry is nested more than {max_depth} deep. See set_limits()")
+				builder.begin_collection(type_key, dimension_key, byte_order, srid, count)
+				if count:
+					outer.append(left)
+					left = count
+					continue
+				builder.end_collection()
+		# a geometry is complete, and with it any collections it was the last member of
+		while True:
+			if not outer:
+				return offset
+			left -= 1
+			if left:
+				break
+			left = outer.pop()
+			builder.end_collection()
+
+
+def truncated_count(count: int, items: str, item_size: int, size: int) -> Exception:
+	return Exception(f"WKB data truncated. {count} {items} need at least {count * item_size} bytes but only {size} bytes remain")
+
+
+def too_many_elements(max_elements: Optional[int]) -> Exception:
+	return Exception(f"WKB geometry has more than {max_elements} geometries, rings and points. See set_limits()")
+
+
+# Every valid geometry header (ISO and EWKB) resolved up front, so that walk_Geometry needs a single lookup per geometry
+MapGeometryHeader = {
+	header_key(byte_order, geom_type_integer): (
+		byte_order,
+		byte_order + "I",
+		MapPointParser[byte_order, MapDimensionCount[dimension_key]],
+		byte_order == swap_byte_order_char,
+		type_key,
+		dimension_key,
+		MapDimensionCount[dimension_key],
+		MapHeaderSize[has_srid],
+	)
+	for byte_order in "<>"
+	for dimension_key in MapExtraDimensionNames
+	for type_key in MapGeometryTypeName
+	for geom_type_integer, has_srid in geometry_type_codes(type_key, dimension_key)
+}
+
+
+def walk_wkb(wkb: WKBBuffer, builder: WKBBuilder, max_depth: Optional[int] = None, max_elements: Optional[int] = None) -> Any:
+	"""
+	Walks WKB (or PostGIS EWKB) geometry, calling the methods of `builder` for each part, and returns
+	`builder.result()`. See WKBBuilder.
+	`max_depth` and `max_elements` override the limits of set_limits() for this call.
+	"""
+	with as_memoryview(wkb) as view:
+		offset = walk_Geometry(view, 0, builder, max_depth, max_elements)
+		remaining = len(view) - offset
+	if remaining > 0:
+		warnings.warn(f"WKB data not fully parsed. {remaining} bytes remaining")
+	return builder.result()
+
+
+def parse_many(wkbs: Iterable[WKBBuffer], errors: Optional[List[Tuple[int, Exception]]] = None, start: int = 0, builder_factory: Callable[[], WKBBuilder] = WKBBuilder, max_depth: Optional[int] = None, max_elements: Optional[int] = None) -> Iterator[Any]:
+	# Same as calling walk_wkb(wkb, builder_factory(), max_depth, max_elements) on each item.
+	# If an `errors` list is supplied, rows which fail are yielded as None and (row_index, exception) is appended to `errors`
+	for index, wkb in enumerate(wkbs, start):
+		builder = builder_factory()
+		try:
+			view = memoryview(wkb)
+			if view.format != "B" or view.ndim != 1:
+				view = view.cast("B")
+			offset = walk_Geometry(view, 0, builder, max_depth, max_elements)
+			result = builder.result()
+		except Exception as error:
+			if errors is None:
+				raise
+			errors.append((index, error))
+			yield None
+			continue
+		if offset < len(view):
+			warnings.warn(f"WKB data not fully parsed. {len(view) - offset} bytes remaining in row {index}")
+		yield result
+
+
+def walk_wkb_many(
+	wkbs: Iterable[WKBBuffer],
+	builder_factory: Callable[[], WKBBuilder],
+	errors: Optional[List[Tuple[int, Exception]]] = None,
+	parallel: bool = False,
+	max_workers: Optional[int] = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	max_depth: Optional[int] = None,
+	max_elements: Optional[int] = None,
+) -> Iterator[Any]:
+	"""
+	walk_wkb() for an iterable of WKB blobs, with a new builder from `builder_factory()` for each.
+	With `parallel=True` the factory and the results must be picklable.
+	"""
+	if parallel:
+		return parallel_decode(with_settings(partial(parse_many, builder_factory=builder_factory, max_depth=max_depth, max_elements=max_elements)), wkbs, errors, max_workers, chunk_size)
+	return parse_many(wkbs, errors, 0, builder_factory, max_depth, max_elements)
@@ -0,0 +1,338 @@
+from __future__ import annotations
+from array import array
+from itertools import chain
+import re
+from struct import Struct
+import sys
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from .wkb_to_geojson import Geometry
+from .wkb_transcode import Flavor
+from .wkb_transcode import wkb_transcode
+from .wkb_to_geojson import wkb_to_geojson
+
+# WKT is written straight into a WKB bytearray as it is scanned; no intermediate tree is built.
+# Counts and geometry types are not known until the items have been read, so a placeholder is written first and
+# patched afterwards with pack_into. The regex tokenizer is only used for the structure (type names, parentheses and
+# commas). Each run of coordinates between a pair of parentheses is split and converted to doubles in bulk.
+# The output is always little endian, to match geojson_to_wkb.
+
+Position = int  # position of the cursor within the wkt string
+DimensionCount = int  # Literal[2, 3, 4]
+TypeOffset = int  # Literal[0, 1000, 2000, 3000], the ISO `geom_type // 1000` part of a geometry type number
+
+TokenPattern = re.compile(r"\s*([A-Za-z]+|[(),])")
+WhitespacePattern = re.compile(r"\s*")
+SRIDPattern = re.compile(r"\s*SRID\s*=\s*(\d+)\s*;", re.IGNORECASE)  # the EWKT prefix written by PostGIS, eg. "SRID=4326;POINT (1 2)"
+
+HeaderEncoder = Struct("<BI")
+UInt32Encoder = Struct("<I")
+swap_byte_order = sys.byteorder != "little"
+
+MapDimensionTag: Dict[str, Tuple[TypeOffset, DimensionCount]] = {
+	"Z": (1000, 3),
+	"M": (2000, 3),
+	"ZM": (3000, 4),
+}
+
+# Used when there is no dimension tag and the number of dimensions has to be inferred from the coordinates
+MapDimensionCountTypeOffset: Dict[DimensionCount, TypeOffset] = {
+	2: 0,
+	3: 1000,
+	4: 3000,
+}
+
+MapTypeOffsetDimensionCount: Dict[TypeOffset, DimensionCount] = {
+	0: 2,
+	1000: 3,
+	2000: 3,
+	3000: 4,
+}
+
+
+def parse_Token(wkt: str, position: Position) -> Tuple[str, Position]:
+	match = TokenPattern.match(wkt, position)
+	if match is None:
+		if wkt[position:].strip() == "":
+			return "", len(wkt)
+		position += len(wkt[position:]) - len(wkt[position:].lstrip())
+		raise Exception(f"Unexpected character {wkt[position]!r} at position {position} in WKT")
+	return match.group(1), match.end()
+
+
+def skip_Whitespace(wkt: str, position: Position) -> Position:
+	match = WhitespacePattern.match(wkt, position)
+	return position if match is None else match.end()
+
+
+def expect_Token(wkt: str, position: Position, expected: str) -> Position:
+	token, position = parse_Token(wkt, position)
+	if token != expected:
+		raise Exception(f"Expected {expected!r} but found {token or 'end of WKT'!r} before position {position} in WKT")
+	return position
+
+
+def parse_CoordinateRun(wkt: str, position: Position, dimension_count: Optional[DimensionCount]) -> Tuple[array, int, Optional[DimensionCount], Position]:
+	# Reads comma separated coordinates from just after a "(" up to and including the matching ")"
+	end = wkt.find(")", position)
+	if end == -1:
+		raise Exception(f"Unexpected end of WKT. Missing ')' for the coordinates starting at position {position}")
+	segment = wkt[position:end]
+	if "(" in segment:
+		raise Exception(f"Unexpected '(' at position {position + segment.index('(')} in WKT")
+	if segment.strip() == "":
+		# "LINESTRING ()" is how wkb_to_wkt writes a geometry with no coordinates. It leaves the number of values open
+		return array("d"), 0, dimension_count, end + 1
+	points = list(map(str.split, segment.split(",")))
+	if dimension_count is None:
+		dimension_count = len(points[0])
+		if dimension_count not in MapDimensionCountTypeOffset:
+			raise Exception(f"WKT coordinates must have 2, 3 or 4 values. Found {dimension_count} at position {position}")
+	if set(map(len, points)) != {dimension_count}:
+		raise Exception(f"WKT coordinates starting at position {position} do not all have {dimension_count} values")
+	try:
+		flat_coordinates = array("d", map(float, chain.from_iterable(points)))
+	except ValueError as error:
+		raise Exception(f"Invalid WKT coordinate in the coordinates starting at position {position}. {error}")
+	if swap_byte_order:
+		flat_coordinates.byteswap()
+	return flat_coordinates, len(points), dimension_count, end + 1
+
+
+def write_EmptyPoint(out: bytearray, dimension_count: DimensionCount):
+	# There is no way to write an empty point in WKB, so like GEOS we write NaN coordinates
+	flat_coordinates = array("d", [float("nan")] * dimension_count)
+	out += flat_coordinates.tobytes()
+
+
+def begin_Count(out: bytearray) -> Position:
+	count_position = len(out)
+	out += b"\x00\x00\x00\x00"
+	return count_position
+
+
+def resolve_Dimensions(type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[TypeOffset, DimensionCount]:
+	# The type offset and number of values of a geometry. A tag inherited from an enclosing GEOMETRYCOLLECTION only
+	# applies if the coordinates have its number of values, as wkb_to_wkt writes no tag on an XY member of an XYZ one
+	if dimension_count is None:
+		if type_offset is None:
+			return 0, 2
+		return type_offset, MapTypeOffsetDimensionCount[type_offset]
+	if type_offset is None or MapTypeOffsetDimensionCount[type_offset] != dimension_count:
+		return MapDimensionCountTypeOffset[dimension_count], dimension_count
+	return type_offset, dimension_count
+
+
+def parse_Items(wkt: str, position: Position, out: bytearray, parse_item, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount], member_type_number: int = 0) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	# Reads `item ("," item)* ")"`, writing the number of items followed by each item.
+	# The number of values found on one item is passed on to the items after it and returned. The members of a MULTI*
+	# geometry (of type `member_type_number`) read before it was known, being EMPTY or without coordinates, are
+	# rewritten once it is
+	count_position = begin_Count(out)
+	count = 0
+	if wkt.startswith(")", skip_Whitespace(wkt, position)):
+		return expect_Token(wkt, position, ")"), type_offset, dimension_count
+	unresolved = []
+	while True:
+		item_position = len(out)
+		position, type_offset, dimension_count = parse_item(wkt, position, out, type_offset, dimension_count)
+		if dimension_count is None:
+			unresolved.append(item_position)
+		count += 1
+		token, position = parse_Token(wkt, position)
+		if token == ")":
+			break
+		if token != ",":
+			raise Exception(f"Expected ',' or ')' but found {token or 'end of WKT'!r} before position {position} in WKT")
+	UInt32Encoder.pack_into(out, count_position, count)
+	if member_type_number and unresolved and dimension_count is not None:
+		# from the last, so that resizing an EMPTY point leaves the positions of those before it as they are
+		for item_position in reversed(unresolved):
+			rewrite_Member(out, item_position, member_type_number, type_offset, dimension_count)
+	return position, type_offset, dimension_count
+
+
+def rewrite_Member(out: bytearray, header_position: Position, type_number: int, type_offset: Optional[TypeOffset], dimension_count: DimensionCount):
+	# Rewrites the header of a member written before the number of values was known, and the NaN coordinates of an EMPTY point
+	if type_number == 1:
+		start = header_position + HeaderEncoder.size
+		written = resolve_Dimensions(type_offset, None)[1]
+		out[start:start + 8 * written] = array("d", [float("nan")] * dimension_count).tobytes()
+	end_Geometry(out, header_position, type_number, type_offset, dimension_count)
+
+
+def parse_Point(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	flat_coordinates, num_points, dimension_count, end = parse_CoordinateRun(wkt, position, dimension_count)
+	if num_points != 1:
+		raise Exception(f"WKT POINT must have exactly one coordinate. Found {num_points} at position {position}")
+	out += flat_coordinates.tobytes()
+	return end, type_offset, dimension_count
+
+
+def parse_LineString(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	flat_coordinates, num_points, dimension_count, end = parse_CoordinateRun(wkt, position, dimension_count)
+	out += UInt32Encoder.pack(num_points)
+	out += flat_coordinates.tobytes()
+	return end, type_offset, dimension_count
+
+
+def parse_LinearRing(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	position = expect_Token(wkt, position, "(")
+	return parse_LineString(wkt, position, out, type_offset, dimension_count)
+
+
+def parse_Polygon(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	return parse_Items(wkt, position, out, parse_LinearRing, type_offset, dimension_count)
+
+
+def parse_Member(type_number: int, body_parser):
+	# Wraps a body parser so that it reads one member of a MULTI* geometry, which may be EMPTY, and writes its header
+	def parse_member(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+		header_position = len(out)
+		out += bytes(HeaderEncoder.size)
+		token, position = parse_Token(wkt, position)
+		if token.upper() == "EMPTY":
+			write_Empty(out, type_number, resolve_Dimensions(type_offset, dimension_count)[1])
+		elif token == "(":
+			position, type_offset, dimension_count = body_parser(wkt, position, out, type_offset, dimension_count)
+		else:
+			raise Exception(f"Expected '(' or 'EMPTY' but found {token or 'end of WKT'!r} before position {position} in WKT")
+		end_Geometry(out, header_position, type_number, type_offset, dimension_count)
+		return position, type_offset, dimension_count
+	return parse_member
+
+
+def parse_MultiPoint(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	start = skip_Whitespace(wkt, position)
+	if wkt.startswith("(", start) or wkt[start:start + 5].upper() == "EMPTY":
+		return parse_Items(wkt, position, out, parse_MultiPointMember, type_offset, dimension_count, 1)
+	# MULTIPOINT (1 2, 3 4) without parentheses around each point, which is what wkb_to_wkt produces
+	flat_coordinates, num_points, dimension_count, end = parse_CoordinateRun(wkt, position, dimension_count)
+	point_type_offset, point_dimension_count = resolve_Dimensions(type_offset, dimension_count)
+	point_header = HeaderEncoder.pack(1, point_type_offset + 1)
+	point_size = 8 * point_dimension_count
+	coordinate_bytes = flat_coordinates.tobytes()
+	out += UInt32Encoder.pack(num_points)
+	for start in range(0, len(coordinate_bytes), point_size):
+		out += point_header
+		out += coordinate_bytes[start:start + point_size]
+	return end, type_offset, dimension_count
+
+
+def parse_MultiLineString(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	return parse_Items(wkt, position, out, parse_MultiLineStringMember, type_offset, dimension_count, 2)
+
+
+def parse_MultiPolygon(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	return parse_Items(wkt, position, out, parse_MultiPolygonMember, type_offset, dimension_count, 3)
+
+
+def parse_GeometryCollection(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	# Unlike the members of a MULTI* geometry, the members of a GEOMETRYCOLLECTION may differ in dimensions. Each starts
+	# from the tag of the collection (its own, or one inherited from an enclosing collection) rather than from the
+	# members before it. Without a tag of its own (`dimension_count` is None) the collection has Z if any member has Z,
+	# and M if any member has M, as in GEOS
+	count_position = begin_Count(out)
+	count = 0
+	if wkt.startswith(")", skip_Whitespace(wkt, position)):
+		return expect_Token(wkt, position, ")"), type_offset, dimension_count
+	flags = 0  # the union of the `type_offset // 1000` of the members: 1 for Z and 2 for M
+	while True:
+		position, member_type_offset, member_dimension_count = parse_Geometry(wkt, position, out, type_offset, None)
+		flags |= resolve_Dimensions(member_type_offset, member_dimension_count)[0] // 1000
+		count += 1
+		token, position = parse_Token(wkt, position)
+		if token == ")":
+			break
+		if token != ",":
+			raise Exception(f"Expected ',' or ')' but found {token or 'end of WKT'!r} before position {position} in WKT")
+	UInt32Encoder.pack_into(out, count_position, count)
+	if dimension_count is not None:
+		return position, type_offset, dimension_count
+	return position, 1000 * flags, MapTypeOffsetDimensionCount[1000 * flags]
+
+
+parse_MultiPointMember = parse_Member(1, parse_Point)
+parse_MultiLineStringMember = parse_Member(2, parse_LineString)
+parse_MultiPolygonMember = parse_Member(3, parse_Polygon)
+
+
+def write_Empty(out: bytearray, type_number: int, dimension_count: DimensionCount):
+	if type_number == 1:
+		write_EmptyPoint(out, dimension_count)
+	else:
+		out += UInt32Encoder.pack(0)
+
+
+def end_Geometry(out: bytearray, header_position: Position, type_number: int, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]):
+	type_offset, _ = resolve_Dimensions(type_offset, dimension_count)
+	HeaderEncoder.pack_into(out, header_position, 1, type_offset + type_number)
+
+
+def parse_Geometry(wkt: str, position: Position, out: bytearray, type_offset: Optional[TypeOffset], dimension_count: Optional[DimensionCount]) -> Tuple[Position, Optional[TypeOffset], Optional[DimensionCount]]:
+	# `type_offset` is inherited from an enclosing GEOMETRYCOLLECTION unless this geometry has its own Z/M/ZM tag, which
+	# also sets `dimension_count`. Both are returned, for the dimensions of an untagged GEOMETRYCOLLECTION around it
+	token, position = parse_Token(wkt, position)
+	type_name = token.upper()
+	type_parser = MapGeometryTypeNumberAndParser.get(type_name)
+	if type_parser is None:
+		raise Exception(f"Unknown WKT geometry type {token or 'end of WKT'!r} before position {position}")
+	type_number, body_parser = type_parser
+	token, position = parse_Token(wkt, position)
+	tag = token.upper()
+	if tag in MapDimensionTag:
+		type_offset, dimension_count = MapDimensionTag[tag]
+		token, position = parse_Token(wkt, position)
+	header_position = len(out)
+	out += bytes(HeaderEncoder.size)
+	if token.upper() == "EMPTY":
+		write_Empty(out, type_number, resolve_Dimensions(type_offset, dimension_count)[1])
+	elif token == "(":
+		position, type_offset, dimension_count = body_parser(wkt, position, out, type_offset, dimension_count)
+	else:
+		raise Exception(f"Expected '(' or 'EMPTY' after {type_name} but found {token or 'end of WKT'!r} before position {position}")
+	end_Geometry(out, header_position, type_number, type_offset, dimension_count)
+	return position, type_offset, dimension_count
+
+
+MapGeometryTypeNumberAndParser = {
+	"POINT": (1, parse_Point),
+	"LINESTRING": (2, parse_LineString),
+	"POLYGON": (3, parse_Polygon),
+	"MULTIPOINT": (4, parse_MultiPoint),
+	"MULTILINESTRING": (5, parse_MultiLineString),
+	"MULTIPOLYGON": (6, parse_MultiPolygon),
+	"GEOMETRYCOLLECTION": (7, parse_GeometryCollection),
+}
+
+
+def parse_SRID(wkt: str, position: Position) -> Tuple[Optional[int], Position]:
+	match = SRIDPattern.match(wkt, position)
+	if match is None:
+		return None, position
+	return int(match.group(1)), match.end()
+
+
+def wkt_to_wkb(wkt: str, flavor: Flavor = "iso") -> bytes:
+	"""
+	Accepts WKT and PostGIS EWKT (with an `SRID=n;` prefix).
+	flavor="iso" writes ISO WKB and drops the SRID, flavor="extended" writes PostGIS EWKB and keeps it.
+	"""
+	if flavor not in ("iso", "extended"):
+		raise Exception(f"Invalid flavor {flavor!r}. Expected 'iso' or 'extended'")
+	srid, position = parse_SRID(wkt, 0)
+	out = bytearray()
+	position, _, _ = parse_Geometry(wkt, position, out, None, None)
+	if wkt[position:].strip():
+		raise Exception(f"Unexpected text after the end of the WKT geometry at position {position}")
+	if flavor == "extended":
+		# the flags are only known once the geometry has been read, so they are set by a second (bulk copying) pass
+		return wkb_transcode(out, flavor="extended", srid=srid)
+	return bytes(out)
+
+
+def wkt_to_geojson(wkt: str) -> Geometry:
+	srid, _ = parse_SRID(wkt, 0)
+	return wkb_to_geojson(wkt_to_wkb(wkt, "iso" if srid is None else "extended"))
@@ -0,0 +1,659 @@
+/*
+ * Optional compiled core for parse_wkb.
+ *
+ * Implements the same walk over WKB (ISO and PostGIS EWKB) as the pure python readers in _impl/wkb_to_geojson.py,
+ * _impl/wkb_to_wkt.py and _impl/wkb_to_geojson_str.py. The python wrappers call these when the extension is available (see _impl/speedups.py) and
+ * handle everything around the walk: the SRID, warnings about trailing bytes and the *_many batching.
+ *
+ * Any malformed input raises DecodeError, without a detailed message. The wrappers then re-run the pure python
+ * reader on the same input, so that the exception raised to the caller is exactly the one the pure python backend
+ * would raise.
+ *
+ *   parse_geojson(wkb, dimension_mask, max_depth, max_elements) -> (geojson dict, offset)
+ *   parse_wkt(wkb, dimension_mask, max_depth, max_elements) -> (wkt str, offset)
+ *   parse_geojson_str(wkb, dimension_mask, max_depth, max_elements, precision, trim) -> (geojson str, offset)
+ *
+ * `dimension_mask` has bit n set if geometry with ISO dimension key n (XY=0, XYZ=1, XYM=2, XYZM=3) is accepted.
+ * `max_depth` and `max_elements` are the limits of wkb_walker.set_limits(), with a negative `max_elements` for no
+ * limit. Elements are counted in the same way as by wkb_walker.walk_Geometry: one per geometry, plus every count read.
+ * `precision` and `trim` are the options of wkb_to_geojson_str(), with a negative `precision` for None.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <math.h>
+#include <stdint.h>
+#include <string.h>
+
+#define EWKB_Z_FLAG 0x80000000u
+#define EWKB_M_FLAG 0x40000000u
+#define EWKB_SRID_FLAG 0x20000000u
+#define EWKB_FLAGS (EWKB_Z_FLAG | EWKB_M_FLAG | EWKB_SRID_FLAG)
+
+static PyObject *DecodeError;
+
+/* interned once in PyInit__speedups, rather than created for every geometry */
+static PyObject *TypeKey;
+static PyObject *CoordinatesKey;
+static PyObject *GeometriesKey;
+static PyObject *GeoJSONTypeValues[8];
+
+static const char *GeoJSONTypeNames[8] = {
+	NULL, "Point", "LineString", "Polygon", "MultiPoint", "MultiLineString", "MultiPolygon", "GeometryCollection",
+};
+
+static const char *WKTTypeNames[8] = {
+	NULL, "POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON", "GEOMETRYCOLLECTION",
+};
+
+static const char *WKTDimensionSuffixes[4] = {"", " Z", " M", " ZM"};
+
+static const int DimensionCounts[4] = {2, 3, 3, 4};
+
+typedef struct {
+	const unsigned char *data;
+	Py_ssize_t size;
+	Py_ssize_t offset;
+	unsigned int dimension_mask;
+	Py_ssize_t depth_left;
+	Py_ssize_t elements_left;
+} Reader;
+
+typedef struct {
+	int swap;
+	int type_units;
+	int dimension_key;
+	int dimension_count;
+} Header;
+
+static int fail(void) {
+	PyErr_SetNone(DecodeError);
+	return -1;
+}
+
+static int spend_Elements(Reader *reader, Py_ssize_t count) {
+	if (count > reader->elements_left) {
+		return fail();
+	}
+	reader->elements_left -= count;
+	return 0;
+}
+
+static int read_UInt32(Reader *reader, int swap, uint32_t *value) {
+	uint32_t raw;
+	if (reader->offset + 4 > reader->size) {
+		return fail();
+	}
+	memcpy(&raw, reader->data + reader->offset, 4);
+	if (swap) {
+		raw = ((raw & 0xFFu) << 24) | ((raw & 0xFF00u) << 8) | ((raw >> 8) & 0xFF00u) | (raw >> 24);
+	}
+	reader->offset += 4;
+	*value = raw;
+	return 0;
+}
+
+static double read_Double(const unsigned char *position, int swap) {
+	double value;
+	if (swap) {
+		unsigned char bytes[8];
+		for (int index = 0; index < 8; index++) {
+			bytes[index] = position[7 - index];
+		}
+		memcpy(&value, bytes, 8);
+	} else {
+		memcpy(&value, position, 8);
+	}
+	return value;
+}
+
+static int is_little_endian(void) {
+	const uint16_t probe = 1;
+	return *(const unsigned char *)&probe == 1;
+}
+
+static int read_Header(Reader *reader, Header *header) {
+	unsigned char byte_order;
+	uint32_t geom_type_integer, type_units, dimension_key;
+	if (reader->offset + 5 > reader->size) {
+		return fail();
+	}
+	byte_order = reader->data[reader->offset];
+	if (byte_order > 1) {
+		return fail();
+	}
+	reader->offset += 1;
+	header->swap = (byte_order == 1) != is_little_endian();
+	if (read_UInt32(reader, header->swap, &geom_type_integer) < 0) {
+		return -1;
+	}
+	if (geom_type_integer & EWKB_FLAGS) {
+		type_units = geom_type_integer & ~EWKB_FLAGS;
+		dimension_key = ((geom_type_integer & EWKB_Z_FLAG) ? 1 : 0) + ((geom_type_integer & EWKB_M_FLAG) ? 2 : 0);
+		if (geom_type_integer & EWKB_SRID_FLAG) {
+			/* the SRID itself is read by the python wrapper */
+			if (reader->offset + 4 > reader->size) {
+				return fail();
+			}
+			reader->offset += 4;
+		}
+	} else {
+		type_units = geom_type_integer % 1000;
+		dimension_key = geom_type_integer / 1000;
+	}
+	if (type_units < 1 || type_units > 7 || dimension_key > 3 || !(reader->dimension_mask & (1u << dimension_key))) {
+		return fail();
+	}
+	if (spend_Elements(reader, 1) < 0) {
+		return -1;
+	}
+	header->type_units = (int)type_units;
+	header->dimension_key = (int)dimension_key;
+	header->dimension_count = DimensionCounts[dimension_key];
+	return 0;
+}
+
+/* checks a count of rings or members against the bytes remaining, the elements left and (for members) the depth left */
+static int check_Members(Reader *reader, const Header *header, uint32_t count) {
+	/* a ring takes at least 4 bytes (its point count), and a member at least 9 (header and count), so a larger count is malformed */
+	Py_ssize_t item_size = header->type_units == 3 ? 4 : 9;
+	if ((Py_ssize_t)count > (reader->size - reader->offset) / item_size || spend_Elements(reader, count) < 0) {
+		return fail();
+	}
+	if (header->type_units != 3 && reader->depth_left <= 0) {
+		return fail();
+	}
+	return 0;
+}
+
+static int check_Run(Reader *reader, uint32_t num_points, int dimension_count) {
+	if ((Py_ssize_t)num_points > (reader->size - reader->offset) / (8 * dimension_count)) {
+		return fail();
+	}
+	return 0;
+}
+
+/* GeoJSON ------------------------------------------------------------------------------------------------------ */
+
+static PyObject *geojson_Point(Reader *reader, const Header *header) {
+	PyObject *point = PyList_New(header->dimension_count);
+	if (point == NULL) {
+		return NULL;
+	}
+	for (int index = 0; index < header->dimension_count; index++) {
+		PyObject *value = PyFloat_FromDouble(read_Double(reader->data + reader->offset, header->swap));
+		if (value == NULL) {
+			Py_DECREF(point);
+			return NULL;
+		}
+		PyList_SET_ITEM(point, index, value);
+		reader->offset += 8;
+	}
+	return point;
+}
+
+static PyObject *geojson_Run(Reader *reader, const Header *header) {
+	uint32_t num_points;
+	PyObject *points;
+	if (read_UInt32(reader, header->swap, &num_points) < 0 || spend_Elements(reader, num_points) < 0 || check_Run(reader, num_points, header->dimension_count) < 0) {
+		return NULL;
+	}
+	points = PyList_New(num_points);
+	if (points == NULL) {
+		return NULL;
+	}
+	for (uint32_t index = 0; index < num_points; index++) {
+		PyObject *point = geojson_Point(reader, header);
+		if (point == NULL) {
+			Py_DECREF(points);
+			return NULL;
+		}
+		PyList_SET_ITEM(points, index, point);
+	}
+	return points;
+}
+
+static PyObject *geojson_Geometry(Reader *reader, int raw);
+
+static PyObject *geojson_Members(Reader *reader, const Header *header, int raw) {
+	uint32_t count;
+	PyObject *members;
+	if (read_UInt32(reader, header->swap, &count) < 0 || check_Members(reader, header, count) < 0) {
+		return NULL;
+	}
+	members = PyList_New(count);
+	if (members == NULL) {
+		return NULL;
+	}
+	if (header->type_units != 3) {
+		reader->depth_left--;
+	}
+	for (uint32_t index = 0; index < count; index++) {
+		PyObject *member;
+		if (header->type_units == 3) {
+			member = geojson_Run(reader, header);
+		} else {
+			member = geojson_Geometry(reader, raw);
+		}
+		if (member == NULL) {
+			Py_DECREF(members);
+			return NULL;
+		}
+		PyList_SET_ITEM(members, index, member);
+	}
+	if (header->type_units != 3) {
+		reader->depth_left++;
+	}
+	return members;
+}
+
+static PyObject *geojson_Geometry(Reader *reader, int raw) {
+	Header header;
+	PyObject *body;
+	if (read_Header(reader, &header) < 0) {
+		return NULL;
+	}
+	if (Py_EnterRecursiveCall(" while decoding nested WKB")) {
+		return NULL;
+	}
+	switch (header.type_units) {
+	case 1:
+		if (check_Run(reader, 1, header.dimension_count) < 0) {
+			body = NULL;
+		} else {
+			body = geojson_Point(reader, &header);
+		}
+		break;
+	case 2:
+		body = geojson_Run(reader, &header);
+		break;
+	case 7:
+		body = geojson_Members(reader, &header, 0);
+		break;
+	default:
+		body = geojson_Members(reader, &header, 1);
+		break;
+	}
+	Py_LeaveRecursiveCall();
+	if (body == NULL || raw) {
+		return body;
+	}
+	PyObject *result = PyDict_New();
+	if (
+		result == NULL
+		|| PyDict_SetItem(result, TypeKey, GeoJSONTypeValues[header.type_units]) < 0
+		|| PyDict_SetItem(result, header.type_units == 7 ? GeometriesKey : CoordinatesKey, body) < 0
+	) {
+		Py_XDECREF(result);
+		result = NULL;
+	}
+	Py_DECREF(body);
+	return result;
+}
+
+/* WKT and GeoJSON text ----------------------------------------------------------------------------------------- */
+
+typedef struct {
+	char *data;
+	Py_ssize_t length;
+	Py_ssize_t capacity;
+	int precision;  /* decimal places, or negative for the shortest text which reads back as the same double */
+	int trim;  /* drop trailing zeros (and a trailing decimal point) from fixed decimals. Ignored without a precision */
+} Writer;
+
+static int write_Bytes(Writer *writer, const char *text, Py_ssize_t length) {
+	if (writer->length + length > writer->capacity) {
+		Py_ssize_t capacity = writer->capacity * 2;
+		char *data;
+		if (capacity < writer->length + length) {
+			capacity = writer->length + length;
+		}
+		data = PyMem_Realloc(writer->data, capacity);
+		if (data == NULL) {
+			PyErr_NoMemory();
+			return -1;
+		}
+		writer->data = data;
+		writer->capacity = capacity;
+	}
+	memcpy(writer->data + writer->length, text, length);
+	writer->length += length;
+	return 0;
+}
+
+static int write_Text(Writer *writer, const char *text) {
+	return write_Bytes(writer, text, (Py_ssize_t)strlen(text));
+}
+
+static int write_Double(Writer *writer, double value, int json) {
+	/* the same text as repr(float) or "%.nf" (see wkb_to_wkt.coordinate_style), spelling NaN and infinity as
+	 * json.dumps does if `json` is set */
+	char *text;
+	Py_ssize_t length;
+	int status;
+	if (json && !isfinite(value)) {
+		return write_Text(writer, isnan(value) ? "NaN" : value > 0 ? "Infinity" : "-Infinity");
+	}
+	if (writer->precision < 0) {
+		text = PyOS_double_to_string(value, 'r', 0, Py_DTSF_ADD_DOT_0, NULL);
+	} else {
+		text = PyOS_double_to_string(value, 'f', writer->precision, 0, NULL);
+	}
+	if (text == NULL) {
+		return -1;
+	}
+	length = (Py_ssize_t)strlen(text);
+	if (writer->precision >= 0 && writer->trim && strchr(text, '.') != NULL) {
+		while (text[length - 1] == '0') {
+			length--;
+		}
+		if (text[length - 1] == '.') {
+			length--;
+		}
+	}
+	status = write_Bytes(writer, text, length);
+	PyMem_Free(text);
+	return status;
+}
+
+/* points separated by ", ". WKT points are written as "x y", and GeoJSON points (if `json` is set) as "[x, y]" */
+static int write_Points(Writer *writer, Reader *reader, const Header *header, uint32_t num_points, int json) {
+	if (check_Run(reader, num_points, header->dimension_count) < 0) {
+		return -1;
+	}
+	for (uint32_t point = 0; point < num_points; point++) {
+		if (point && write_Bytes(writer, ", ", 2) < 0) {
+			return -1;
+		}
+		if (json && write_Bytes(writer, "[", 1) < 0) {
+			return -1;
+		}
+		for (int index = 0; index < header->dimension_count; index++) {
+			if (index && (json ? write_Bytes(writer, ", ", 2) : write_Bytes(writer, " ", 1)) < 0) {
+				return -1;
+			}
+			if (write_Double(writer, read_Double(reader->data + reader->offset, header->swap), json) < 0) {
+				return -1;
+			}
+			reader->offset += 8;
+		}
+		if (json && write_Bytes(writer, "]", 1) < 0) {
+			return -1;
+		}
+	}
+	return 0;
+}
+
+static int write_Run(Writer *writer, Reader *reader, const Header *header, int json) {
+	uint32_t num_points;
+	if (read_UInt32(reader, header->swap, &num_points) < 0 || spend_Elements(reader, num_points) < 0) {
+		return -1;
+	}
+	return write_Points(writer, reader, header, num_points, json);
+}
+
+static int wkt_Geometry(Writer *writer, Reader *reader, int named);
+
+static int wkt_Members(Writer *writer, Reader *reader, const Header *header) {
+	uint32_t count;
+	/* rings, and the members of MultiLineString and MultiPolygon, are wrapped in brackets */
+	int wrap = header->type_units == 3 || header->type_units == 5 || header->type_units == 6;
+	if (read_UInt32(reader, header->swap, &count) < 0 || check_Members(reader, header, count) < 0) {
+		return -1;
+	}
+	if (header->type_units != 3) {
+		reader->depth_left--;
+	}
+	for (uint32_t index = 0; index < count; index++) {
+		int status;
+		if (index && write_Bytes(writer, ", ", 2) < 0) {
+			return -1;
+		}
+		if (wrap && write_Bytes(writer, "(", 1) < 0) {
+			return -1;
+		}
+		if (header->type_units == 3) {
+			status = write_Run(writer, reader, header, 0);
+		} else {
+			status = wkt_Geometry(writer, reader, header->type_units == 7);
+		}
+		if (status < 0) {
+			return -1;
+		}
+		if (wrap && write_Bytes(writer, ")", 1) < 0) {
+			return -1;
+		}
+	}
+	if (header->type_units != 3) {
+		reader->depth_left++;
+	}
+	return 0;
+}
+
+static int wkt_Geometry(Writer *writer, Reader *reader, int named) {
+	Header header;
+	int status;
+	if (read_Header(reader, &header) < 0) {
+		return -1;
+	}
+	if (named) {
+		if (write_Text(writer, WKTTypeNames[header.type_units]) < 0 || write_Text(writer, WKTDimensionSuffixes[header.dimension_key]) < 0 || write_Bytes(writer, " (", 2) < 0) {
+			return -1;
+		}
+	}
+	if (Py_EnterRecursiveCall(" while decoding nested WKB")) {
+		return -1;
+	}
+	switch (header.type_units) {
+	case 1:
+		status = write_Points(writer, reader, &header, 1, 0);
+		break;
+	case 2:
+		status = write_Run(writer, reader, &header, 0);
+		break;
+	default:
+		status = wkt_Members(writer, reader, &header);
+		break;
+	}
+	Py_LeaveRecursiveCall();
+	if (status < 0) {
+		return -1;
+	}
+	if (named) {
+		return write_Bytes(writer, ")", 1);
+	}
+	return 0;
+}
+
+static int geojson_text_Geometry(Writer *writer, Reader *reader, int named);
+
+/* the rings of a Polygon or the members of a Multi* or GeometryCollection, as a JSON array */
+static int geojson_text_Members(Writer *writer, Reader *reader, const Header *header) {
+	uint32_t count;
+	if (read_UInt32(reader, header->swap, &count) < 0 || check_Members(reader, header, count) < 0) {
+		return -1;
+	}
+	if (header->type_units != 3) {
+		reader->depth_left--;
+	}
+	if (write_Bytes(writer, "[", 1) < 0) {
+		return -1;
+	}
+	for (uint32_t index = 0; index < count; index++) {
+		int status;
+		if (index && write_Bytes(writer, ", ", 2) < 0) {
+			return -1;
+		}
+		if (header->type_units == 3) {
+			status = write_Bytes(writer, "[", 1) < 0 || write_Run(writer, reader, header, 1) < 0 ? -1 : write_Bytes(writer, "]", 1);
+		} else {
+			/* members of Multi* geometry are written as bare coordinates */
+			status = geojson_text_Geometry(writer, reader, header->type_units == 7);
+		}
+		if (status < 0) {
+			return -1;
+		}
+	}
+	if (header->type_units != 3) {
+		reader->depth_left++;
+	}
+	return write_Bytes(writer, "]", 1);
+}
+
+static int geojson_text_Geometry(Writer *writer, Reader *reader, int named) {
+	Header header;
+	int status;
+	if (read_Header(reader, &header) < 0) {
+		return -1;
+	}
+	if (named) {
+		if (
+			write_Text(writer, "{\"type\": \"") < 0
+			|| write_Text(writer, GeoJSONTypeNames[header.type_units]) < 0
+			|| write_Text(writer, header.type_units == 7 ? "\", \"geometries\": " : "\", \"coordinates\": ") < 0
+		) {
+			return -1;
+		}
+	}
+	if (Py_EnterRecursiveCall(" while decoding nested WKB")) {
+		return -1;
+	}
+	switch (header.type_units) {
+	case 1:
+		status = write_Points(writer, reader, &header, 1, 1);
+		break;
+	case 2:
+		status = write_Bytes(writer, "[", 1) < 0 || write_Run(writer, reader, &header, 1) < 0 ? -1 : write_Bytes(writer, "]", 1);
+		break;
+	default:
+		status = geojson_text_Members(writer, reader, &header);
+		break;
+	}
+	Py_LeaveRecursiveCall();
+	if (status < 0) {
+		return -1;
+	}
+	if (named) {
+		return write_Bytes(writer, "}", 1);
+	}
+	return 0;
+}
+
+/* module ------------------------------------------------------------------------------------------------------- */
+
+static void open_Reader(Reader *reader, const Py_buffer *buffer, unsigned int dimension_mask, Py_ssize_t max_depth, Py_ssize_t max_elements) {
+	reader->data = buffer->buf;
+	reader->size = buffer->len;
+	reader->offset = 0;
+	reader->dimension_mask = dimension_mask;
+	reader->depth_left = max_depth;
+	reader->elements_left = max_elements < 0 ? PY_SSIZE_T_MAX : max_elements;
+}
+
+static PyObject *parse_geojson(PyObject *Py_UNUSED(module), PyObject *args) {
+	Py_buffer buffer;
+	Reader reader;
+	unsigned int dimension_mask;
+	Py_ssize_t max_depth, max_elements;
+	PyObject *result;
+	if (!PyArg_ParseTuple(args, "y*Inn", &buffer, &dimension_mask, &max_depth, &max_elements)) {
+		return NULL;
+	}
+	open_Reader(&reader, &buffer, dimension_mask, max_depth, max_elements);
+	result = geojson_Geometry(&reader, 0);
+	PyBuffer_Release(&buffer);
+	if (result == NULL) {
+		return NULL;
+	}
+	return Py_BuildValue("Nn", result, reader.offset);
+}
+
+/* runs `write_Geometry` (wkt_Geometry or geojson_text_Geometry) over `buffer`, returning (text, offset) */
+static PyObject *write_TopGeometry(Py_buffer *buffer, Reader *reader, Writer *writer, int (*write_Geometry)(Writer *, Reader *, int)) {
+	PyObject *result;
+	int status = write_Geometry(writer, reader, 1);
+	PyBuffer_Release(buffer);
+	if (status < 0) {
+		PyMem_Free(writer->data);
+		return NULL;
+	}
+	result = PyUnicode_DecodeASCII(writer->data, writer->length, NULL);
+	PyMem_Free(writer->data);
+	if (result == NULL) {
+		return NULL;
+	}
+	return Py_BuildValue("Nn", result, reader->offset);
+}
+
+static PyObject *parse_wkt(PyObject *Py_UNUSED(module), PyObject *args) {
+	Py_buffer buffer;
+	Reader reader;
+	Writer writer = {NULL, 0, 0, -1, 0};
+	unsigned int dimension_mask;
+	Py_ssize_t max_depth, max_elements;
+	if (!PyArg_ParseTuple(args, "y*Inn", &buffer, &dimension_mask, &max_depth, &max_elements)) {
+		return NULL;
+	}
+	open_Reader(&reader, &buffer, dimension_mask, max_depth, max_elements);
+	return write_TopGeometry(&buffer, &reader, &writer, wkt_Geometry);
+}
+
+static PyObject *parse_geojson_str(PyObject *Py_UNUSED(module), PyObject *args) {
+	Py_buffer buffer;
+	Reader reader;
+	Writer writer = {NULL, 0, 0, -1, 0};
+	unsigned int dimension_mask;
+	Py_ssize_t max_depth, max_elements;
+	if (!PyArg_ParseTuple(args, "y*Innip", &buffer, &dimension_mask, &max_depth, &max_elements, &writer.precision, &writer.trim)) {
+		return NULL;
+	}
+	open_Reader(&reader, &buffer, dimension_mask, max_depth, max_elements);
+	return write_TopGeometry(&buffer, &reader, &writer, geojson_text_Geometry);
+}
+
+static PyMethodDef SpeedupsMethods[] = {
+	{"parse_geojson", parse_geojson, METH_VARARGS, "parse_geojson(wkb, dimension_mask, max_depth, max_elements) -> (geojson, offset)"},
+	{"parse_wkt", parse_wkt, METH_VARARGS, "parse_wkt(wkb, dimension_mask, max_depth, max_elements) -> (wkt, offset)"},
+	{"parse_geojson_str", parse_geojson_str, METH_VARARGS, "parse_geojson_str(wkb, dimension_mask, max_depth, max_elements, precision, trim) -> (geojson text, offset)"},
+	{NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef SpeedupsModule = {
+	PyModuleDef_HEAD_INIT,
+	"parse_wkb._speedups",
+	"Optional compiled core for parse_wkb",
+	-1,
+	SpeedupsMethods,
+	NULL,
+	NULL,
+	NULL,
+	NULL,
+};
+
+PyMODINIT_FUNC PyInit__speedups(void) {
+	PyObject *module = PyModule_Create(&SpeedupsModule);
+	if (module == NULL) {
+		return NULL;
+	}
+	DecodeError = PyErr_NewException("parse_wkb._speedups.DecodeError", NULL, NULL);
+	if (DecodeError == NULL || PyModule_AddObject(module, "DecodeError", DecodeError) < 0) {
+		Py_XDECREF(DecodeError);
+		Py_DECREF(module);
+		return NULL;
+	}
+	Py_INCREF(DecodeError);
+	TypeKey = PyUnicode_InternFromString("type");
+	CoordinatesKey = PyUnicode_InternFromString("coordinates");
+	GeometriesKey = PyUnicode_InternFromString("geometries");
+	if (TypeKey == NULL || CoordinatesKey == NULL || GeometriesKey == NULL) {
+		Py_DECREF(module);
+		return NULL;
+	}
+	for (int type_units = 1; type_units < 8; type_units++) {
+		GeoJSONTypeValues[type_units] = PyUnicode_InternFromString(GeoJSONTypeNames[type_units]);
+		if (GeoJSONTypeValues[type_units] == NULL) {
+			Py_DECREF(module);
+			return NULL;
+		}
+	}
+	return module;
+}
@@ -0,0 +1,82 @@
+import warnings
+
+import pytest
+import shapely
+from parse_wkb import (
+    get_backend,
+    set_backend,
+    wkb_to_geojson,
+    wkb_to_geojson_many,
+    wkb_to_geojson_str,
+    wkb_to_geojson_str_many,
+    wkb_to_wkt,
+    wkb_to_wkt_many,
+)
+from parse_wkb._impl import speedups
+
+backends = ["python", pytest.param("c", marks=pytest.mark.skipif(speedups.available is None, reason="parse_wkb._speedups is not built"))]
+
+wkts = [
+    "POINT (1 2)",
+    "POINT EMPTY",
+    "LINESTRING Z (0 0 1, 1 1 2, 2 3 4)",
+    "POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))",
+    "MULTIPOINT (1 2, -3 4)",
+    "MULTILINESTRING ((0 0, 1e300 2), (4 -4, 5 6))",
+    "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5)))",
+    "GEOMETRYCOLLECTION (POINT (4 6), GEOMETRYCOLLECTION (LINESTRING (-4 6, 7 10)))",
+    "GEOMETRYCOLLECTION EMPTY",
+]
+
+
+def conformance_inputs():
+    for wkt in wkts:
+        shape = shapely.from_wkt(wkt)
+        for byte_order in (0, 1):
+            wkb = shapely.to_wkb(shape, byte_order=byte_order)
+            yield wkb
+            yield wkb + b"\x00\x00"
+            yield wkb[:len(wkb) // 2]
+        yield shapely.to_wkb(shapely.set_srid(shape, 4326), include_srid=True)
+    yield b"\x07\x01\x00\x00\x00"
+    yield b"\x01\x09\x00\x00\x00"
+
+
+def outcome(function, wkb):
+    # the result or exception of function(wkb), with any warnings, in a form which compares NaN equal to NaN
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            result = ("result", repr(function(wkb)))
+        except Exception as error:
+            result = ("error", type(error), str(error))
+    return result, [str(warning.message) for warning in caught]
+
+
+@pytest.fixture
+def backend(request):
+    previous = get_backend()
+    set_backend(request.param)
+    yield request.param
+    set_backend(previous)
+
+
+@pytest.mark.parametrize("backend", backends, indirect=True)
+@pytest.mark.parametrize("function", [
+    wkb_to_geojson,
+    wkb_to_wkt,
+    lambda wkb: list(wkb_to_geojson_many([wkb], errors=[])),
+    lambda wkb: list(wkb_to_wkt_many([wkb])),
+    wkb_to_geojson_str,
+    lambda wkb: wkb_to_geojson_str(wkb, precision=3, trim=True),
+    lambda wkb: list(wkb_to_geojson_str_many([wkb], errors=[])),
+])
+def test_conformance(backend, function):
+    results = [outcome(function, wkb) for wkb in conformance_inputs()]
+    set_backend("python")
+    assert results == [outcome(function, wkb) for wkb in conformance_inputs()]
+
+
+def test_unknown_backend():
+    with pytest.raises(Exception, match="Unknown backend"):
+        set_backend("fortran")
@@ -0,0 +1,78 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from parse_wkb import (
+    CacheStats,
+    DecodeCache,
+    geojson_to_wkb,
+    wkb_to_geojson,
+    wkt_to_wkb,
+)
+
+WKB = wkt_to_wkb("GEOMETRYCOLLECTION (POINT (1 2), POLYGON ((0 0, 1 0, 1 1, 0 0)))")
+
+
+def test_copies_can_be_changed():
+    cache = DecodeCache()
+    first = cache.wkb_to_geojson(WKB)
+    first["geometries"][1]["coordinates"][0][0] = 99.0
+    first["geometries"].pop()
+    assert cache.wkb_to_geojson(bytearray(WKB)) == wkb_to_geojson(WKB)
+    assert cache.stats() == CacheStats(hits=1, misses=1, evictions=0, entries=1, size=cache.stats().size)
+
+
+def test_frozen_results_are_shared_and_read_only():
+    cache = DecodeCache(results="frozen")
+    result = cache.wkb_to_geojson(WKB)
+    assert cache.wkb_to_geojson(memoryview(WKB)) is result
+    assert json.loads(json.dumps(result)) == wkb_to_geojson(WKB)
+    with pytest.raises(TypeError):
+        result["type"] = "Point"
+    with pytest.raises(TypeError):
+        result["geometries"][0]["coordinates"][0] = 5.0
+    assert cache.geojson_to_wkb(result) == WKB
+
+
+def test_options_are_part_of_the_key():
+    cache = DecodeCache()
+    assert cache.wkb_to_wkt(wkt_to_wkb("POINT (1 2)")) == "POINT (1.0 2.0)"
+    assert cache.wkb_to_wkt(wkt_to_wkb("POINT (1 2)"), precision=2) == "POINT (1.00 2.00)"
+    geojson = {"type": "Point", "coordinates": [1.0, 2.0]}
+    assert cache.geojson_to_wkb(geojson) == geojson_to_wkb(geojson)
+    assert cache.geojson_to_wkb(geojson, "extended", 4326) == geojson_to_wkb(geojson, "extended", 4326)
+    assert cache.stats().misses == 4
+    assert cache.stats().hits == 0
+
+
+def test_lru_eviction_by_size():
+    rows = [wkt_to_wkb(f"POINT ({i} {i})") for i in range(4)]
+    # each entry is charged 21 bytes of WKB and 15 bytes of text
+    cache = DecodeCache(max_bytes=3 * 36)
+    for row in rows[:3]:
+        cache.wkb_to_wkt(row)
+    cache.wkb_to_wkt(rows[0])
+    cache.wkb_to_wkt(rows[3])
+    assert cache.stats() == CacheStats(hits=1, misses=4, evictions=1, entries=3, size=3 * 36)
+    cache.wkb_to_wkt(rows[1])
+    assert cache.stats().misses == 5
+
+
+def test_errors_are_not_cached():
+    cache = DecodeCache()
+    for _ in range(2):
+        with pytest.raises(Exception):
+            cache.wkb_to_geojson(b"\x01\x09\x00\x00\x00")
+    assert len(cache) == 0
+    assert cache.stats().misses == 2
+
+
+def test_threads():
+    cache = DecodeCache(max_bytes=2000, results="frozen")
+    rows = [wkt_to_wkb(f"LINESTRING ({i} 0, 1 {i})") for i in range(50)]
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(cache.wkb_to_geojson, rows * 20))
+    assert [json.loads(json.dumps(result)) for result in results] == [wkb_to_geojson(row) for row in rows] * 20
+    stats = cache.stats()
+    assert stats.hits + stats.misses == 1000
+    assert stats.size <= 2000
@@ -0,0 +1,80 @@
+import pytest
+import shapely
+from parse_wkb import (
+    geojson_to_wkb,
+    geojson_wkb_size,
+    iter_wkb,
+    wkb_to_abstract,
+    wkb_to_geojson,
+    wkb_to_geojson_many,
+    wkb_to_wkt,
+    wkb_to_wkt_many,
+    wkt_to_geojson,
+    wkt_to_wkb,
+)
+from shapely.geometry import Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon, GeometryCollection
+
+shapes = [
+    Point(1, 2),
+    Point(1, 2, 3),
+    LineString([(0, 0, 1), (1, 1, 2), (2, 3, 4)]),
+    Polygon([(0, 0), (0, 1), (1, 1), (0, 0)], [[(0.1, 0.1), (0.1, 0.2), (0.2, 0.2), (0.1, 0.1)]]),
+    MultiPoint([(1, 2, 3), (4, 5, 6)]),
+    MultiLineString([[(0, 0), (1, 2)], [(4, 4), (5, 6)]]),
+    MultiPolygon([Polygon([(0, 0, 1), (0, 1, 1), (1, 1, 1), (0, 0, 1)])]),
+    GeometryCollection([Point(4, 6, 1), LineString([(4, 6, 1), (7, 10, 1)])]),
+]
+
+
+@pytest.mark.parametrize("shape", shapes)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_ewkb_reads_like_iso(shape, byte_order):
+    iso = shapely.to_wkb(shape, byte_order=byte_order, flavor="iso")
+    ewkb = shapely.to_wkb(shape, byte_order=byte_order, flavor="extended")
+    assert wkb_to_wkt(ewkb) == wkb_to_wkt(iso)
+    assert wkb_to_abstract(ewkb) == wkb_to_abstract(iso)
+    assert wkb_to_geojson(ewkb) == wkb_to_geojson(iso)
+    assert [len(record) for record in iter_wkb(ewkb + iso)] == [len(ewkb), len(iso)]
+
+
+@pytest.mark.parametrize("shape", shapes)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_ewkb_srid(shape, byte_order):
+    ewkb = shapely.to_wkb(shapely.set_srid(shape, 4326), byte_order=byte_order, include_srid=True)
+    iso = shapely.to_wkb(shape, byte_order=byte_order, flavor="iso")
+    assert wkb_to_wkt(ewkb) == "SRID=4326;" + wkb_to_wkt(iso)
+    assert list(wkb_to_wkt_many([ewkb, iso])) == [wkb_to_wkt(ewkb), wkb_to_wkt(iso)]
+    geojson = wkb_to_geojson(ewkb)
+    assert geojson["crs"]["properties"]["name"] == "EPSG:4326"
+    assert list(wkb_to_geojson_many([ewkb])) == [geojson]
+    assert wkb_to_abstract(ewkb)[2] == ("SRID", 4326)
+    assert len(list(iter_wkb(ewkb + ewkb))) == 2
+
+
+@pytest.mark.parametrize("shape", shapes)
+def test_geojson_to_ewkb(shape):
+    geojson = shapely.geometry.mapping(shape)
+    assert geojson_to_wkb(geojson, flavor="extended") == shapely.to_wkb(shape, flavor="extended")
+    ewkb = geojson_to_wkb(geojson, flavor="extended", srid=3857)
+    assert ewkb == shapely.to_wkb(shapely.set_srid(shape, 3857), flavor="extended", include_srid=True)
+    assert geojson_wkb_size(geojson, flavor="extended", srid=3857) == len(ewkb)
+    # the crs written by wkb_to_geojson is picked up again
+    assert geojson_to_wkb(wkb_to_geojson(ewkb), flavor="extended") == ewkb
+
+
+def test_srid_needs_extended_flavor():
+    with pytest.raises(Exception, match="flavor='extended'"):
+        geojson_to_wkb({"type": "Point", "coordinates": [1.0, 2.0]}, srid=4326)
+
+
+def test_ewkt():
+    ewkb = wkt_to_wkb("SRID=4326;POINT Z (1 2 3)", flavor="extended")
+    assert shapely.get_srid(shapely.from_wkb(ewkb)) == 4326
+    assert wkb_to_wkt(ewkb) == "SRID=4326;POINT Z (1.0 2.0 3.0)"
+    assert wkt_to_wkb("SRID=4326;POINT Z (1 2 3)") == wkt_to_wkb("POINT Z (1 2 3)")
+    assert wkt_to_geojson("SRID=4326;POINT (1 2)")["crs"]["properties"]["name"] == "EPSG:4326"
+
+
+def test_invalid_ewkb_type():
+    with pytest.raises(Exception, match="EWKB geometry type number 0x20000009 is not valid"):
+        wkb_to_wkt(bytes.fromhex("0109000020e6100000"))
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import shapely
+from parse_wkb import wkb_to_geoarrow
+
+batches = [
+    ("geoarrow.point", ["POINT (1 2)", "POINT (3 4)"]),
+    ("geoarrow.linestring", ["LINESTRING (0 0, 1 1, 2 3)", "LINESTRING (4 4, 5 6)"]),
+    ("geoarrow.polygon", ["POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))", "POLYGON ((5 5, 5 6, 6 6, 5 5))"]),
+    ("geoarrow.multipoint", ["MULTIPOINT (1 2, 3 4)", "POINT (5 6)"]),
+    ("geoarrow.multilinestring", ["MULTILINESTRING ((0 0, 1 2), (4 4, 5 6))", "LINESTRING (7 7, 8 8)"]),
+    ("geoarrow.multipolygon", ["MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5)))", "POLYGON Z ((0 0 1, 2 0 1, 2 2 1, 0 0 1))"]),
+]
+
+
+@pytest.mark.parametrize("geometry_type, wkts", batches)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_matches_shapely_ragged_array(geometry_type, wkts, byte_order):
+    shapes = shapely.force_2d(shapely.from_wkt(wkts))
+    result = wkb_to_geoarrow(shapely.to_wkb(shapes, byte_order=byte_order))
+    _, coordinates, offsets = shapely.to_ragged_array(shapes)
+    assert result.geometry_type == geometry_type
+    assert result.dimensions == "xy"
+    assert np.array_equal(np.frombuffer(result.coordinates).reshape(-1, 2), coordinates)
+    # shapely lists the offsets innermost first
+    assert [list(level) for level in result.offsets] == [list(level) for level in reversed(offsets)]
+
+
+def test_zero_copy_numpy():
+    result = wkb_to_geoarrow(shapely.to_wkb(shapely.from_wkt(["LINESTRING Z (0 0 1, 1 1 2)"])))
+    assert result.dimensions == "xyz"
+    view = np.frombuffer(result.coordinates).reshape(-1, 3)
+    result.coordinates[0] = 9.0
+    assert view[0, 0] == 9.0
+
+
+def test_ewkb_srid():
+    shape = shapely.set_srid(shapely.from_wkt("POINT (1 2)"), 4326)
+    result = wkb_to_geoarrow([shapely.to_wkb(shape, include_srid=True)])
+    assert list(result.coordinates) == [1.0, 2.0]
+
+
+@pytest.mark.parametrize("wkts, match", [
+    (["POINT (1 2)", "LINESTRING (0 0, 1 1)"], "Mixed geometry families"),
+    (["POINT (1 2)", "POINT Z (1 2 3)"], "Mixed dimensions"),
+    (["GEOMETRYCOLLECTION (POINT (1 2))"], "no GeoArrow layout"),
+])
+def test_rejects(wkts, match):
+    with pytest.raises(Exception, match=match):
+        wkb_to_geoarrow(shapely.to_wkb(shapely.from_wkt(wkts)))
@@ -0,0 +1,69 @@
+from array import array
+import sys
+
+import pytest
+from parse_wkb import (
+    geoarrow_to_wkb,
+    geoarrow_to_wkb_buffer,
+    wkb_to_geoarrow,
+    wkb_to_geojson,
+    wkb_transcode,
+    wkt_to_wkb,
+)
+
+batches = [
+    ("geoarrow.point", ["POINT (1 2)", "POINT (3 4)"]),
+    ("geoarrow.linestring", ["LINESTRING (0 0, 1 1, 2 3)", "LINESTRING EMPTY", "LINESTRING (4 4, 5 6)"]),
+    ("geoarrow.polygon", ["POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))", "POLYGON EMPTY", "POLYGON ((5 5, 5 6, 6 6, 5 5))"]),
+    ("geoarrow.multipoint", ["MULTIPOINT (1 2, 3 4)", "MULTIPOINT EMPTY", "MULTIPOINT (5 6)"]),
+    ("geoarrow.multilinestring", ["MULTILINESTRING ((0 0, 1 2), (4 4, 5 6))", "MULTILINESTRING ((7 7, 8 8))"]),
+    ("geoarrow.multipolygon", ["MULTIPOLYGON Z (((0 0 1, 1 0 1, 1 1 1, 0 0 1)), ((5 5 1, 6 5 1, 6 6 1, 5 5 1)))", "MULTIPOLYGON Z (((0 0 1, 2 0 1, 2 2 1, 0 0 1)))"]),
+]
+
+
+def native(wkb):
+    return wkb_transcode(wkb, "<" if sys.byteorder == "little" else ">")
+
+
+@pytest.mark.parametrize("geometry_type, wkts", batches)
+def test_round_trip(geometry_type, wkts):
+    wkbs = [native(wkt_to_wkb(wkt)) for wkt in wkts]
+    result = wkb_to_geoarrow(wkbs)
+    assert result.geometry_type == geometry_type
+    assert geoarrow_to_wkb(*result) == wkbs
+    buffer, offsets = geoarrow_to_wkb_buffer(*result)
+    assert offsets.typecode == "Q"
+    assert [buffer[offsets[row]:offsets[row + 1]] for row in range(len(wkbs))] == wkbs
+
+
+def test_any_buffer_and_offsets():
+    coordinates = array("d", [0, 0, 1, 0, 1, 1, 0, 0, 5, 5, 6, 5, 6, 6, 5, 5])
+    expected = geoarrow_to_wkb("geoarrow.polygon", "xy", coordinates, [array("I", [0, 1, 2]), array("I", [0, 4, 8])])
+    assert [wkb_to_geojson(wkb)["coordinates"][0][1] for wkb in expected] == [[1.0, 0.0], [6.0, 5.0]]
+    assert geoarrow_to_wkb(3, "XY", memoryview(coordinates), [[0, 1, 2], range(0, 9, 4)]) == expected
+    assert geoarrow_to_wkb(3, "xy", coordinates.tobytes(), [array("q", [0, 1, 2]), array("H", [0, 4, 8])]) == expected
+    # offsets need not start at 0
+    assert geoarrow_to_wkb("geoarrow.polygon", "xy", coordinates, [[1, 2], [0, 4, 8]]) == expected[1:]
+
+
+def test_extended_flavor():
+    [wkb] = geoarrow_to_wkb("geoarrow.linestring", "xyz", array("d", [0, 0, 1, 2, 2, 3]), [[0, 2]], flavor="extended", srid=4326)
+    assert wkb_to_geojson(wkb) == {"type": "LineString", "coordinates": [[0.0, 0.0, 1.0], [2.0, 2.0, 3.0]], "crs": {"type": "name", "properties": {"name": "EPSG:4326"}}}
+    with pytest.raises(Exception):
+        geoarrow_to_wkb("geoarrow.point", "xy", array("d", [1, 2]), srid=4326)
+
+
+@pytest.mark.parametrize("arguments, match", [
+    (("geoarrow.geometrycollection", "xy", array("d"), []), "Unknown geometry type"),
+    (("geoarrow.point", "xyzmq", array("d"), []), "Unknown dimensions"),
+    (("geoarrow.linestring", "xy", array("d", [1, 2]), []), "levels of offsets"),
+    (("geoarrow.point", "xy", array("d", [1, 2, 3]), []), "whole number"),
+    (("geoarrow.linestring", "xy", array("d", [1, 2]), [[0, 2]]), "must end at most at 1"),
+    (("geoarrow.linestring", "xy", array("d", [0, 0, 1, 1, 2, 2]), [[-1, 2]]), "must start at 0 or more"),
+    (("geoarrow.linestring", "xy", array("d", [0, 0, 1, 1, 2, 2]), [[0, 3, 1]]), "level 0 must not decrease"),
+    (("geoarrow.polygon", "xy", array("d", [0, 0, 1, 1, 2, 2]), [[0, 1], [2, 0]]), "level 1 must not decrease"),
+    (("geoarrow.point", "xy", array("f", [1, 2]), []), "native doubles"),
+])
+def test_rejects(arguments, match):
+    with pytest.raises(Exception, match=match):
+        geoarrow_to_wkb(*arguments)
@@ -0,0 +1,90 @@
+import io
+import json
+
+import pytest
+from parse_wkb import (
+    geojson_to_wkb,
+    geojson_to_wkb_file,
+    geojson_to_wkb_stream,
+    iter_geojson,
+    iter_wkb,
+    wkb_to_geojson_stream,
+)
+
+features: list = [
+    {"type": "Feature", "properties": {"name": 'Zürich "quoted" {brace}', "id": 1}, "geometry": {"type": "Point", "coordinates": [1.5, -2]}},
+    {"type": "Feature", "properties": {"id": 2}, "geometry": {"type": "LineString", "coordinates": [[i, i * 0.5] for i in range(500)]}},
+    {"type": "Feature", "properties": None, "geometry": None},
+    {"type": "Feature", "properties": {"path": "c:\\dir\\"}, "geometry": {"type": "GeometryCollection", "geometries": [
+        {"type": "Point", "coordinates": [4, 6]},
+        {"type": "Polygon", "coordinates": [[[0, 0], [0, 1], [1, 1], [0, 0]]]},
+    ]}},
+]
+expected = [(feature["properties"], None if feature["geometry"] is None else geojson_to_wkb(feature["geometry"])) for feature in features]
+
+feature_collection = json.dumps({"type": "FeatureCollection", "name": "test", "bbox": [0, -2, 499, 249.5], "features": features}, indent=1, ensure_ascii=False)
+ndjson = "".join(json.dumps(feature, ensure_ascii=False) + "\n" for feature in features) + "\n"
+
+
+@pytest.mark.parametrize("framing, text", [("feature_collection", feature_collection), ("ndjson", ndjson)])
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 20])
+def test_stream(framing, text, read_size):
+    assert list(iter_geojson(io.StringIO(text), framing, read_size)) == features
+    # binary files are decoded as UTF-8, including characters split across reads
+    assert list(geojson_to_wkb_stream(io.BytesIO(text.encode()), framing, read_size=read_size)) == expected
+
+
+def test_stream_round_trip():
+    wkbs = [wkb for _, wkb in expected]
+    # the null geometry fails to read, and is written as a null geometry
+    text = b"".join(wkb_to_geojson_stream(wkbs, properties=[properties for properties, _ in expected], errors=[])).decode()
+    assert list(geojson_to_wkb_stream(io.StringIO(text))) == expected
+
+
+@pytest.mark.parametrize("text, result", [
+    ('{"type": "FeatureCollection", "features": []}', []),
+    ("{}", []),
+    ('{"features": [{"type": "Point", "coordinates": [1, 2]}], "type": "FeatureCollection"}', [(None, geojson_to_wkb({"type": "Point", "coordinates": [1, 2]}))]),
+])
+def test_stream_edge_cases(text, result):
+    assert list(geojson_to_wkb_stream(io.StringIO(text), read_size=3)) == result
+
+
+@pytest.mark.parametrize("text, message", [
+    ('{"type": "Feature", "geometry": null}', "Expected a GeoJSON FeatureCollection"),
+    ('{"type": "FeatureCollection", "features": [{"type": "Feature"', "truncated"),
+    ('{"type": "FeatureCollection", "features": [1]}', "Expected one of '{'"),
+    ('{"type": "FeatureCollection", "features": []} []', "Unexpected data"),
+    ('{"type": FeatureCollection}', "Invalid GeoJSON"),
+])
+def test_stream_invalid(text, message):
+    with pytest.raises(Exception, match=message):
+        list(geojson_to_wkb_stream(io.StringIO(text)))
+
+
+def test_stream_read_size():
+    with pytest.raises(Exception, match="read_size must be at least 1"):
+        geojson_to_wkb_stream(io.StringIO(feature_collection), read_size=0)
+
+
+def test_stream_errors():
+    text = '{"type": "Point", "coordinates": [1, 2]}\n{"type": "Point", "coordinates": [1, 2}\n{"type": "Feature", "properties": {"a": 1}, "geometry": {"type": "Spiral"}}\n'
+    errors = []
+    rows = list(geojson_to_wkb_stream(io.StringIO(text), "ndjson", errors))
+    assert rows == [(None, geojson_to_wkb({"type": "Point", "coordinates": [1, 2]})), (None, None), ({"a": 1}, None)]
+    assert [index for index, _ in errors] == [1, 2]
+
+
+@pytest.mark.parametrize("framing, text, rows", [("feature_collection", feature_collection, expected), ("ndjson", ndjson * 5, expected * 5)])
+def test_stream_parallel(framing, text, rows):
+    errors = []
+    assert list(geojson_to_wkb_stream(io.StringIO(text), framing, errors, parallel=True, max_workers=2, chunk_size=3)) == rows
+    assert errors == []
+
+
+def test_write_file():
+    out = io.BytesIO()
+    properties_out = io.StringIO()
+    assert geojson_to_wkb_file(io.StringIO(feature_collection), out, properties_out=properties_out) == len(features)
+    assert [bytes(wkb) or None for wkb in iter_wkb(out.getvalue(), "length_prefixed")] == [wkb for _, wkb in expected]
+    assert [json.loads(line) for line in properties_out.getvalue().splitlines()] == [properties for properties, _ in expected]
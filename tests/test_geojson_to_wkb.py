@@ -0,0 +1,53 @@
+import pytest
+import shapely
+from parse_wkb import geojson_to_wkb, geojson_to_wkb_into, geojson_wkb_size
+from shapely.geometry import MultiPolygon, Polygon, LineString, Point, GeometryCollection
+
+shapes = [
+    Point(1, 2),
+    LineString([(0, 0, 1), (1, 1, 2)]),
+    MultiPolygon([
+        Polygon([(0, 0), (0, 1), (1, 1), (0, 0)]),
+        Polygon([(0, 0), (0, 4), (4, 4), (0, 0)], [[(1, 1), (1, 2), (2, 2), (1, 1)], [(2, 2), (2, 3), (3, 3), (2, 2)]]),
+    ]),
+    GeometryCollection([Point(4, 6), LineString([(4, 6), (7, 10)])]),
+]
+
+
+@pytest.mark.parametrize("shape", shapes)
+def test_size_and_round_trip(shape):
+    geojson = shapely.geometry.mapping(shape)
+    wkb = geojson_to_wkb(geojson)
+    assert geojson_wkb_size(geojson) == len(wkb)
+    assert shapely.from_wkb(wkb) == shape
+
+
+def test_into_shared_buffer():
+    geojsons = [shapely.geometry.mapping(shape) for shape in shapes]
+    buffer = bytearray(3 + sum(geojson_wkb_size(geojson) for geojson in geojsons))
+    offsets = [3]
+    for geojson in geojsons:
+        offsets.append(geojson_to_wkb_into(geojson, buffer, offsets[-1]))
+    assert offsets[-1] == len(buffer)
+    for geojson, start, end in zip(geojsons, offsets, offsets[1:]):
+        assert bytes(buffer[start:end]) == geojson_to_wkb(geojson)
+
+
+def test_into_too_small():
+    with pytest.raises(Exception, match="Buffer too small"):
+        geojson_to_wkb_into({"type": "Point", "coordinates": [1, 2]}, bytearray(20))
+
+
+def test_mixed_dimensions_in_ring():
+    with pytest.raises(Exception, match="mixed number of dimensions"):
+        geojson_to_wkb({"type": "LineString", "coordinates": [[0, 0], [1, 1, 1]]})
+
+
+@pytest.mark.parametrize("coordinates", [
+    [[1, 2, 3], [4], [5, 6]],
+    [[1, 2, 3], [4, 5, 6, 7], [8, 9], [1, 2, 3]],
+])
+def test_mixed_dimensions_with_matching_total(coordinates):
+    # the total number of ordinates matches the point count, but the points do not all have the same length
+    with pytest.raises(Exception, match="mixed number of dimensions"):
+        geojson_to_wkb({"type": "LineString", "coordinates": coordinates})
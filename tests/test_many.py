@@ -0,0 +1,42 @@
+import pytest
+from parse_wkb import (
+    wkb_to_abstract,
+    wkb_to_abstract_many,
+    wkb_to_geojson,
+    wkb_to_geojson_many,
+    wkb_to_wkt,
+    wkb_to_wkt_many,
+)
+from shapely.geometry import Point, LineString, Polygon
+
+rows = [
+    Point(1, 2).wkb,
+    LineString([(0, 0), (1, 1)]).wkb,
+    Polygon([(0, 0), (0, 1), (1, 1), (0, 0)]).wkb,
+]
+
+
+@pytest.mark.parametrize("scalar, many", [
+    (wkb_to_geojson, wkb_to_geojson_many),
+    (wkb_to_wkt, wkb_to_wkt_many),
+    (wkb_to_abstract, wkb_to_abstract_many),
+])
+def test_many_matches_scalar(scalar, many):
+    result = many(iter(rows))
+    assert not isinstance(result, list)
+    assert list(result) == [scalar(row) for row in rows]
+
+
+def test_many_raises_by_default():
+    with pytest.raises(Exception, match="Invalid byte order"):
+        list(wkb_to_geojson_many([rows[0], b"\x07" + rows[0][1:]]))
+
+
+def test_many_collects_errors():
+    errors = []
+    result = list(wkb_to_wkt_many([rows[0], b"\x07" + rows[0][1:], rows[1]], errors=errors))
+    assert result[0] == wkb_to_wkt(rows[0])
+    assert result[1] is None
+    assert result[2] == wkb_to_wkt(rows[1])
+    assert [index for index, _ in errors] == [1]
+    assert "Invalid byte order" in str(errors[0][1])
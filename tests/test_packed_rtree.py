@@ -0,0 +1,123 @@
+import random
+
+import pytest
+from parse_wkb import (
+    PackedRTree,
+    wkt_to_wkb,
+)
+
+
+def random_boxes(count, seed=1):
+    r = random.Random(seed)
+    boxes = []
+    for _ in range(count):
+        x, y = r.uniform(-100, 100), r.uniform(-50, 50)
+        boxes.append((x, y, x + r.uniform(0, 5), y + r.uniform(0, 5)))
+    return boxes
+
+
+def brute_query(boxes, query):
+    return sorted(
+        index for index, box in enumerate(boxes)
+        if box is not None and not (query[2] < box[0] or query[3] < box[1] or query[0] > box[2] or query[1] > box[3])
+    )
+
+
+def box_distance(box, x, y):
+    dx = max(box[0] - x, 0, x - box[2])
+    dy = max(box[1] - y, 0, y - box[3])
+    return dx * dx + dy * dy
+
+
+@pytest.mark.parametrize("count, node_size", [(1, 16), (5, 2), (100, 4), (1000, 16), (20000, 16)])
+def test_query_matches_brute_force(count, node_size):
+    boxes = random_boxes(count)
+    tree = PackedRTree.from_bounds(boxes, node_size)
+    assert len(tree) == count
+    r = random.Random(2)
+    for _ in range(50):
+        x, y = r.uniform(-110, 110), r.uniform(-60, 60)
+        query = (x, y, x + r.uniform(0, 20), y + r.uniform(0, 20))
+        assert sorted(tree.query(query)) == brute_query(boxes, query)
+    assert sorted(tree.query(tree.bounds)) == list(range(count))
+
+
+@pytest.mark.parametrize("count", [1, 100, 5000])
+def test_nearest(count):
+    boxes = random_boxes(count)
+    tree = PackedRTree.from_bounds(boxes)
+    r = random.Random(3)
+    for _ in range(20):
+        x, y = r.uniform(-110, 110), r.uniform(-60, 60)
+        found = tree.nearest(x, y, 10)
+        assert [box_distance(boxes[index], x, y) for index in found] == sorted(box_distance(box, x, y) for box in boxes)[:10]
+        assert len(set(found)) == len(found)
+    assert tree.nearest(0, 0, 0) == []
+    near = tree.nearest(0, 0, count, max_distance=10)
+    assert sorted(near) == sorted(index for index, box in enumerate(boxes) if box_distance(box, 0, 0) <= 100)
+
+
+def test_empty_and_failed_rows_are_never_found():
+    wkbs = [
+        wkt_to_wkb("POINT (1 2)"),
+        wkt_to_wkb("POINT EMPTY"),
+        b"\x01\x02",
+        wkt_to_wkb("LINESTRING Z (0 0 5, 10 10 6)"),
+        wkt_to_wkb("GEOMETRYCOLLECTION EMPTY"),
+    ]
+    errors = []
+    tree = PackedRTree.from_wkb(wkbs, errors=errors)
+    assert [index for index, _ in errors] == [2]
+    assert len(tree) == 5
+    assert tree.bounds == (0.0, 0.0, 10.0, 10.0)
+    assert sorted(tree.query((-1e300, -1e300, 1e300, 1e300))) == [0, 3]
+    assert sorted(tree.query((1, 2, 1, 2))) == [0, 3]
+    assert tree.nearest(20, 20, 5) == [3, 0]
+    with pytest.raises(Exception):
+        PackedRTree.from_wkb([b"\x01\x02"])
+
+    nothing = PackedRTree.from_bounds([None, (float("nan"), 0, 1, 1), (2, 2, 1, 1)])
+    assert nothing.query((-1e300, -1e300, 1e300, 1e300)) == []
+    assert nothing.nearest(0, 0, 3) == []
+
+
+def test_infinite_boxes_are_empty():
+    inf = float("inf")
+    tree = PackedRTree.from_bounds([(0, 0, 1, 1), (-inf, 0, 2, 2), (0, 0, inf, 1), (3, 3, 4, 4)])
+    assert tree.bounds == (0.0, 0.0, 4.0, 4.0)
+    assert sorted(tree.query((-1e300, -1e300, 1e300, 1e300))) == [0, 3]
+    assert tree.nearest(0, 0, 4) == [0, 3]
+
+
+@pytest.mark.parametrize("count", [10, 20000])
+def test_save_and_load(tmp_path, count):
+    boxes = random_boxes(count)
+    tree = PackedRTree.from_bounds(boxes, 8)
+    data = tree.to_bytes()
+    # flatbush v3 header: magic, version << 4 | Float64Array, node_size, num_items
+    assert data[:2] == b"\xfb\x38"
+    assert int.from_bytes(data[2:4], "little") == 8
+    assert int.from_bytes(data[4:8], "little") == count
+
+    path = tmp_path / "index.flatbush"
+    tree.save(str(path))
+    for loaded in (PackedRTree.from_buffer(data), PackedRTree.load(str(path))):
+        assert len(loaded) == count
+        assert loaded.bounds == tree.bounds
+        assert loaded.to_bytes() == data
+        for query in boxes[:20]:
+            assert loaded.query(query) == tree.query(query)
+            assert loaded.nearest(query[0], query[1], 3) == tree.nearest(query[0], query[1], 3)
+
+
+@pytest.mark.parametrize("data", [b"", b"\xfa\x38\x10\x00\x01\x00\x00\x00", b"\xfb\x37\x10\x00\x01\x00\x00\x00", b"\xfb\x38\x10\x00\x01\x00\x00\x00"])
+def test_bad_buffer(data):
+    with pytest.raises(Exception):
+        PackedRTree.from_buffer(data)
+
+
+@pytest.mark.parametrize("node_size, num_items", [(0, 1), (1, 1), (16, 0)])
+def test_corrupt_header(node_size, num_items):
+    data = b"\xfb\x38" + node_size.to_bytes(2, "little") + num_items.to_bytes(4, "little") + bytes(64)
+    with pytest.raises(Exception, match="Not a flatbush index"):
+        PackedRTree.from_buffer(data)
@@ -0,0 +1,92 @@
+import multiprocessing
+import warnings
+
+import pytest
+from parse_wkb import (
+    WKBBuilder,
+    geojson_to_wkb,
+    geojson_to_wkb_many,
+    get_backend,
+    set_backend,
+    set_limits,
+    walk_wkb_many,
+    wkb_to_abstract_many,
+    wkb_to_geojson,
+    wkb_to_geojson_many,
+    wkb_to_geojson_str_many,
+    wkb_to_wkt_many,
+    wkt_to_wkb,
+)
+from shapely.geometry import Point, LineString
+
+rows = [Point(i, i).wkb if i % 2 else LineString([(0, 0), (i, 1)]).wkb for i in range(50)]
+
+
+@pytest.mark.parametrize("many", [wkb_to_geojson_many, wkb_to_wkt_many, wkb_to_abstract_many])
+def test_parallel_preserves_order(many):
+    expected = list(many(rows))
+    assert list(many(rows, parallel=True, max_workers=2, chunk_size=7)) == expected
+
+
+def test_parallel_collects_errors_with_row_index():
+    bad_rows = list(rows)
+    bad_rows[20] = b"\x07" + bad_rows[20][1:]
+    errors = []
+    result = list(wkb_to_geojson_many(bad_rows, errors=errors, parallel=True, max_workers=2, chunk_size=7))
+    assert result[20] is None
+    assert result[21] == wkb_to_geojson(rows[21])
+    assert [index for index, _ in errors] == [20]
+
+
+def test_parallel_encode():
+    geojsons = [wkb_to_geojson(row) for row in rows]
+    geojsons[3] = {"type": "Nonsense"}
+    errors = []
+    result = list(geojson_to_wkb_many(geojsons, errors=errors, parallel=True, max_workers=2, chunk_size=7))
+    assert result[3] is None
+    assert [index for index, _ in errors] == [3]
+    assert result[:3] + result[4:] == [geojson_to_wkb(item) for item in geojsons[:3] + geojsons[4:]]
+
+
+class BackendBuilder(WKBBuilder):
+    # the backend in use in the process which walks the WKB
+    def result(self):
+        return get_backend()
+
+
+class WarningBuilder(WKBBuilder):
+    def result(self):
+        warnings.warn("from a worker", RuntimeWarning)
+
+
+def test_parallel_warnings_keep_their_category():
+    with pytest.warns(RuntimeWarning, match="from a worker"):
+        assert list(walk_wkb_many(rows[:3], WarningBuilder, parallel=True, max_workers=1)) == [None] * 3
+
+
+@pytest.fixture
+def spawn():
+    # workers started with "spawn" import the package afresh, rather than inheriting the state of this process
+    previous = multiprocessing.get_start_method()
+    multiprocessing.set_start_method("spawn", force=True)
+    yield
+    multiprocessing.set_start_method(previous, force=True)
+    set_limits()
+
+
+@pytest.mark.parametrize("many", [wkb_to_geojson_many, wkb_to_wkt_many, wkb_to_geojson_str_many, wkb_to_abstract_many])
+def test_parallel_workers_use_limits(spawn, many):
+    nested = wkt_to_wkb("GEOMETRYCOLLECTION (MULTIPOINT (1 2))")
+    set_limits(max_depth=1)
+    errors = []
+    assert list(many([nested], errors=errors, parallel=True, max_workers=1)) == [None]
+    assert "nested more than 1 deep" in str(errors[0][1])
+
+
+def test_parallel_workers_use_backend(spawn):
+    previous = get_backend()
+    set_backend("python")
+    try:
+        assert list(walk_wkb_many([wkt_to_wkb("POINT (1 2)")], BackendBuilder, parallel=True, max_workers=1)) == ["python"]
+    finally:
+        set_backend(previous)
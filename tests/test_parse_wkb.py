@@ -61,3 +61,53 @@ def test_geojson_to_wkb(typ, shape):
     shape_from_wkb = shapely.from_wkb(wkb_from_geojson)
     # Assert that the original shape and the one derived from WKB are equal
     assert shape == shape_from_wkb, f"Mismatch in geometry for type {typ}"
+
+
+@pytest.mark.parametrize("typ, shape", test_data)
+def test_accepts_any_bytes_like(typ, shape):
+    wkb = shape.wkb
+    expected = wkb_to_geojson(wkb)
+    assert wkb_to_geojson(bytearray(wkb)) == expected
+    assert wkb_to_geojson(memoryview(wkb)) == expected
+    assert wkb_to_wkt(bytearray(wkb)) == wkb_to_wkt(wkb)
+    assert wkb_to_abstract(memoryview(wkb)) == wkb_to_abstract(wkb)
+
+
+def test_trailing_bytes_warn():
+    wkb = Point(1, 2).wkb + b"\x00\x00"
+    with pytest.warns(UserWarning, match="2 bytes remaining"):
+        assert wkb_to_geojson(wkb) == {"type": "Point", "coordinates": [1.0, 2.0]}
+
+
+@pytest.mark.parametrize("typ, shape", test_data)
+def test_big_endian_3d(typ, shape):
+    shape_3d = shapely.force_3d(shape, 5)
+    wkb = shapely.to_wkb(shape_3d, byte_order=0, output_dimension=3, flavor="iso")
+    assert wkb_to_abstract(wkb)[0] == "BEnd"
+    assert shape_3d.equals_exact(shapely.from_geojson(json.dumps(wkb_to_geojson(wkb))), 0)
+    assert shape_3d.equals_exact(shapely.from_wkt(wkb_to_wkt(wkb)), 0)
+
+
+def test_truncated_linestring_raises():
+    wkb = LineString([(0, 0), (1, 1), (2, 2)]).wkb
+    with pytest.raises(Exception, match="truncated"):
+        wkb_to_geojson(wkb[:-16])
+
+
+@pytest.mark.parametrize("options, expected", [
+    ({}, "LINESTRING (0.0 1.5, 2.25 -3.125)"),
+    ({"precision": 2}, "LINESTRING (0.00 1.50, 2.25 -3.12)"),
+    ({"precision": 2, "trim": True}, "LINESTRING (0 1.5, 2.25 -3.12)"),
+    ({"precision": 2, "trim": True, "cache_size": 8}, "LINESTRING (0 1.5, 2.25 -3.12)"),
+    ({"cache_size": 8}, "LINESTRING (0.0 1.5, 2.25 -3.125)"),
+])
+def test_wkb_to_wkt_precision(options, expected):
+    wkb = LineString([(0, 1.5), (2.25, -3.125)]).wkb
+    assert wkb_to_wkt(wkb, **options) == expected
+    assert wkb_to_wkt(wkb, **options) == expected
+
+
+@pytest.mark.parametrize("options", [{}, {"precision": 2}, {"precision": 2, "trim": True}])
+def test_wkb_to_wkt_cache_keeps_signed_zeros(options):
+    wkb = LineString([(0.0, -0.0), (-0.0, 0.0)]).wkb
+    assert wkb_to_wkt(wkb, cache_size=8, **options) == wkb_to_wkt(wkb, **options)
@@ -0,0 +1,95 @@
+import math
+
+import pytest
+from parse_wkb import (
+    geojson_to_twkb,
+    twkb_to_geojson,
+    twkb_to_wkb,
+    wkb_to_twkb,
+    wkb_transcode,
+    wkt_to_wkb,
+)
+
+
+@pytest.mark.parametrize("geojson, precision, expected", [
+    # examples of PostGIS ST_AsTWKB
+    ({"type": "Point", "coordinates": [1, 2]}, 0, "01000204"),
+    ({"type": "LineString", "coordinates": [[1, 1], [5, 5]]}, 0, "02000202020808"),
+    ({"type": "LineString", "coordinates": [[1.5, 2.25], [3, 4]]}, 2, "420002ac02c203ac02de02"),
+])
+def test_known_encoding(geojson, precision, expected):
+    twkb = geojson_to_twkb(geojson, precision=precision)
+    assert twkb.hex() == expected
+    assert twkb_to_geojson(twkb) == {"type": geojson["type"], "coordinates": geojson["coordinates"]}
+
+
+@pytest.mark.parametrize("wkt", [
+    "POINT (1 2)",
+    "POINT Z (1 2 3)",
+    "LINESTRING (30 10, 10 30, 40 40)",
+    "LINESTRING EMPTY",
+    "POLYGON ((0 0, 1 0, 1 1, 0 0), (0.2 0.2, 0.4 0.2, 0.4 0.4, 0.2 0.2))",
+    "POLYGON EMPTY",
+    "MULTIPOINT M (1 2 3, 4 5 6)",
+    "MULTILINESTRING ((0 0, 1 1), EMPTY, (-1000.5 2, 3 4))",
+    "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((10 10, 11 10, 11 11, 10 10)))",
+    "MULTIPOLYGON EMPTY",
+    "LINESTRING ZM (1 2 3 4, 5 6 7 8)",
+    "GEOMETRYCOLLECTION (POINT (1 2), GEOMETRYCOLLECTION EMPTY, MULTILINESTRING ((0 0, 1 1)), GEOMETRYCOLLECTION (LINESTRING (5 5, 6 6)))",
+])
+@pytest.mark.parametrize("bbox, size", [(False, False), (True, True)])
+def test_round_trip(wkt, bbox, size):
+    wkb = wkt_to_wkb(wkt)
+    twkb = wkb_to_twkb(wkb, bbox=bbox, size=size)
+    assert len(twkb) < len(wkb)
+    assert twkb_to_wkb(twkb) == wkb
+    assert twkb_to_wkb(wkb_to_twkb(wkb_transcode(wkb, ">"))) == wkb
+
+
+def test_point_empty():
+    twkb = wkb_to_twkb(wkt_to_wkb("POINT EMPTY"))
+    assert len(twkb) == 2 and twkb[0] & 15 == 1 and twkb[1] == 0x10
+    assert all(math.isnan(value) for value in twkb_to_geojson(twkb)["coordinates"])
+    with pytest.raises(Exception):
+        wkb_to_twkb(wkt_to_wkb("MULTIPOINT (EMPTY)"))
+
+
+def test_precision():
+    geojson = {"type": "LineString", "coordinates": [[115.8575123, -31.9505987, 12.3456], [115.8575999, -31.9503, 13.1]]}
+    rounded = twkb_to_geojson(geojson_to_twkb(geojson, precision=6, z_precision=1))
+    assert rounded["coordinates"] == [[115.857512, -31.950599, 12.3], [115.8576, -31.9503, 13.1]]
+    hundreds = twkb_to_geojson(geojson_to_twkb({"type": "Point", "coordinates": [12345.0, -678.0]}, precision=-2))
+    assert hundreds["coordinates"] == [12300.0, -700.0]
+    for precision in (-9, 8):
+        with pytest.raises(Exception):
+            geojson_to_twkb(geojson, precision=precision)
+    with pytest.raises(Exception):
+        geojson_to_twkb(geojson, z_precision=8)
+    with pytest.raises(Exception):
+        geojson_to_twkb({"type": "Point", "coordinates": [math.inf, 0]})
+
+
+def test_bbox_and_size_headers():
+    wkb = wkt_to_wkb("LINESTRING (1 2, 5 -3)")
+    plain = wkb_to_twkb(wkb, precision=0)
+    with_headers = wkb_to_twkb(wkb, precision=0, bbox=True, size=True)
+    # metadata: bbox and size flags, size of the rest, then xmin, xmax - xmin, ymin, ymax - ymin as zigzag varints
+    assert with_headers[1] == 0b11
+    assert with_headers[2] == len(with_headers) - 3
+    assert with_headers[3:7] == bytes((2, 8, 5, 10))
+    assert with_headers[7:] == plain[2:]
+
+
+def test_idlist_is_skipped():
+    # MULTIPOINT (1 2, 3 4) with precision 0 and an idlist of (7, 9)
+    twkb = bytes((4, 4, 2, 14, 18, 2, 4, 4, 4))
+    assert twkb_to_geojson(twkb) == {"type": "MultiPoint", "coordinates": [[1.0, 2.0], [3.0, 4.0]]}
+
+
+def test_truncated():
+    twkb = wkb_to_twkb(wkt_to_wkb("GEOMETRYCOLLECTION (POLYGON ((0 0, 1000 0, 1000 1000, 0 0)), POINT (1 2))"), bbox=True, size=True)
+    for end in range(len(twkb)):
+        with pytest.raises(Exception):
+            twkb_to_wkb(twkb[:end])
+    with pytest.raises(Exception):
+        twkb_to_wkb(b"\x08\x00")
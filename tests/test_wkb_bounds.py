@@ -0,0 +1,45 @@
+import math
+
+import pytest
+import shapely
+from parse_wkb import wkb_bounds, wkb_bounds_many, wkt_to_wkb
+
+wkts = [
+    "POINT (1 2)",
+    "LINESTRING (0 0, 1 1, 2 3)",
+    "POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))",
+    "MULTIPOINT (1 2, -3 4)",
+    "MULTILINESTRING ((0 0, 1 2), (4 -4, 5 6))",
+    "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5)))",
+    "GEOMETRYCOLLECTION (POINT (4 6), GEOMETRYCOLLECTION (LINESTRING (-4 6, 7 10)))",
+]
+
+
+@pytest.mark.parametrize("wkt", wkts)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_matches_shapely(wkt, byte_order):
+    shape = shapely.from_wkt(wkt)
+    assert wkb_bounds(shapely.to_wkb(shape, byte_order=byte_order)) == tuple(shapely.bounds(shape))
+
+
+def test_z_and_m_ranges():
+    assert wkb_bounds(shapely.to_wkb(shapely.from_wkt("LINESTRING Z (0 0 1, 1 2 -2)"))) == (0.0, 0.0, -2.0, 1.0, 2.0, 1.0)
+    assert wkb_bounds(wkt_to_wkb("MULTIPOINT ZM (1 2 3 4, 3 4 5 6)")) == (1.0, 2.0, 3.0, 4.0, 3.0, 4.0, 5.0, 6.0)
+
+
+def test_empty():
+    assert all(math.isnan(value) for value in wkb_bounds(shapely.to_wkb(shapely.from_wkt("GEOMETRYCOLLECTION (POINT EMPTY)"))))
+
+
+def test_ewkb_srid():
+    wkb = shapely.to_wkb(shapely.set_srid(shapely.from_wkt("LINESTRING (0 0, 1 2)"), 4326), include_srid=True)
+    assert wkb_bounds(wkb) == (0.0, 0.0, 1.0, 2.0)
+
+
+def test_many():
+    rows = shapely.to_wkb(shapely.from_wkt(wkts))
+    errors = []
+    result = list(wkb_bounds_many([*rows, b"\x07"], errors=errors))
+    assert result[:-1] == [wkb_bounds(row) for row in rows]
+    assert result[-1] is None
+    assert [index for index, _ in errors] == [len(rows)]
@@ -0,0 +1,73 @@
+import pytest
+import shapely
+from parse_wkb import WKBGeometry, wkb_to_wkt, wkt_to_wkb
+
+wkts = [
+    "POINT (1 2)",
+    "LINESTRING Z (0 0 1, 1 1 2, 2 3 4)",
+    "POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))",
+    "MULTIPOINT (1 2, 3 4)",
+    "MULTILINESTRING ((0 0, 1 2), (4 4, 5 6))",
+    "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5)))",
+    "GEOMETRYCOLLECTION (POINT (4 6), GEOMETRYCOLLECTION (LINESTRING (4 6, 7 10)))",
+]
+
+
+@pytest.mark.parametrize("wkt", wkts)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_matches_shapely(wkt, byte_order):
+    shape = shapely.from_wkt(wkt)
+    wkb = shapely.to_wkb(shape, byte_order=byte_order)
+    geometry = WKBGeometry(wkb)
+    assert geometry.type == shape.geom_type
+    assert bytes(geometry) == wkb
+    assert geometry.to_wkt() == wkb_to_wkt(wkb)
+    assert [tuple(point) for point in shapely.get_coordinates(shape, include_z=shape.has_z)] == list(geometry.coordinates())
+
+
+def test_parts():
+    geometry = WKBGeometry(shapely.to_wkb(shapely.from_wkt(wkts[2])))
+    assert len(geometry) == 2
+    assert geometry[-1][1] == (0.1, 0.2)
+    assert list(geometry[0]) == [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0), (0.0, 0.0)]
+    with pytest.raises(IndexError):
+        geometry[2]
+
+
+def test_nested_offsets():
+    shape = shapely.from_wkt(wkts[6])
+    geometry = WKBGeometry(shapely.to_wkb(shape))
+    inner = geometry[1][0]
+    assert inner.type == "LineString"
+    assert inner.dimensions == "XY"
+    assert list(inner.coordinates()) == [(4.0, 6.0), (7.0, 10.0)]
+
+
+def test_many_parts():
+    # the offsets of the parts are found once and shared, so indexing and iterating stay linear in the number of parts
+    count = 50000
+    wkb = wkt_to_wkb("MULTIPOINT (" + ", ".join(f"{i} {-i}" for i in range(count)) + ")")
+    geometry = WKBGeometry(wkb)
+    assert geometry.part_offsets() is geometry.part_offsets()
+    assert len(geometry.part_offsets()) == count
+    assert [part[0] for part in geometry] == [(float(i), float(-i)) for i in range(count)]
+    assert [geometry[i][0] for i in range(0, count, 7)] == [(float(i), float(-i)) for i in range(0, count, 7)]
+    assert geometry.end == len(wkb)
+
+
+def test_ewkb_srid():
+    wkb = shapely.to_wkb(shapely.set_srid(shapely.from_wkt("LINESTRING Z (0 0 1, 1 1 2)"), 4326), include_srid=True)
+    geometry = WKBGeometry(wkb)
+    assert geometry.srid == 4326
+    assert geometry.dimensions == "XYZ"
+    assert geometry[1] == (1.0, 1.0, 2.0)
+
+
+def test_header_only():
+    # the coordinates are never read, so a truncated coordinate run is only reported once it is touched
+    wkb = shapely.to_wkb(shapely.from_wkt("LINESTRING (0 0, 1 1, 2 2)"))[:-8]
+    geometry = WKBGeometry(wkb)
+    assert geometry.type == "LineString"
+    assert len(geometry) == 3
+    with pytest.raises(Exception, match="truncated"):
+        list(geometry.coordinates())
@@ -0,0 +1,86 @@
+import json
+
+from parse_wkb import (
+    WKBBuilder,
+    collect_stats,
+    geojson_to_wkb,
+    get_backend,
+    wkb_to_geojson,
+    wkb_to_twkb,
+    wkb_to_wkt,
+    wkb_to_wkt_many,
+    walk_wkb,
+    wkt_to_wkb,
+)
+from parse_wkb._impl import wkb_walker
+from parse_wkb._impl.profile_wkb import main
+
+ROWS = [
+    wkt_to_wkb("POLYGON ((0 0, 1 0, 1 1, 0 0))"),
+    wkt_to_wkb("POLYGON ((0 0, 2 0, 2 2, 0 2, 0 0))"),
+    wkt_to_wkb("GEOMETRYCOLLECTION (POINT (1 2), MULTIPOINT (3 4, 5 6))"),
+]
+
+
+def test_counts_per_operation_and_type():
+    with collect_stats() as stats:
+        texts = list(wkb_to_wkt_many(ROWS))
+        wkb_to_geojson(ROWS[2])
+    polygons = stats.types["wkb_to_wkt", "Polygon"]
+    assert (polygons.calls, polygons.wkb_bytes, polygons.vertices, polygons.max_depth) == (2, len(ROWS[0]) + len(ROWS[1]), 9, 0)
+    assert polygons.output_bytes == len(texts[0]) + len(texts[1])
+    assert polygons.walk_seconds > 0 and polygons.build_seconds > 0
+    collection = stats.types["wkb_to_geojson", "GeometryCollection"]
+    assert (collection.calls, collection.vertices, collection.max_depth, collection.output_bytes) == (1, 3, 2, 0)
+    assert sorted(stats.types) == [("wkb_to_geojson", "GeometryCollection"), ("wkb_to_wkt", "GeometryCollection"), ("wkb_to_wkt", "Polygon")]
+    assert "wkb_to_wkt" in stats.report()
+
+
+def test_operation_of_custom_builder():
+    # the operation comes from the builder, not the name of its class
+    class WKTBuilder(WKBBuilder):
+        pass
+
+    with collect_stats() as stats:
+        walk_wkb(ROWS[0], WKTBuilder())
+    assert sorted(stats.types) == [("walk_wkb", "Polygon")]
+
+
+def test_callback_and_encoding():
+    records = []
+    geojson = {"type": "MultiPoint", "coordinates": [[1.0, 2.0], [3.0, 4.0]]}
+    with collect_stats(records.append):
+        wkb = geojson_to_wkb(geojson)
+    assert wkb == wkt_to_wkb("MULTIPOINT (1 2, 3 4)")
+    assert [record[:5] for record in records] == [("geojson_to_wkb", "MultiPoint", len(wkb), 2, 1)]
+    assert records[0].output_bytes == len(wkb)
+
+
+def test_output_of_twkb():
+    with collect_stats() as stats:
+        twkb = wkb_to_twkb(ROWS[0])
+    assert stats.types["wkb_to_twkb", "Polygon"].output_bytes == len(twkb)
+
+
+def test_hooks_are_removed():
+    backend = get_backend()
+    with collect_stats() as stats:
+        assert get_backend() == "python"
+    assert wkb_walker.profiler is None
+    assert get_backend() == backend
+    wkb_to_wkt(ROWS[0])
+    assert stats.types == {}
+
+
+def test_cli(tmp_path, capsys):
+    path = tmp_path / "rows.wkb"
+    path.write_bytes(b"".join(ROWS))
+    assert main([str(path), "--operations", "wkb_to_wkt", "geojson_to_wkb", "--json"]) == 0
+    document = json.loads(capsys.readouterr().out)
+    assert document["records"] == 3
+    assert {(row["operation"], row["geometry_type"], row["calls"]) for row in document["stats"]} == {
+        ("wkb_to_wkt", "Polygon", 2),
+        ("wkb_to_wkt", "GeometryCollection", 1),
+        ("geojson_to_wkb", "Polygon", 2),
+        ("geojson_to_wkb", "GeometryCollection", 1),
+    }
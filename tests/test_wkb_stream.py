@@ -0,0 +1,45 @@
+import io
+import mmap
+import struct
+import pytest
+from parse_wkb import iter_wkb, wkb_to_geojson, wkb_to_geojson_many
+from shapely.geometry import Point, LineString, Polygon, GeometryCollection
+
+records = [
+    Point(1, 2).wkb,
+    LineString([(i, i) for i in range(1000)]).wkb,
+    Polygon([(0, 0), (0, 1), (1, 1), (0, 0)]).wkb,
+    GeometryCollection([Point(4, 6), LineString([(4, 6), (7, 10)])]).wkb,
+]
+raw = b"".join(records)
+length_prefixed = b"".join(struct.pack("<I", len(record)) + record for record in records)
+
+
+@pytest.mark.parametrize("framing, data", [("raw", raw), ("length_prefixed", length_prefixed)])
+def test_iter_wkb_buffer(framing, data):
+    assert [bytes(record) for record in iter_wkb(data, framing)] == records
+
+
+@pytest.mark.parametrize("framing, data", [("raw", raw), ("length_prefixed", length_prefixed)])
+def test_iter_wkb_file_small_reads(framing, data):
+    # a read size much smaller than the records forces records to span several reads
+    assert list(iter_wkb(io.BytesIO(data), framing, read_size=7)) == records
+
+
+def test_iter_wkb_mmap(tmp_path):
+    path = tmp_path / "dump.wkb"
+    path.write_bytes(raw)
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert list(wkb_to_geojson_many(iter_wkb(mapped))) == [wkb_to_geojson(record) for record in records]
+
+
+@pytest.mark.parametrize("source", [raw[:-3], io.BytesIO(raw[:-3])])
+def test_iter_wkb_truncated(source):
+    with pytest.raises(Exception, match="truncated"):
+        list(iter_wkb(source))
+
+
+@pytest.mark.parametrize("read_size", [0, -1])
+def test_iter_wkb_read_size(read_size):
+    with pytest.raises(Exception, match="read_size must be at least 1"):
+        iter_wkb(io.BytesIO(raw), read_size=read_size)
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+import shapely
+from parse_wkb import (
+    wkb_to_geojson,
+    wkb_to_geojson_bytes,
+    wkb_to_geojson_str,
+    wkb_to_geojson_stream,
+)
+
+wkts = [
+    "POINT (1 2)",
+    "POINT EMPTY",
+    "LINESTRING Z (0 0 1, 1 1 2, 2 3 4)",
+    "POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))",
+    "MULTIPOINT (1 2, -3 4)",
+    "MULTILINESTRING ((0 0, 1e300 2), (4 -4, 5 6))",
+    "MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5)))",
+    "GEOMETRYCOLLECTION (POINT (4 6), GEOMETRYCOLLECTION (LINESTRING (-4 6, 7 10)))",
+    "GEOMETRYCOLLECTION EMPTY",
+]
+
+
+@pytest.mark.parametrize("wkt", wkts)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_matches_json_dumps(wkt, byte_order):
+    wkb = shapely.to_wkb(shapely.from_wkt(wkt), byte_order=byte_order)
+    assert wkb_to_geojson_str(wkb) == json.dumps(wkb_to_geojson(wkb))
+    assert wkb_to_geojson_bytes(wkb) == json.dumps(wkb_to_geojson(wkb)).encode()
+
+
+def test_ewkb_srid():
+    wkb = shapely.to_wkb(shapely.set_srid(shapely.from_wkt("POINT (1 2)"), 4326), include_srid=True)
+    assert wkb_to_geojson_str(wkb) == json.dumps(wkb_to_geojson(wkb))
+
+
+def test_precision():
+    wkb = shapely.to_wkb(shapely.from_wkt("LINESTRING (0 1.5, 2.25 -3.125)"))
+    assert wkb_to_geojson_str(wkb, precision=2) == '{"type": "LineString", "coordinates": [[0.00, 1.50], [2.25, -3.12]]}'
+    assert wkb_to_geojson_str(wkb, precision=2, trim=True) == '{"type": "LineString", "coordinates": [[0, 1.5], [2.25, -3.12]]}'
+
+
+@pytest.mark.parametrize("framing", ["feature_collection", "ndjson"])
+def test_stream(framing):
+    rows = list(shapely.to_wkb(shapely.from_wkt(wkts[:3])))
+    errors = []
+    text = b"".join(wkb_to_geojson_stream(rows + [b"\x07"], framing, properties=[{"id": 0}, {"id": 1}, {"id": 2}, None], errors=errors))
+    if framing == "feature_collection":
+        features = json.loads(text)["features"]
+    else:
+        features = [json.loads(line) for line in text.splitlines()]
+    assert [feature["properties"] for feature in features] == [{"id": 0}, {"id": 1}, {"id": 2}, None]
+    assert json.dumps(features[2]["geometry"]) == json.dumps(wkb_to_geojson(rows[2]))
+    assert features[3]["geometry"] is None
+    assert [index for index, _ in errors] == [3]
+
+
+@pytest.mark.parametrize("properties, shorter", [([{"id": 0}], "properties"), ([{"id": 0}, {"id": 1}, {"id": 2}], "WKB blobs")])
+def test_stream_properties_length_mismatch(properties, shorter):
+    rows = [shapely.to_wkb(shapely.from_wkt(wkt)) for wkt in wkts[:2]]
+    with pytest.raises(Exception, match=f"The {shorter} end after"):
+        b"".join(wkb_to_geojson_stream(rows, properties=properties))
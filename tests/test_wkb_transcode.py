@@ -0,0 +1,47 @@
+import pytest
+import shapely
+from parse_wkb import wkb_transcode
+from shapely.geometry import Point, LineString, Polygon, MultiPoint, GeometryCollection
+
+shapes = [
+    Point(1, 2, 3),
+    LineString([(0, 0, 1), (1, 1, 2), (2, 3, 4)]),
+    Polygon([(0, 0, 1), (0, 1, 1), (1, 1, 1), (0, 0, 1)], [[(0.1, 0.1, 0), (0.1, 0.2, 0), (0.2, 0.2, 0), (0.1, 0.1, 0)]]),
+    MultiPoint([(1, 2, 3), (4, 5, 6)]),
+    GeometryCollection([Point(4, 6, 1), LineString([(4, 6, 1), (7, 10, 1)])]),
+]
+
+
+@pytest.mark.parametrize("shape", shapes)
+def test_byte_order(shape):
+    big = shapely.to_wkb(shape, byte_order=0, flavor="iso")
+    little = shapely.to_wkb(shape, byte_order=1, flavor="iso")
+    assert wkb_transcode(big, "<") == little
+    assert wkb_transcode(little, ">") == big
+    assert wkb_transcode(little, "<") == little
+
+
+@pytest.mark.parametrize("shape", shapes)
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_force_2d(shape, byte_order):
+    wkb = shapely.to_wkb(shape, byte_order=byte_order, flavor="iso")
+    assert wkb_transcode(wkb, dimensions=2) == shapely.to_wkb(shape, output_dimension=2, flavor="iso")
+
+
+@pytest.mark.parametrize("shape", shapes)
+def test_force_3d(shape):
+    shape_2d = shapely.force_2d(shape)
+    assert wkb_transcode(shape_2d.wkb, dimensions=3) == shapely.to_wkb(shapely.force_3d(shape_2d, 0), flavor="iso")
+
+
+@pytest.mark.parametrize("shape", shapes)
+def test_ewkb(shape):
+    ewkb = shapely.to_wkb(shapely.set_srid(shape, 4326), byte_order=0, include_srid=True)
+    assert wkb_transcode(ewkb) == shapely.to_wkb(shape, flavor="iso")
+    assert wkb_transcode(ewkb, "<", flavor="extended") == shapely.to_wkb(shapely.set_srid(shape, 4326), byte_order=1, include_srid=True)
+    assert wkb_transcode(ewkb, "<", dimensions=2, flavor="extended") == shapely.to_wkb(shapely.set_srid(shape, 4326), output_dimension=2, include_srid=True)
+
+
+def test_force_xym_to_xyz():
+    xym = b"\x01\xd1\x07\x00\x00" + shapely.to_wkb(Point(1, 2, 3))[5:]  # POINT M (1 2 3)
+    assert wkb_transcode(xym, dimensions=3) == shapely.to_wkb(Point(1, 2, 0), flavor="iso")
@@ -0,0 +1,79 @@
+import zlib
+
+import pytest
+from parse_wkb import (
+    wkb_transcode,
+    wkb_validate,
+    wkb_validate_many,
+    wkt_to_wkb,
+)
+
+
+@pytest.mark.parametrize("wkt, tree, vertex_count", [
+    ("POINT (1 2)", ("Point", "XY", []), 1),
+    ("POINT EMPTY", ("Point", "XY", []), 0),
+    ("LINESTRING Z (0 0 0, 1 1 1)", ("LineString", "XYZ", []), 2),
+    ("POLYGON ((0 0, 1 0, 1 1, 0 0), (0.2 0.2, 0.4 0.2, 0.4 0.4, 0.2 0.2))", ("Polygon", "XY", []), 8),
+    ("MULTIPOINT (1 2, 3 4)", ("MultiPoint", "XY", [("Point", "XY", []), ("Point", "XY", [])]), 2),
+    ("GEOMETRYCOLLECTION (LINESTRING (0 0, 1 1), GEOMETRYCOLLECTION EMPTY)", ("GeometryCollection", "XY", [("LineString", "XY", []), ("GeometryCollection", "XY", [])]), 2),
+])
+def test_valid(wkt, tree, vertex_count):
+    for wkb in (wkt_to_wkb(wkt), wkb_transcode(wkt_to_wkb(wkt), ">")):
+        result = wkb_validate(wkb)
+        assert result.valid
+        assert result.problems == []
+        assert result.size == len(wkb)
+        assert result.tree == tree
+        assert result.vertex_count == vertex_count
+        assert result.checksum == zlib.crc32(wkb)
+        assert wkb_validate(wkb, tree=False).tree is None
+
+
+def test_every_truncation_is_reported():
+    wkb = wkt_to_wkb("GEOMETRYCOLLECTION (POINT (1 2), MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0))), LINESTRING (4 6, 7 10))")
+    for end in range(len(wkb)):
+        result = wkb_validate(wkb[:end])
+        assert not result.valid
+        assert [problem.code for problem in result.problems] == ["truncated"]
+        assert result.size <= end
+
+
+@pytest.mark.parametrize("wkb, code, offset", [
+    (b"\x02\x01\x00\x00\x00", "byte_order", 0),
+    (b"\x01\x09\x00\x00\x00", "geometry_type", 1),
+    (b"\x01\x07\x00\x00\x00\xff\xff\xff\x7f", "truncated", 9),
+    (wkt_to_wkb("POLYGON ((0 0, 1 0, 1 1))"), "unclosed_ring", 9),
+    (b"\x01\x04\x00\x00\x00\x01\x00\x00\x00" + wkt_to_wkb("LINESTRING (0 0, 1 1)"), "member_type", 9),
+    (b"\x01\x07\x00\x00\x00\x01\x00\x00\x00" + wkt_to_wkb("POINT Z (0 0 0)"), "member_dimensions", 9),
+    (b"\x01\xef\x03\x00\x00\x01\x00\x00\x00" + wkt_to_wkb("POINT ZM (0 0 0 0)"), "member_dimensions", 9),
+    (b"\x01\xec\x03\x00\x00\x01\x00\x00\x00" + wkt_to_wkb("POINT (0 0)"), "member_dimensions", 9),
+    (wkt_to_wkb("POINT (1 2)") + b"\x00", "trailing_bytes", 21),
+])
+def test_problem(wkb, code, offset):
+    result = wkb_validate(wkb)
+    assert not result.valid
+    assert [(problem.code, problem.offset) for problem in result.problems] == [(code, offset)]
+
+
+def test_collection_members_with_fewer_dimensions():
+    # a GeometryCollection has the union of the dimensions of its members, so an XYM and an XYZ member fit in an XYZM one
+    wkb = b"\x01\xbf\x0b\x00\x00\x02\x00\x00\x00" + wkt_to_wkb("POINT M (1 2 3)") + wkt_to_wkb("LINESTRING Z (0 0 0, 1 1 1)")
+    result = wkb_validate(wkb)
+    assert result.valid
+    assert result.tree == ("GeometryCollection", "XYZM", [("Point", "XYM", []), ("LineString", "XYZ", [])])
+
+
+def test_too_deep():
+    wkb = b"\x01\x07\x00\x00\x00\x01\x00\x00\x00" * 3 + wkt_to_wkb("POINT (1 2)")
+    assert wkb_validate(wkb).valid
+    assert [problem.code for problem in wkb_validate(wkb, max_depth=2).problems] == ["too_deep"]
+
+
+def test_wkb_validate_many():
+    rows = [wkt_to_wkb("POINT (1 2)"), b"\x07", None]
+    errors = []
+    results = list(wkb_validate_many(rows, errors=errors))
+    assert results[0].valid
+    assert results[1].problems[0].code == "truncated"
+    assert results[2] is None
+    assert [index for index, error in errors] == [2]
@@ -0,0 +1,142 @@
+import pytest
+from parse_wkb import (
+    WKBBuilder,
+    get_backend,
+    get_limits,
+    set_backend,
+    set_limits,
+    walk_wkb,
+    walk_wkb_many,
+    wkb_to_abstract,
+    wkb_to_geojson,
+    wkb_to_geojson_str,
+    wkb_to_wkt,
+    wkb_transcode,
+    wkt_to_wkb,
+)
+
+
+class VertexCounter(WKBBuilder):
+    # counts the vertices of each type of geometry, and the depth of the deepest collection
+    def __init__(self):
+        self.counts = {}
+        self.depth = 0
+        self.max_depth = 0
+
+    def geometry(self, type_key, dimension_key, byte_order, srid, runs):
+        dimension_count = (2, 3, 3, 4)[dimension_key]
+        self.counts[type_key] = self.counts.get(type_key, 0) + sum(len(run) for run in runs) // dimension_count
+
+    def begin_collection(self, type_key, dimension_key, byte_order, srid, count):
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def end_collection(self):
+        self.depth -= 1
+
+    def result(self):
+        return self.counts, self.max_depth
+
+
+def test_custom_builder():
+    wkb = wkt_to_wkb("GEOMETRYCOLLECTION (POINT (4 6), MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5))), LINESTRING (4 6, 7 10))")
+    assert walk_wkb(wkb, VertexCounter()) == ({1: 1, 3: 8, 2: 2}, 2)
+    assert walk_wkb(wkb_transcode(wkb, ">", dimensions=4), VertexCounter()) == ({1: 1, 3: 8, 2: 2}, 2)
+
+
+def test_builder_receives_header():
+    calls = []
+
+    class Recorder(WKBBuilder):
+        def geometry(self, type_key, dimension_key, byte_order, srid, runs):
+            calls.append((type_key, dimension_key, byte_order, srid, [list(run) for run in runs]))
+
+    walk_wkb(wkt_to_wkb("SRID=4326;POINT M (1 2 3)", flavor="extended"), Recorder())
+    walk_wkb(wkb_transcode(wkt_to_wkb("POLYGON ((0 0, 0 1, 1 1, 0 0))"), ">"), Recorder())
+    assert calls == [
+        (1, 2, "<", 4326, [[1.0, 2.0, 3.0]]),
+        (3, 0, ">", None, [[0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0]]),
+    ]
+
+
+def test_walk_wkb_many():
+    rows = [wkt_to_wkb("MULTIPOINT (1 2, 3 4)"), b"\x07", wkt_to_wkb("LINESTRING Z (0 0 0, 1 1 1)")]
+    errors = []
+    assert list(walk_wkb_many(rows, VertexCounter, errors=errors)) == [({1: 2}, 1), None, ({2: 2}, 0)]
+    assert [index for index, error in errors] == [1]
+
+
+@pytest.mark.parametrize("wkt, geojson", [
+    ("POINT M (1 2 3)", {"type": "Point", "coordinates": [1.0, 2.0, 3.0]}),
+    ("LINESTRING ZM (1 2 3 4, 5 6 7 8)", {"type": "LineString", "coordinates": [[1.0, 2.0, 3.0, 4.0], [5.0, 6.0, 7.0, 8.0]]}),
+])
+def test_every_reader_accepts_m(wkt, geojson):
+    wkb = wkt_to_wkb(wkt)
+    assert wkb_to_geojson(wkb) == geojson
+    assert wkb_to_geojson_str(wkb).replace(" ", "") == str(geojson).replace("'", '"').replace(" ", "")
+    assert wkt_to_wkb(wkb_to_wkt(wkb)) == wkb
+    assert wkb_to_abstract(wkb)[1][1] == "XY" + wkt.split(" ")[1]
+
+
+def nested_collection(depth):
+    # `depth` GeometryCollections each holding the next, with a Point at the bottom
+    header = b"\x01\x07\x00\x00\x00\x01\x00\x00\x00"
+    return header * depth + wkt_to_wkb("POINT (1 2)")
+
+
+@pytest.fixture(params=["python", "c"])
+def backend(request):
+    previous = get_backend()
+    try:
+        set_backend(request.param)
+    except Exception as error:
+        pytest.skip(str(error))
+    yield request.param
+    set_backend(previous)
+    set_limits()
+
+
+def test_deep_nesting(backend):
+    assert wkb_to_wkt(nested_collection(1000)) == "GEOMETRYCOLLECTION (" * 1000 + "POINT (1.0 2.0)" + ")" * 1000
+    with pytest.raises(Exception, match="nested more than 1000 deep"):
+        wkb_to_geojson(nested_collection(1001))
+    set_limits(max_depth=20000)
+    assert walk_wkb(nested_collection(20000), VertexCounter()) == ({1: 1}, 20000)
+    geojson = wkb_to_geojson(nested_collection(20000))
+    for _ in range(20000):
+        geojson = geojson["geometries"][0]
+    assert geojson == {"type": "Point", "coordinates": [1.0, 2.0]}
+
+
+def test_transcode_deep_nesting():
+    with pytest.raises(Exception, match="nested more than 1000 deep"):
+        wkb_transcode(nested_collection(1001))
+    set_limits(max_depth=20000)
+    try:
+        big_endian = wkb_transcode(nested_collection(20000), ">", flavor="extended")
+        assert wkb_transcode(big_endian, "<") == nested_collection(20000)
+        set_limits(max_depth=20000, max_elements=20000)
+        with pytest.raises(Exception, match="more than 20000 geometries"):
+            wkb_transcode(nested_collection(20000))
+    finally:
+        set_limits()
+
+
+def test_max_elements(backend):
+    wkb = wkt_to_wkb("MULTILINESTRING ((0 0, 1 1), (2 2, 3 3, 4 4))")
+    set_limits(max_elements=10)
+    assert wkb_to_wkt(wkb) == "MULTILINESTRING ((0.0 0.0, 1.0 1.0), (2.0 2.0, 3.0 3.0, 4.0 4.0))"
+    set_limits(max_elements=9)
+    assert get_limits() == (1000, 9)
+    with pytest.raises(Exception, match="more than 9 geometries, rings and points"):
+        wkb_to_wkt(wkb)
+    assert walk_wkb(wkb, VertexCounter(), max_elements=10) == ({2: 5}, 1)
+
+
+@pytest.mark.parametrize("wkb", [
+    b"\x01\x07\x00\x00\x00\xff\xff\xff\x7f",
+    b"\x01\x03\x00\x00\x00\xff\xff\xff\x7f\x00\x00\x00\x00",
+])
+def test_huge_count_rejected_before_reading(backend, wkb):
+    with pytest.raises(Exception, match="WKB data truncated"):
+        wkb_to_geojson(wkb)
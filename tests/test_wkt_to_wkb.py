@@ -0,0 +1,80 @@
+import re
+import pytest
+import shapely
+from parse_wkb import wkb_to_geojson, wkb_to_wkt, wkb_validate, wkt_to_geojson, wkt_to_wkb
+
+wkts = [
+    "POINT (1 2)",
+    "POINT Z (1 2 3)",
+    "POINT M (1 2 3)",
+    "POINT ZM (1 2 3 4)",
+    "LINESTRING (1 2, 3 4)",
+    "POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))",
+    "MULTIPOINT ((1 2), (3 4))",
+    "MULTILINESTRING Z ((1 2 0, 3 4 0), (5 6 0, 7 8 0))",
+    "MULTIPOLYGON (((0 0, 0 1, 1 1, 0 0)), ((0 0, 0 1, 1 1, 0 0), (0 0, 0 1, 1 1, 0 0)))",
+    "GEOMETRYCOLLECTION (POINT (4 6), LINESTRING (4 6, 7 10), GEOMETRYCOLLECTION (POINT (1 1)))",
+    "LINESTRING EMPTY",
+    "MULTIPOINT (EMPTY, (1 2 3))",
+    "GEOMETRYCOLLECTION (POINT M (1 2 3), POINT Z (1 2 3))",
+    "GEOMETRYCOLLECTION (POINT Z (1 2 3), POINT (1 2))",
+    "GEOMETRYCOLLECTION (POINT (1 2), LINESTRING Z (1 2 3, 4 5 6), POINT (3 4))",
+]
+
+
+@pytest.mark.parametrize("wkt", wkts)
+def test_wkt_to_wkb_matches_shapely(wkt):
+    assert wkt_to_wkb(wkt) == shapely.to_wkb(shapely.from_wkt(wkt), flavor="iso", output_dimension=4)
+
+
+@pytest.mark.parametrize("wkt", wkts)
+def test_round_trip_through_wkb_to_wkt(wkt):
+    wkb = wkt_to_wkb(wkt)
+    assert wkt_to_wkb(wkb_to_wkt(wkb)) == wkb
+
+
+def test_wkt_to_geojson():
+    wkt = "MULTIPOINT (10 40, 40 30)"
+    assert wkt_to_geojson(wkt) == wkb_to_geojson(wkt_to_wkb(wkt)) == {"type": "MultiPoint", "coordinates": [[10.0, 40.0], [40.0, 30.0]]}
+
+
+@pytest.mark.parametrize("wkt, message", [
+    ("POINT (1 2", "Missing ')'"),
+    ("LINESTRING (1 2, 3)", "do not all have 2 values"),
+    ("POINT Z (1 2)", "do not all have 3 values"),
+    ("FOO (1 2)", "Unknown WKT geometry type"),
+    ("POINT (1 2) POINT (3 4)", "Unexpected text after"),
+])
+def test_invalid_wkt(wkt, message):
+    with pytest.raises(Exception, match=re.escape(message)):
+        wkt_to_wkb(wkt)
+
+
+@pytest.mark.parametrize("wkt, expected", [
+    ("GEOMETRYCOLLECTION (POINT M (1 2 3))", "GEOMETRYCOLLECTION M (POINT M (1.0 2.0 3.0))"),
+    ("GEOMETRYCOLLECTION (POINT M (1 2 3), LINESTRING (4 5 6, 7 8 9))", "GEOMETRYCOLLECTION ZM (POINT M (1.0 2.0 3.0), LINESTRING Z (4.0 5.0 6.0, 7.0 8.0 9.0))"),
+    ("GEOMETRYCOLLECTION (MULTIPOINT ZM (1 2 3 4), POINT (5 6 7 8))", "GEOMETRYCOLLECTION ZM (MULTIPOINT ZM (1.0 2.0 3.0 4.0), POINT ZM (5.0 6.0 7.0 8.0))"),
+    ("GEOMETRYCOLLECTION (POINT (1 2 3))", "GEOMETRYCOLLECTION Z (POINT Z (1.0 2.0 3.0))"),
+    ("GEOMETRYCOLLECTION (POINT Z (1 2 3), POINT (1 2))", "GEOMETRYCOLLECTION Z (POINT Z (1.0 2.0 3.0), POINT (1.0 2.0))"),
+    ("GEOMETRYCOLLECTION M (POINT (1 2 3), POINT (1 2))", "GEOMETRYCOLLECTION M (POINT M (1.0 2.0 3.0), POINT (1.0 2.0))"),
+    ("GEOMETRYCOLLECTION (POINT EMPTY, POINT M (1 2 3))", "GEOMETRYCOLLECTION M (POINT (nan nan), POINT M (1.0 2.0 3.0))"),
+])
+def test_collection_has_the_dimensions_of_its_members(wkt, expected):
+    # each member of an untagged GEOMETRYCOLLECTION has its own dimensions, and the collection has those of all of them
+    wkb = wkt_to_wkb(wkt)
+    assert wkb_to_wkt(wkb) == expected
+    assert wkt_to_wkb(expected) == wkb
+    assert wkt_to_wkb(wkt, flavor="extended") == wkt_to_wkb(expected, flavor="extended")
+    assert wkb_validate(wkb).valid
+
+
+@pytest.mark.parametrize("wkt, expected", [
+    ("MULTIPOINT (EMPTY, (1 2 3))", "MULTIPOINT Z (nan nan nan, 1.0 2.0 3.0)"),
+    ("MULTIPOINT (EMPTY, EMPTY, (1 2 3 4))", "MULTIPOINT ZM (nan nan nan nan, nan nan nan nan, 1.0 2.0 3.0 4.0)"),
+    ("MULTILINESTRING (EMPTY, (), (1 2 3, 4 5 6))", "MULTILINESTRING Z ((), (), (1.0 2.0 3.0, 4.0 5.0 6.0))"),
+    ("MULTIPOLYGON (EMPTY, ((0 0 0, 1 0 0, 1 1 0, 0 0 0)))", "MULTIPOLYGON Z ((), ((0.0 0.0 0.0, 1.0 0.0 0.0, 1.0 1.0 0.0, 0.0 0.0 0.0)))"),
+])
+def test_empty_members_take_the_dimensions_of_later_ones(wkt, expected):
+    wkb = wkt_to_wkb(wkt)
+    assert wkb_to_wkt(wkb) == expected
+    assert wkb_validate(wkb).valid